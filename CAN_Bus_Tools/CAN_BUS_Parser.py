@@ -3,43 +3,178 @@
 # Main file for the CAN BUS Parser
 
 
+import time
+# Start of the imports, for the startup report
+STARTUP_START = time.perf_counter()
+
 import sys
 import os
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 from krv_logger.krv_logger import KRV_Logger
-import time
 import asyncio
 import threading
+import argparse
+import multiprocessing
+import signal
 
-from mobil_eye_structures import Process_Mobil_Eye_CAN_Data, Obstacle_Data_List
+import numpy as np
 
-# Importing the Data Visualizer
-from MobilEye_DataVisualizer import MobilEyeVisualizer
+from mobil_eye_structures import Process_Mobil_Eye_CAN_Data, LANE_DTYPE, OBSTACLE_DTYPE
+from candump_log_reader import Candump_Log_Reader
+from can_capture import Capture_Writer
+from can_bus_metrics import CAN_Bus_Metrics, add_metrics_route, serve_metrics
+from mobil_eye_publisher import Snapshot_Publisher
+from mobil_eye_shared_ring import Shared_Snapshot_Ring, has_ordered_stores
+
+# The Data Visualizer (Dash, Plotly) is imported by start_visualizer_thread, never in --headless mode
 
 # Importing CAN Related Libraries
 import can
 import cantools
 
-log_ = KRV_Logger(name="CAN_BUS_Parser", file_name="CAN_BUS_Parser.log", level="INFO")
-LOG = log_.get_logger()
+def parse_args(argv=None):
+    """Command line options, a spawned parser process receives them from its parent instead"""
+    arg_parser = argparse.ArgumentParser(description="Mobil Eye CAN BUS Parser")
+    arg_parser.add_argument('--log-file', help="Decode a candump log file instead of the vcan0 socketcan bus")
+    arg_parser.add_argument('--batch-size', type=int, default=1000, help="Maximum number of frames drained per wakeup")
+    arg_parser.add_argument('--queue-size', type=int, default=64,
+                            help="Maximum number of frame batches waiting to be decoded, the oldest is dropped when full")
+    arg_parser.add_argument('--display-rate', type=float, default=20.0, help="Rate in Hz the visualizer receives new data at")
+    arg_parser.add_argument('--parser-process', action='store_true',
+                            help="Decode in a separate process that shares the snapshot ring with the visualizer")
+    arg_parser.add_argument('--headless', action='store_true',
+                            help="Only decode, log and serve /metrics on --metrics-port, the UI stack is never imported")
+    arg_parser.add_argument('--metrics-port', type=int, default=8051,
+                            help="Port of the /metrics endpoint with --headless or of the parser process with --parser-process")
+    arg_parser.add_argument('--snapshot-capacity', type=int, default=1024, help="Number of snapshots kept in the snapshot ring")
+    arg_parser.add_argument('--log-max-mb', type=float, default=50.0,
+                            help="Start a new CAN_BUS_Parser.log at this size in MB, the old one is gzipped, 0 to disable")
+    arg_parser.add_argument('--log-rotate-hours', type=float, default=0.0,
+                            help="Also start a new CAN_BUS_Parser.log after this many hours, 0 to disable")
+    arg_parser.add_argument('--log-backups', type=int, default=20, help="Number of rotated log files kept")
+    arg_parser.add_argument('--flight-recorder', type=int, default=65536,
+                            help="Number of last frames dumped to CAN_BUS_Parser.flight_*.bin on an error or SIGUSR1, 0 to disable")
+    arg_parser.add_argument('--capture', help="Also write every received frame to this binary capture file (.cancap), "
+                            "frames the decoder drops included")
+    args = arg_parser.parse_args(argv)
+    if args.snapshot_capacity < 2:
+        arg_parser.error("--snapshot-capacity must be at least 2")
+    # The shared ring has no memory barriers, see mobil_eye_shared_ring.py
+    if args.parser_process and not has_ordered_stores():
+        arg_parser.error("--parser-process needs an x86 CPU, decode in one process instead")
+    return args
 
-LOG.info(">-*--*--*--*-  Jai Guru Dev  -*--*--*--*--*-<")
-LOG.info(f"Start time: {time.strftime('%Y-%m-%d %H:%M:%S')}")
-LOG.info("")
+# Options, logger and log of this process, set by setup_logging; nothing is created at import,
+# the parser process imports this module again and must not open the files of its parent
+args = None
+log_ = None
+LOG = None
 
-# Load the DBC File 
-database = cantools.database.load_file('dbc_files/Zendar_Private_CAN.dbc')
+def setup_logging(name="CAN_BUS_Parser", decoding=True):
+    """
+    Create the logger of this process, every process has its own files named after the logger:
+    <name>.log, and if it decodes <name>.state.jsonl and the <name>.flight_*.bin dumps
+    """
+    global log_, LOG
+    # The console and the log file are written by a background thread, never by the decoding loop
+    # Rotated logs are compressed in the background, at most --log-backups of them are kept
+    # The lane and obstacle state goes to a JSON lines file, see log_state and krv_logger.load_state_log
+    log_ = KRV_Logger(name=name, file_name=f"{name}.log", level="INFO", use_queue=True,
+                      max_bytes=int(args.log_max_mb * 2**20), rotate_interval=args.log_rotate_hours * 3600,
+                      backup_count=args.log_backups, state_file=f"{name}.state.jsonl" if decoding else None,
+                      flight_recorder=args.flight_recorder if decoding else 0)
+    LOG = log_.get_logger()
+    # The modules that run their own threads log to their module loggers
+    log_.attach_loggers('mobil_eye_publisher', 'mobil_eye_state_stream')
 
-# Create a CAN Bus Interface with timeout
-LOG.info("Creating CAN bus interface on vcan0...")
-bus = can.interface.Bus(channel='vcan0', interface='socketcan', timeout=1.0)
+    LOG.info(">-*--*--*--*-  Jai Guru Dev  -*--*--*--*--*-<")
+    LOG.info(f"Start time: {time.strftime('%Y-%m-%d %H:%M:%S')}")
+    LOG.info("")
 
-LOG.info("Waiting for CAN messages...")
-message_count = 0
+# DBC File, loaded by load_database in the process that needs it
+DBC_FILE = 'dbc_files/Zendar_Private_CAN.dbc'
+database = None
+
+def load_database():
+    """Load the DBC file once"""
+    global database
+    if database is None:
+        database = cantools.database.load_file(DBC_FILE)
+    return database
 
-# Object that will store all the obstacle data
-obstacle_data_list = Obstacle_Data_List()
-mobil_eye_parser = Process_Mobil_Eye_CAN_Data(database)
+def get_rss_mb():
+    """Resident set size of this process in MB"""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except (OSError, ValueError):
+        # Not Linux, the peak RSS is the best there is
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def log_startup(mode):
+    """Log the time since the imports started and the memory use of the process"""
+    modules = sum(1 for name in sys.modules if name.split('.')[0] in ('dash', 'plotly'))
+    LOG.info(f"Startup ({mode}): {time.perf_counter() - STARTUP_START:.2f} s, RSS {get_rss_mb():.0f} MB, "
+             f"{modules} dash/plotly modules loaded")
+
+# Parser, metrics and bus of the decoding process, see setup_parser
+mobil_eye_parser = None
+metrics = None
+bus = None
+publisher = None
+
+def setup_parser(snapshot_ring=None):
+    """Create the parser, its metrics and the CAN bus in the process that decodes"""
+    global mobil_eye_parser, metrics, bus
+    mobil_eye_parser = Process_Mobil_Eye_CAN_Data(load_database(), snapshot_capacity=args.snapshot_capacity,
+                                                  snapshot_ring=snapshot_ring)
+    
+    # Per id rates, jitter and decode times, served at http://<host>:8050/metrics
+    metrics = CAN_Bus_Metrics(mobil_eye_parser.get_message_names(), interface=None if args.log_file else 'vcan0')
+    mobil_eye_parser.metrics = metrics
+    add_log_gauges(metrics)
+    
+    # Decode errors go to the log at most every few seconds, each report is a LOG.error
+    mobil_eye_parser.logger = LOG
+    # The last frames and the decoded state are dumped on every LOG.error, `kill -USR1 <pid>` dumps them on demand
+    if log_.flight_recorder is not None:
+        mobil_eye_parser.flight_recorder = log_.flight_recorder
+        log_.flight_recorder.state = get_flight_state
+        if hasattr(signal, 'SIGUSR1'):
+            signal.signal(signal.SIGUSR1, lambda signum, frame: log_.flight_recorder.dump("SIGUSR1"))
+    
+    # Create a CAN Bus Interface with timeout, or read the frames straight from a candump log
+    if args.log_file:
+        LOG.info(f"Reading CAN messages from log file {args.log_file}...")
+        bus = Candump_Log_Reader(args.log_file)
+    else:
+        # Only the DBC ids are handled, socketcan drops every other id in the kernel
+        can_filters = mobil_eye_parser.get_can_filters()
+        LOG.info(f"Creating CAN bus interface on vcan0 with {len(can_filters)} kernel filters...")
+        bus = can.interface.Bus(channel='vcan0', interface='socketcan', timeout=1.0, can_filters=can_filters)
+    LOG.info("Waiting for CAN messages...")
+
+def add_log_gauges(metrics):
+    """Export the health of the background log writer"""
+    metrics.add_gauge('log_records_dropped_total', "Log records dropped because the log queue was full",
+                      lambda: log_.dropped_records, 'counter')
+    if log_.flight_recorder is not None:
+        metrics.add_gauge('flight_recorder_dumps_total', "Flight recorder dumps written",
+                          lambda: log_.flight_recorder.dumps, 'counter')
+        metrics.add_gauge('flight_recorder_failed_dumps_total', "Flight recorder dumps that could not be written",
+                          lambda: log_.flight_recorder.failed_dumps, 'counter')
+
+def setup_publisher(snapshot_ring):
+    """Create the publisher that hands the newest snapshot to the visualizer at display rate"""
+    global publisher
+    # The snapshots in between are coalesced
+    publisher = Snapshot_Publisher(snapshot_ring, rate_hz=args.display_rate)
+    metrics.add_gauge('published_snapshots_total', "Snapshots handed to the visualizer", lambda: publisher.published, 'counter')
+    metrics.add_gauge('coalesced_snapshots_total', "Snapshots replaced by a newer one before publishing",
+                      lambda: publisher.coalesced, 'counter')
+
+message_count = 0
 
 # Global visualizer instance
 visualizer = None
@@ -50,7 +185,17 @@ def start_visualizer_thread():
     global visualizer
     try:
         # Create and start the visualizer
-        visualizer = MobilEyeVisualizer(host='0.0.0.0', port=8050)
+        # The visualizer reads the published snapshots, it never touches the live structures
+        from MobilEye_DataVisualizer import MobilEyeVisualizer
+        visualizer = MobilEyeVisualizer(host='0.0.0.0', port=8050, publisher=publisher, replay=bool(args.log_file))
+        log_startup("visualizer")
+        add_metrics_route(visualizer.app.server, metrics)
+        metrics.add_gauge('render_cache_hits_total', "Outputs served from the render cache",
+                          lambda: visualizer.render_cache.hits, 'counter')
+        metrics.add_gauge('render_cache_misses_total', "Outputs rendered for a new data version",
+                          lambda: visualizer.render_cache.misses, 'counter')
+        metrics.add_gauge('history_lost_snapshots_total', "Snapshots overwritten before the history collected them",
+                          lambda: visualizer.history.lost_snapshots, 'counter')
         
         # Start the Dash server in the current thread
         visualizer.app.run(
@@ -63,88 +208,250 @@ def start_visualizer_thread():
     except Exception as e:
         LOG.error(f"Visualizer thread error: {e}")
 
-async def data_logger(mobil_eye_parser):
+def get_snapshot_fields(snapshot):
+    """(stream, key, fields) of the lanes and the obstacles with data, with the raw DBC values"""
+    for side in ('left_lane', 'right_lane'):
+        lane = snapshot[side]
+        if lane['last_update']:
+            yield side, None, dict(zip(LANE_DTYPE.names, lane.item()))
+    obstacles = snapshot['obstacles']
+    for slot in np.flatnonzero(obstacles['last_update'] > 0).tolist():
+        fields = dict(zip(OBSTACLE_DTYPE.names, obstacles[slot].item()))
+        fields['slot'] = slot
+        yield 'obstacle', slot, fields
+
+def log_state(snapshot):
+    """Log the lanes and the obstacles with data to the state log, unchanged ones are skipped"""
+    for stream, key, fields in get_snapshot_fields(snapshot):
+        log_.log_state(stream, fields, timestamp=fields.pop('last_update'), key=key)
+
+def get_flight_state():
+    """Lanes and obstacles being decoded, saved next to every flight recorder dump"""
+    state = {'obstacles': []}
+    for stream, key, fields in get_snapshot_fields(mobil_eye_parser.snapshot):
+        if key is None:
+            state[stream] = fields
+        else:
+            state['obstacles'].append(fields)
+    return state
+
+async def data_logger(mobil_eye_parser, frame_queue=None, reader=None):
     """Separate task for data logging"""
     while True:
         try:
-            LOG.info(f"Obstacle Data: {mobil_eye_parser.obstacle_data_list}")
-            LOG.info(f"Right Lane Data: {mobil_eye_parser.right_lane_data}")
-            LOG.info(f"Left Lane Data: {mobil_eye_parser.left_lane_data}")
+            # The snapshot the decoder assembles, this task runs on the same event loop
+            log_state(mobil_eye_parser.snapshot)
+            if frame_queue is not None:
+                # Batches waiting for the decoder, and frames dropped because it was behind
+                dropped = reader.dropped_frames if reader is not None else 0
+                LOG.info(f"Frames: {message_count}, frame queue: {frame_queue.qsize()}/{frame_queue.maxsize} batches, "
+                         f"dropped: {dropped} frames")
             await asyncio.sleep(1.0)  # Log every second
         except Exception as e:
             LOG.error(f"Data logger error: {e}")
             await asyncio.sleep(1.0)
 
-def process_can_messages():
-    """Separate thread for processing CAN messages"""
-    global visualizer
-    LOG.info("CAN message processing thread started")
+class Bus_Batch_Reader:
+    """
+    Reads the socketcan bus from the event loop straight into the bounded frame queue
+
+    A can.Notifier on the event loop takes a single recv(0) per readable event and buffers
+    without bound. This reader drains up to max_batch frames per event, one batch per wakeup,
+    and when the decoder is behind and the queue is full the oldest batch is dropped and
+    counted, so memory stays bounded and the display stays current. A capture is written
+    before the queue and keeps the dropped batches.
+    """
+
+    def __init__(self, bus, frame_queue, max_batch=1000, capture=None):
+        self.bus = bus
+        self.frame_queue = frame_queue
+        self.max_batch = max_batch
+        self.capture = capture
+        self.dropped_frames = 0
+        self._loop = asyncio.get_running_loop()
+        self._fileno = bus.fileno()
+        self._loop.add_reader(self._fileno, self.on_readable)
+
+    def on_readable(self):
+        " Drain the frames waiting on the socket into one batch"
+        recv = self.bus.recv
+        batch = []
+        while len(batch) < self.max_batch:
+            msg = recv(0)
+            if msg is None:
+                break
+            batch.append(msg)
+        if not batch:
+            return
+        if self.capture is not None:
+            # Buffered, the file is written every Capture_Writer.batch_size frames
+            self.capture.write_messages(batch)
+        if self.frame_queue.full():
+            self.dropped_frames += len(self.frame_queue.get_nowait())
+        self.frame_queue.put_nowait(batch)
+
+    def stop(self):
+        self._loop.remove_reader(self._fileno)
+
+async def read_log_batches(log_reader, frame_queue, max_batch=1000, capture=None):
+    """Feed the frames of a candump log to the decoder, None marks the end of the log"""
+    for batch in log_reader.iter_batches(max_batch):
+        if capture is not None:
+            capture.write_messages(batch)
+        await frame_queue.put(batch)
+        # Reading a log never waits, give the other tasks a turn
+        await asyncio.sleep(0)
+    await frame_queue.put(None)
+
+async def decode_batches(frame_queue):
+    """Decode the frame batches, completed frame groups are published to mobil_eye_parser.snapshot_ring"""
+    global message_count
+    LOG.info("CAN message decoding task started")
     
     while True:
-        try:
-            msg = bus.recv(timeout=1.0)
-            if msg is None:
-                LOG.warning("No message received in 1 second timeout")
-                continue
-            
-            try:
-                mobil_eye_parser.parse_mobil_eye_can_data(msg, obstacle_data_list)
-                
-                # Add data to visualizer if available
-                if visualizer:
-                    # Add lane data to visualizer - combine both lanes in single call
-                    left_lane = mobil_eye_parser.left_lane_data if hasattr(mobil_eye_parser, 'left_lane_data') and mobil_eye_parser.left_lane_data.last_update > 0 else None
-                    right_lane = mobil_eye_parser.right_lane_data if hasattr(mobil_eye_parser, 'right_lane_data') and mobil_eye_parser.right_lane_data.last_update > 0 else None
-                    
-                    if left_lane or right_lane:
-                        visualizer.add_lane_data(left_lane_data=left_lane, right_lane_data=right_lane)
-                        
-                    # Add obstacle data to visualizer
-                    if hasattr(mobil_eye_parser, 'obstacle_data_list'):
-                        visualizer.add_obstacle_data(mobil_eye_parser.obstacle_data_list)
-                        
-            except Exception as e:
-                LOG.error(f"Error decoding message: {e}")
-            
-            time.sleep(0.001)  # Small delay to prevent excessive CPU usage
-                
-        except KeyboardInterrupt:
-            LOG.info("Stopping CAN bus monitoring...")
+        batch = await frame_queue.get()
+        if batch is None:
+            LOG.info("Reached the end of the log file")
             break
+        
+        message_count += len(batch)
+        try:
+            mobil_eye_parser.parse_mobil_eye_can_messages(batch)
         except Exception as e:
-            LOG.error(f"Bus error: {e}")
-            continue
+            LOG.error(f"Error decoding message: {e}")
     
-    LOG.info("CAN message processing thread stopped")
+    LOG.info("CAN message decoding task stopped")
 
-async def main():
+async def main(visualize=True):
     global visualizer_thread
     
-    # Start visualizer in a separate thread
-    LOG.info("Starting visualizer in separate thread...")
-    visualizer_thread = threading.Thread(target=start_visualizer_thread, daemon=True)
-    visualizer_thread.start()
+    if visualize:
+        # Start visualizer in a separate thread
+        LOG.info("Starting visualizer in separate thread...")
+        visualizer_thread = threading.Thread(target=start_visualizer_thread, daemon=True)
+        visualizer_thread.start()
+        
+        # Wait a moment for visualizer to start
+        await asyncio.sleep(3)
+    
+    # Reading, decoding and logging are tasks of this event loop, the publisher has its own thread; the bounded
+    # frame queue holds a log reader back, the bus reader drops the oldest batch instead
+    frame_queue = asyncio.Queue(maxsize=args.queue_size)
     
-    # Wait a moment for visualizer to start
-    await asyncio.sleep(3)
+    capture = None
+    if args.capture:
+        # The socketcan interface, or the interface the log was recorded on
+        capture = Capture_Writer(args.capture, channel=bus.channel or 'can0')
+        LOG.info(f"Capturing the frames to {args.capture}")
+        metrics.add_gauge('captured_frames_total', "Frames written to the capture file", lambda: capture.count, 'counter')
     
-    # Start CAN processing in a separate thread
-    LOG.info("Starting CAN message processing thread...")
-    can_processor_thread = threading.Thread(target=process_can_messages, daemon=True)
-    can_processor_thread.start()
+    reader = None
+    if not args.log_file:
+        # The socket is watched from this event loop, no receive thread; the capture is written
+        # as the frames are read, before the frame queue drops any
+        reader = Bus_Batch_Reader(bus, frame_queue, args.batch_size, capture)
+        metrics.add_gauge('reader_dropped_frames_total', "Frames dropped because the frame queue was full",
+                          lambda: reader.dropped_frames, 'counter')
+    metrics.add_gauge('frame_queue_batches', "Frame batches waiting to be decoded", frame_queue.qsize)
+    
+    LOG.info("Starting CAN message processing tasks...")
+    # The decoder ends at the end of a log file, on the bus it runs until interrupted
+    pipeline = [asyncio.create_task(decode_batches(frame_queue))]
+    if args.log_file:
+        pipeline.append(asyncio.create_task(read_log_batches(bus, frame_queue, args.batch_size, capture)))
+    tasks = [asyncio.create_task(data_logger(mobil_eye_parser, frame_queue, reader))]
     
-    # Keep the main thread alive
     try:
-        while True:
-            await asyncio.sleep(1)
-    except KeyboardInterrupt:
-        LOG.info("Shutting down all threads...")
+        await asyncio.gather(*pipeline)
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        LOG.info("Shutting down all tasks...")
+    finally:
+        # The logger task never ends on its own
+        for task in pipeline + tasks:
+            task.cancel()
+        await asyncio.gather(*pipeline, *tasks, return_exceptions=True)
+        # The state decoded since the last second of the data logger, before the logger stops at exit
+        log_state(mobil_eye_parser.snapshot)
         
         # Shutdown CAN bus
+        if reader is not None:
+            reader.stop()
         bus.shutdown()
-        LOG.info("All threads stopped gracefully")
+        if capture is not None:
+            # Writes the time index, a capture cut short is still readable without it
+            capture.close()
+            LOG.info(f"Captured {capture.count} frames to {args.capture}")
+        LOG.info("All tasks stopped gracefully")
+
+def run_parser_process(snapshot_ring_name, parent_args):
+    """Entry point of the parser process, decodes into the shared snapshot ring"""
+    global args
+    args = parent_args
+    # Own log, state and flight recorder files, the parent keeps CAN_BUS_Parser.log
+    setup_logging("CAN_BUS_Parser.decoder")
+    snapshot_ring = Shared_Snapshot_Ring.attach(snapshot_ring_name)
+    setup_parser(snapshot_ring)
+    # The visualizer process has its own metrics
+    serve_metrics(metrics, port=args.metrics_port)
+    LOG.info(f"Parser process {os.getpid()} decoding into shared snapshot ring {snapshot_ring_name}")
+    log_startup("parser process")
+    try:
+        asyncio.run(main(visualize=False))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        snapshot_ring.close()
+
+def run_with_parser_process():
+    """Decode in a child process, this process only publishes and serves the visualizer"""
+    global mobil_eye_parser, metrics
+    snapshot_ring = Shared_Snapshot_Ring.create(args.snapshot_capacity, writable=False)
+    
+    # The child imports this module again instead of inheriting the Dash and logger threads
+    parser_process = multiprocessing.get_context('spawn').Process(
+        target=run_parser_process, args=(snapshot_ring.name, args), name="mobil-eye-parser", daemon=True)
+    parser_process.start()
+    LOG.info(f"Started parser process {parser_process.pid}, parser metrics at http://localhost:{args.metrics_port}/metrics")
+    
+    # The value tables of the ring come from the same DBC, nothing is decoded in this process
+    mobil_eye_parser = Process_Mobil_Eye_CAN_Data(load_database(), snapshot_ring=snapshot_ring)
+    metrics = CAN_Bus_Metrics(interface=None if args.log_file else 'vcan0')
+    add_log_gauges(metrics)
+    metrics.add_gauge('parser_process_up', "1 while the parser process is running", lambda: int(parser_process.is_alive()))
+    setup_publisher(snapshot_ring)
+    publisher.start_thread()
+    
+    # Stop the parser process and remove the shared ring on a kill as well
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        start_visualizer_thread()
+    except KeyboardInterrupt:
+        LOG.info("Shutting down the parser process...")
+    finally:
+        parser_process.terminate()
+        parser_process.join(timeout=5)
+        snapshot_ring.close()
 
-LOG.info("CAN_BUS_Parser is ending")
+def run_headless():
+    """Decode and log without the visualizer, the metrics are served by a small HTTP server"""
+    setup_parser()
+    serve_metrics(metrics, port=args.metrics_port)
+    log_startup("headless")
+    LOG.info(f"Headless mode, metrics at http://localhost:{args.metrics_port}/metrics")
+    asyncio.run(main(visualize=False))
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    args = parse_args()
+    # With --parser-process the frames are decoded, logged and recorded by the child
+    setup_logging(decoding=not args.parser_process)
+    if args.headless:
+        run_headless()
+    elif args.parser_process:
+        run_with_parser_process()
+    else:
+        setup_parser()
+        setup_publisher(mobil_eye_parser.snapshot_ring)
+        # Its subscribers share locks with the Dash thread, the decoding loop must never wait on them
+        publisher.start_thread()
+        asyncio.run(main())
+    LOG.info("CAN_BUS_Parser is ending")
\ No newline at end of file
@@ -7,58 +7,127 @@ import plotly.express as px
 from plotly.subplots import make_subplots
 import dash
 from dash import dcc, html
-from dash.dependencies import Input, Output
-from dash import callback_context
+from dash.dependencies import Input, Output, State, ClientsideFunction
+from dash import callback_context, Patch
+from mobil_eye_structures import Obstacle_Data_List
+from mobil_eye_state_stream import Live_State_Stream, add_stream_route
+from mobil_eye_render_cache import Render_Cache
+from lane_geometry import Lane_Geometry
+from mobil_eye_history import Snapshot_History, lttb_indices, LANE_HISTORY_FIELDS, OBSTACLE_HISTORY_FIELDS
+from mobil_eye_latency import Latency_Tracker, add_latency_route, LATENCY_STAGES
 import asyncio
+import base64
 import threading
 import time
 import numpy as np
 from typing import Dict, List, Optional
-from collections import deque
 import json
 from datetime import datetime
 import webbrowser
 import socket
 
+# Trace order of the lane figure, patch updates address the traces by index
+VEHICLE_TRACE, LEFT_LANE_TRACE, LEFT_BOUNDARY_TRACE, RIGHT_LANE_TRACE, RIGHT_BOUNDARY_TRACE, OBSTACLE_TRACE = range(6)
+LANE_WIDTH = 3.5
+
+
+def typed_array(values):
+    """float32 values as a base64 typed array, Plotly.js decodes it without parsing decimal text"""
+    values = np.ascontiguousarray(values, dtype='<f4')
+    return {'dtype': 'f4', 'bdata': base64.b64encode(values).decode('ascii')}
+
+
+# Rows of the history figure: (title, series, field), a lane row has a left and a right trace
+HISTORY_ROWS = (
+    ("C0 Position (m)", 'lanes', 'c0'),
+    ("C1 Heading (rad)", 'lanes', 'c1'),
+    ("C2 Curvature (1/m)", 'lanes', 'c2'),
+    ("C3 Curvature Rate (1/m2)", 'lanes', 'c3'),
+    ("Quality", 'lanes', 'quality'),
+    ("Nearest Obstacle Distance (m)", 'obstacles', 'longitudinal_distance'),
+    ("Nearest Obstacle Velocity (m/s)", 'obstacles', 'absolute_long_velocity'),
+)
+
 
 class MobilEyeVisualizer:
     """Real-time MobilEye data visualization using Plotly Dash"""
     
-    def __init__(self, host='0.0.0.0', port=8050, max_data_points=100):
+    def __init__(self, host='0.0.0.0', port=8050, snapshot_ring=None, patch_updates=True,
+                 push_updates=True, publisher=None, adaptive_lane_sampling=False, history_window=600.0,
+                 history_points=1000, history_interval=500, replay=False):
         """
         Initialize the visualizer
         
         Args:
             host: Host address (0.0.0.0 for remote access)
             port: Port number for the web server
-            max_data_points: Maximum number of data points to store
+            snapshot_ring: Snapshot_Ring written by the parser, see attach_snapshot_ring
+            patch_updates: Send the lane figure once and only the changed trace data every tick,
+                           False rebuilds and sends the whole figure every tick
+            push_updates: Push the state to every browser over the /stream SSE endpoint and the history
+                          over /history_stream, and render them client side (assets/lane_stream.js)
+                          instead of polling callbacks
+            publisher: Optional Snapshot_Publisher of the ring, the display then only changes at the
+                       publisher rate and the update interval follows it
+            adaptive_lane_sampling: Use fewer lane points on straight roads
+            history_window: Seconds of lane and obstacle history shown in the history panels
+            history_points: Maximum number of points per history trace, about the panel width in pixels
+            history_interval: Milliseconds between updates of the history panels, 10 minutes over
+                              1000 points move by about one point per 500 ms
+            replay: The frames are replayed from a log, their timestamps are not comparable to the
+                    wall clock and the decode and total latencies are not shown
         """
         self.host = host
         self.port = port
-        self.max_data_points = max_data_points
         
         # Control flags
         self.is_running = False
         self.update_interval = 50  # milliseconds - much faster updates (20 FPS)
+        if publisher is not None:
+            self.update_interval = round(1000 / publisher.rate_hz)
         
         self.enable_obstacle_detection = False  
+        self.patch_updates = patch_updates
+        self.push_updates = push_updates
 
-        # Data storage
-        self.lane_data_history = {
-            'left': deque(maxlen=max_data_points),
-            'right': deque(maxlen=max_data_points)
-        }
-        self.obstacle_data_history = deque(maxlen=max_data_points)
-        self.timestamps = deque(maxlen=max_data_points)
-        
-        # Performance optimization: Cache for plot data
-        self._plot_cache = {}
-        self._last_update_time = 0
+        # Data storage: the parser publishes immutable snapshots into the ring,
+        # every render reads a copy of the latest one, nothing is shared live
+        self.snapshot_ring = snapshot_ring if publisher is None else publisher.snapshot_ring
+        self.publisher = publisher
+        self._cleared_seq = 0  # Snapshots up to this seq were cleared by the user
+        
+        # Every output is rendered once per data version and shared by all callbacks and clients
+        self.render_cache = Render_Cache()
+        # Guards the lane patches of one data version, one per view the tabs show
+        self._lane_patch_lock = threading.Lock()
+        # Lane points memoized by their coefficients, unchanged lanes are not evaluated again
+        self.lane_geometry = Lane_Geometry(adaptive=adaptive_lane_sampling)
+        
+        # Lane and obstacle time series, collected on every publish or else before every history render
+        self.history = Snapshot_History(self.snapshot_ring, window_seconds=history_window)
+        self.history_points = history_points
+        self.history_interval = history_interval
+        if publisher is not None:
+            publisher.subscribers.append(self.history.update)
+        
+        # Latency per stage from the CAN frame to the browser paint, reported by assets/lane_stream.js
+        self.latency = Latency_Tracker(replay=replay)
         
         # Initialize Dash app
         self.app = dash.Dash(__name__)
         self.setup_dash_app()
         
+        # One producer per stream serves every open tab, started by the first client
+        self.state_stream = None
+        self.history_stream = None
+        if self.push_updates:
+            self.state_stream = Live_State_Stream(self.get_state_event, rate_hz=1000 / self.update_interval)
+            add_stream_route(self.app.server, self.state_stream)
+            # The history payload is rendered and serialized once per history version for all tabs
+            self.history_stream = Live_State_Stream(self.get_history_event, rate_hz=1000 / self.history_interval)
+            add_stream_route(self.app.server, self.history_stream, path='/history_stream')
+            add_latency_route(self.app.server, self.latency)
+        
     def setup_dash_app(self):
         """Setup the Dash application layout"""
         self.app.layout = html.Div([
@@ -78,13 +147,18 @@ class MobilEyeVisualizer:
             # Lane visualization
             html.Div([
                 html.H3("Lane Detection Visualization"),
-                dcc.Graph(id='lane-plot', style={'height': '500px'}),
+                dcc.Graph(id='lane-plot', style={'height': '500px'},
+                          figure=self.create_lane_figure() if self.patch_updates or self.push_updates else None),
                 dcc.Interval(
                     id='lane-interval',
                     interval=self.update_interval,
                     n_intervals=0,
                     disabled=True
-                )
+                ),
+                # Receives the running state for the stream client in push mode
+                dcc.Store(id='lane-stream-state'),
+                # What the lane plot of this tab shows, patches leave out the unchanged traces
+                dcc.Store(id='lane-plot-shown', data=None)
             ]),
             
             # Lane parameters
@@ -102,11 +176,29 @@ class MobilEyeVisualizer:
                 ])
             ]),
 
+            # History panels
+            html.Div([
+                html.H3("History"),
+                dcc.Graph(id='history-plot', figure=self.create_history_figure(), style={'height': '1000px'}),
+                dcc.Interval(
+                    id='history-interval',
+                    interval=self.history_interval,
+                    n_intervals=0,
+                    disabled=True
+                )
+            ]),
+
             # Data table
             html.Div([
                 html.H3("Latest Data"),
                 html.Div(id='data-table')
             ]),
+            
+            # Latency per stage, the browser stages are only known in push mode
+            html.Div([
+                html.H3("Latency"),
+                html.Div(id='latency-table')
+            ]),
             # Footer
             html.Footer([
                 html.Hr(),
@@ -129,23 +221,30 @@ class MobilEyeVisualizer:
     def setup_callbacks(self):
         """Setup Dash callbacks for interactivity"""
         
-        @self.app.callback(
-            [Output('lane-plot', 'figure'),
-             Output('left-lane-params', 'children'),
-             Output('right-lane-params', 'children')],
-            [Input('lane-interval', 'n_intervals')]
-        )
-        def update_lane_plot(n):
-            return self.create_lane_plot(), self.get_lane_params('left'), self.get_lane_params('right')
-        
-
+        if self.push_updates:
+            # The browser renders the pushed state itself, no polling callbacks.
+            # Start / Stop still toggle the interval, the stream client follows it.
+            self.app.clientside_callback(
+                ClientsideFunction(namespace='lane_stream', function_name='set_paused'),
+                Output('lane-stream-state', 'data'),
+                Input('lane-interval', 'disabled')
+            )
+        else:
+            self.setup_polling_callbacks()
         
         @self.app.callback(
-            Output('data-table', 'children'),
-            [Input('lane-interval', 'n_intervals')]
+            Output('latency-table', 'children'),
+            [Input('history-interval', 'n_intervals')]
+        )
+        def update_latency_table(n):
+            return self.create_latency_table()
+        
+        # The history panels run and pause together with the lane plot
+        self.app.clientside_callback(
+            "function(disabled) { return disabled; }",
+            Output('history-interval', 'disabled'),
+            Input('lane-interval', 'disabled')
         )
-        def update_data_table(n):
-            return self.create_data_table()
         
         @self.app.callback(
             [Output('lane-interval', 'disabled'),
@@ -180,24 +279,43 @@ class MobilEyeVisualizer:
                 return False, "Obstacle detection disabled"
             return True, "Ready to start"
     
+    def setup_polling_callbacks(self):
+        """Interval driven callbacks, every open tab requests the plot and the tables at the update rate"""
+        
+        @self.app.callback(
+            [Output('lane-plot', 'figure'),
+             Output('lane-plot-shown', 'data'),
+             Output('left-lane-params', 'children'),
+             Output('right-lane-params', 'children')],
+            [Input('lane-interval', 'n_intervals')],
+            [State('lane-plot-shown', 'data')]
+        )
+        def update_lane_plot(n, shown):
+            if self.patch_updates:
+                lane_plot, shown = self.get_lane_patch(shown)
+            else:
+                lane_plot = self.render_cached('lane_plot', self.create_lane_plot)
+            return (lane_plot, shown,
+                    self.render_cached('left_lane_params', lambda: self.get_lane_params('left')),
+                    self.render_cached('right_lane_params', lambda: self.get_lane_params('right')))
+        
+        @self.app.callback(
+            Output('data-table', 'children'),
+            [Input('lane-interval', 'n_intervals')]
+        )
+        def update_data_table(n):
+            return self.render_cached('data_table', self.create_data_table)
+        
+        @self.app.callback(
+            Output('history-plot', 'figure'),
+            [Input('history-interval', 'n_intervals')]
+        )
+        def update_history_plot(n):
+            return self.render_cache.get('history_patch', self.get_history_version, self.create_history_patch).value
+    
     def create_lane_plot(self):
         """Create the lane visualization plot with optional obstacle overlay"""
-        # Performance optimization: Check if we need to update
-        current_time = time.time()
-        if current_time - self._last_update_time < 0.005:  # Only update every 50ms max
-            if 'lane_plot' in self._plot_cache:
-                return self._plot_cache['lane_plot']
-        
-        # Check if any lane has "Very Low Quality" - if so, force update
-        force_update = False
-        if self.lane_data_history['left'] and self.is_good_quality(self.lane_data_history['left'][-1].quality):
-            force_update = True
-        if self.lane_data_history['right'] and self.is_good_quality(self.lane_data_history['right'][-1].quality):
-            force_update = True
-            
-        if force_update:
-            self._plot_cache.clear()
-            print("Force clearing cache due to Very Low Quality")
+        snapshot = self.get_latest_snapshot()
         
         fig = go.Figure()
         
@@ -213,14 +331,18 @@ class MobilEyeVisualizer:
             showlegend=True
         ))
         
+        lane_points = self.get_lane_points(snapshot)
+        
         # Plot left lane - only if good quality
-        if self.lane_data_history['left']:
-            left_data = self.lane_data_history['left'][-1]
-            print(f"Left lane quality: '{left_data.quality}' (type: {type(left_data.quality)})")
-            if self.is_good_quality(left_data.quality):
-                print(f"  -> Plotting left lane with quality: {left_data.quality}")
-                x, y = self.calculate_lane_points(left_data, 'left')
-                if x and y:
+        if snapshot is not None:
+            left_data = snapshot['left_lane']
+            left_quality = self.get_choice_name('quality', left_data['quality'])
+            print(f"Left lane quality: '{left_quality}' (raw: {left_data['quality']})")
+            if self.is_good_quality(left_data['quality']):
+                print(f"  -> Plotting left lane with quality: {left_quality}")
+                points = lane_points['left']
+                if points is not None:
+                    x, y = points.x, points.y
                     line_dict = {
                         'color': 'blue',
                         'width': 3,
@@ -229,11 +351,10 @@ class MobilEyeVisualizer:
                         x=x, y=y,
                         mode='lines',
                         line=line_dict,
-                        name=f'Left Lane ({left_data.quality})',
+                        name=f'Left Lane ({left_quality})',
                         showlegend=True
                     ))
-                    lane_width = 3.5
-                    boundary_y = [yi + lane_width/2 for yi in y]
+                    boundary_y = points.boundary
                     boundary_line_dict = {
                         'color': 'blue',
                         'width': 1,
@@ -250,13 +371,15 @@ class MobilEyeVisualizer:
                 print(f"  -> NOT plotting left lane (Very Low Quality)")
         
         # Plot right lane - only if good quality
-        if self.lane_data_history['right']:
-            right_data = self.lane_data_history['right'][-1]
-            print(f"Right lane quality: '{right_data.quality}' (type: {type(right_data.quality)})")
-            if self.is_good_quality(right_data.quality):
-                print(f"  -> Plotting right lane with quality: {right_data.quality}")
-                x, y = self.calculate_lane_points(right_data, 'right')
-                if x and y:
+        if snapshot is not None:
+            right_data = snapshot['right_lane']
+            right_quality = self.get_choice_name('quality', right_data['quality'])
+            print(f"Right lane quality: '{right_quality}' (raw: {right_data['quality']})")
+            if self.is_good_quality(right_data['quality']):
+                print(f"  -> Plotting right lane with quality: {right_quality}")
+                points = lane_points['right']
+                if points is not None:
+                    x, y = points.x, points.y
                     line_dict = {
                         'color': 'green',
                         'width': 3
@@ -265,11 +388,10 @@ class MobilEyeVisualizer:
                         x=x, y=y,
                         mode='lines',
                         line=line_dict,
-                        name=f'Right Lane ({right_data.quality})',
+                        name=f'Right Lane ({right_quality})',
                         showlegend=True
                     ))
-                    lane_width = 3.5
-                    boundary_y = [yi - lane_width/2 for yi in y]
+                    boundary_y = points.boundary
                     boundary_line_dict = {
                         'color': 'green',
                         'width': 1,
@@ -286,42 +408,10 @@ class MobilEyeVisualizer:
                 print(f"  -> NOT plotting right lane (Very Low Quality)")
         
         # OVERLAY OBSTACLES ON THE SAME PLOT (optimized)
-        if self.enable_obstacle_detection and self.obstacle_data_history:
-            obstacle_list = self.obstacle_data_history[-1]
-            
-            if obstacle_list:
-                # Extract individual obstacles from the Obstacle_Data_List
-                obstacles = [
-                    obstacle_list.object1, obstacle_list.object2, obstacle_list.object3,
-                    obstacle_list.object4, obstacle_list.object5, obstacle_list.object6,
-                    obstacle_list.object7, obstacle_list.object8, obstacle_list.object9,
-                    obstacle_list.object10
-                ]
-                
-                # Batch process obstacles for better performance
-                valid_obstacles = [obs for obs in obstacles if obs and obs.last_update > 0]
-                
-                if valid_obstacles:
-                    # Create batch scatter plot for better performance
-                    x_coords = [obs.longitudinal_distance for obs in valid_obstacles]
-                    y_coords = [obs.lateral_distance for obs in valid_obstacles]
-                    colors = ['red' if obs.object_class == 1 else 'orange' for obs in valid_obstacles]
-                    texts = [f'ID: {obs.id}<br>Class: {obs.object_class}<br>Velocity: {obs.absolute_long_velocity:.1f} m/s' 
-                            for obs in valid_obstacles]
-                    
-                    fig.add_trace(go.Scatter(
-                        x=x_coords, y=y_coords,
-                        mode='markers',
-                        marker=dict(
-                            size=15,
-                            color=colors,
-                            symbol='circle'
-                        ),
-                        text=texts,
-                        hoverinfo='text',
-                        name='Obstacles',
-                        showlegend=True
-                    ))
+        if self.enable_obstacle_detection and snapshot is not None:
+            obstacle_trace = self.create_obstacle_trace(self.get_obstacle_list(snapshot))
+            if obstacle_trace is not None:
+                fig.add_trace(obstacle_trace)
         
         # Update layout (optimized)
         fig.update_layout(
@@ -337,12 +427,224 @@ class MobilEyeVisualizer:
             dragmode=False,   # Disable drag to improve performance
         )
         
-        # Cache the result
-        self._plot_cache['lane_plot'] = fig
-        self._last_update_time = current_time
+        return fig
+    
+    def create_lane_figure(self):
+        """Lane figure with the layout and every trace, sent once and then updated with create_lane_patch"""
+        fig = go.Figure()
+        
+        # Static vehicle representation
+        fig.add_trace(go.Scatter(
+            x=[0, -1, 1, 0], y=[0, -2, -2, 0],
+            fill='toself',
+            fillcolor='blue',
+            line=dict(color='darkblue'),
+            name='Vehicle',
+            showlegend=True
+        ))
+        
+        # Lanes and boundaries share the x coordinates, only y changes per tick
+        x, _ = self.calculate_lane_points(None)
+        for name, color, width, dash_style, showlegend in (('Left Lane', 'blue', 3, None, True),
+                                                           ('Left Boundary', 'blue', 1, 'dash', False),
+                                                           ('Right Lane', 'green', 3, None, True),
+                                                           ('Right Boundary', 'green', 1, 'dash', False)):
+            fig.add_trace(go.Scatter(
+                x=x, y=[],
+                mode='lines',
+                line=dict(color=color, width=width, dash=dash_style),
+                name=name,
+                showlegend=showlegend,
+                visible=False
+            ))
+        
+        fig.add_trace(go.Scatter(
+            x=[], y=[],
+            mode='markers',
+            marker=dict(size=15, color=[], symbol='circle'),
+            text=[],
+            hoverinfo='text',
+            name='Obstacles',
+            showlegend=True,
+            visible=False
+        ))
+        
+        fig.update_layout(
+            title="Real-time Lane Detection",
+            xaxis_title="Distance Ahead (m)",
+            yaxis_title="Lateral Position (m)",
+            xaxis=dict(range=[0, 100]),
+            yaxis=dict(range=[-20, 20]),
+            height=500,
+            showlegend=True,
+            uirevision=True,
+            dragmode=False,
+        )
+        return fig
+    
+    def get_lane_plot_keys(self, snapshot):
+        """What the lane plot shows per part, a part whose key is unchanged is left out of the patch"""
+        keys = {}
+        for side in ('left', 'right'):
+            lane_data = snapshot[f'{side}_lane'] if snapshot is not None else None
+            visible = lane_data is not None and lane_data['last_update'] != 0 and self.is_good_quality(lane_data['quality'])
+            # The lane points follow from the memo key of the lane geometry
+            keys[side] = list(self.lane_geometry.memo_key(self.get_lane_coefficients(lane_data), lane_data['quality'],
+                                                          0.0)[0]) + [int(lane_data['quality'])] if visible else None
+        # Every completed obstacle group stamps its slot, the newest stamp identifies the obstacle points
+        keys['obstacles'] = (float(snapshot['obstacles']['last_update'].max())
+                             if self.enable_obstacle_detection and snapshot is not None else None)
+        keys['title'] = self.enable_obstacle_detection
+        return keys
+    
+    def get_lane_patch(self, shown):
+        """create_lane_patch of a view, rendered once per data version for every tab showing that view"""
+        # A new dict per data version, tabs showing different views do not evict each other's patch
+        patches = self.render_cache.get('lane_patches', self.get_data_version, dict).value
+        shown_key = json.dumps(shown, sort_keys=True)
+        with self._lane_patch_lock:
+            if shown_key not in patches:
+                patches[shown_key] = self.create_lane_patch(shown)
+            return patches[shown_key]
+    
+    def create_lane_patch(self, shown=None):
+        """
+        Partial update of the lane figure: visibility, names and y data of the lanes, the obstacle points
+
+        Args:
+            shown: get_lane_plot_keys of what the figure shows, None for the initial figure.
+                   Lanes, boundaries and obstacles that did not change are left out.
+
+        Returns:
+            (Patch, keys of what the figure shows after the patch)
+        """
+        patch = Patch()
+        snapshot = self.get_latest_snapshot()
+        keys = self.get_lane_plot_keys(snapshot)
+        shown = shown or {'left': None, 'right': None, 'obstacles': None, 'title': False}
+        changed = {part: shown.get(part) != key for part, key in keys.items()}
+        if any(changed[side] for side in ('left', 'right')):
+            lane_points = self.get_lane_points(snapshot)
+        
+        for side, lane_trace, boundary_trace in (('left', LEFT_LANE_TRACE, LEFT_BOUNDARY_TRACE),
+                                                 ('right', RIGHT_LANE_TRACE, RIGHT_BOUNDARY_TRACE)):
+            if not changed[side]:
+                continue
+            lane_data = snapshot[f'{side}_lane'] if snapshot is not None else None
+            points = lane_points[side]
+            visible = keys[side] is not None
+            if visible != (shown.get(side) is not None):
+                patch['data'][lane_trace]['visible'] = visible
+                patch['data'][boundary_trace]['visible'] = visible
+            if visible:
+                patch['data'][lane_trace]['y'] = typed_array(points.y)
+                patch['data'][lane_trace]['name'] = f"{side.title()} Lane ({self.get_choice_name('quality', lane_data['quality'])})"
+                patch['data'][boundary_trace]['y'] = typed_array(points.boundary)
+                if self.lane_geometry.adaptive:
+                    # The point count follows the curvature, the x coordinates change with it
+                    x = typed_array(points.x)
+                    patch['data'][lane_trace]['x'] = x
+                    patch['data'][boundary_trace]['x'] = x
+        
+        if changed['obstacles']:
+            obstacle_points = None
+            if keys['obstacles'] is not None:
+                obstacle_points = self.get_obstacle_points(self.get_obstacle_list(snapshot))
+            patch['data'][OBSTACLE_TRACE]['visible'] = obstacle_points is not None
+            if obstacle_points is not None:
+                patch['data'][OBSTACLE_TRACE]['x'] = typed_array(obstacle_points['x'])
+                patch['data'][OBSTACLE_TRACE]['y'] = typed_array(obstacle_points['y'])
+                patch['data'][OBSTACLE_TRACE]['text'] = obstacle_points['text']
+                patch['data'][OBSTACLE_TRACE]['marker']['color'] = obstacle_points['color']
+        
+        if changed['title']:
+            patch['layout']['title']['text'] = ("Real-time Lane Detection with Obstacles" if self.enable_obstacle_detection
+                                                else "Real-time Lane Detection")
+        return patch, keys
+    
+    def create_history_figure(self):
+        """History figure with one WebGL trace per series and lane side, updated with create_history_patch"""
+        fig = make_subplots(rows=len(HISTORY_ROWS), cols=1, shared_xaxes=True, vertical_spacing=0.02,
+                            subplot_titles=[title for title, _, _ in HISTORY_ROWS])
+        for row, (title, series, field) in enumerate(HISTORY_ROWS, start=1):
+            if series == 'lanes':
+                traces = (('Left Lane', 'blue', row == 1), ('Right Lane', 'green', row == 1))
+            else:
+                traces = (('Nearest Obstacle', 'red', row == len(HISTORY_ROWS)),)
+            for name, color, showlegend in traces:
+                fig.add_trace(go.Scattergl(x=[], y=[], mode='lines', line=dict(color=color, width=1),
+                                           name=name, legendgroup=name, showlegend=showlegend),
+                              row=row, col=1)
         
+        fig.update_xaxes(title_text="Time (s)", row=len(HISTORY_ROWS), col=1)
+        fig.update_layout(
+            height=1000,
+            margin=dict(t=40, b=40),
+            showlegend=True,
+            uirevision=True,
+        )
         return fig
     
+    def get_history_version(self):
+        """Version of the collected history, collects the new snapshots first when no publisher does"""
+        if self.publisher is None:
+            self.history.update()
+        return self.history.version
+    
+    def create_history_data(self):
+        """x and y typed arrays of every history trace in figure order, each downsampled with LTTB to at most history_points points"""
+        if self.publisher is None:
+            self.history.update()
+        windows = self.history.window()
+        newest = self.history.newest_timestamp() or 0.0
+        
+        # Every series of a window shares the timestamps, downsample them together
+        downsampled = {}
+        for key, (timestamps, columns) in windows.items():
+            fields = OBSTACLE_HISTORY_FIELDS if key == 'obstacles' else LANE_HISTORY_FIELDS
+            indices = lttb_indices(timestamps, columns, self.history_points)
+            for field, column, field_indices in zip(fields, columns, indices):
+                # Seconds before the newest sample, the x axis stays put while the data scrolls
+                downsampled[key, field] = (typed_array(timestamps[field_indices] - newest),
+                                           typed_array(column[field_indices]))
+        
+        return [downsampled[key, field]
+                for _, series, field in HISTORY_ROWS
+                for key in (('left', 'right') if series == 'lanes' else ('obstacles',))]
+    
+    def create_history_patch(self):
+        """Patch of the x and y data of every history trace"""
+        patch = Patch()
+        for trace, (x, y) in enumerate(self.create_history_data()):
+            patch['data'][trace]['x'] = x
+            patch['data'][trace]['y'] = y
+        return patch
+    
+    def get_history_event(self):
+        """Serialized history of the current history version for the history stream"""
+        return self.render_cache.get('history_data', self.get_history_version, self.create_history_data).json
+    
+    def get_latest_snapshot(self):
+        """Copy of the newest snapshot of the parser, None if there is none since the last clear"""
+        if self.publisher is not None:
+            snapshot = self.publisher.snapshot
+        elif self.snapshot_ring is not None:
+            snapshot = self.snapshot_ring.latest()
+        else:
+            return None
+        if snapshot is None or snapshot['seq'] <= self._cleared_seq:
+            return None
+        return snapshot
+    
+    def get_obstacle_list(self, snapshot):
+        """Obstacle columns of a snapshot"""
+        return Obstacle_Data_List(snapshot['obstacles'], choices=self.snapshot_ring.choices)
+    
+    def get_choice_name(self, field_name, value):
+        """Value table name of a raw snapshot value, the number itself if it has no name"""
+        name = self.snapshot_ring.choices.get(field_name, {}).get(int(value))
+        return int(value) if name is None else str(name).strip()
+    
     def is_good_quality(self, quality):
         # Only show line if quality is not 'Very Low Quality'
         if hasattr(quality, 'name') and hasattr(quality, 'value'):
@@ -351,7 +653,7 @@ class MobilEyeVisualizer:
             return not (qname == "very low quality" or qval == 0)
         if isinstance(quality, str):
             return quality.strip().lower() != "very low quality"
-        elif isinstance(quality, (int, float)):
+        elif isinstance(quality, (int, float, np.integer)):
             return int(quality) != 0
         return False
     
@@ -361,49 +663,13 @@ class MobilEyeVisualizer:
         if self.enable_obstacle_detection:
             return None
         
-        # Performance optimization: Check if we need to update
-        current_time = time.time()
-        if current_time - self._last_update_time < 0.05:  # Only update every 50ms max
-            if 'obstacle_plot' in self._plot_cache:
-                return self._plot_cache['obstacle_plot']
-        
         fig = go.Figure()
         
-        if self.obstacle_data_history:
-            obstacle_list = self.obstacle_data_history[-1]
-            
-            if obstacle_list:
-                # Extract individual obstacles from the Obstacle_Data_List
-                obstacles = [
-                    obstacle_list.object1, obstacle_list.object2, obstacle_list.object3,
-                    obstacle_list.object4, obstacle_list.object5, obstacle_list.object6,
-                    obstacle_list.object7, obstacle_list.object8, obstacle_list.object9,
-                    obstacle_list.object10
-                ]
-                
-                # Batch process obstacles for better performance
-                valid_obstacles = [obs for obs in obstacles if obs and obs.last_update > 0]
-                
-                if valid_obstacles:
-                    # Create batch scatter plot for better performance
-                    x_coords = [obs.longitudinal_distance for obs in valid_obstacles]
-                    y_coords = [obs.lateral_distance for obs in valid_obstacles]
-                    colors = ['red' if obs.object_class == 1 else 'orange' for obs in valid_obstacles]
-                    texts = [f'ID: {obs.id}<br>Class: {obs.object_class}<br>Velocity: {obs.absolute_long_velocity:.1f} m/s' 
-                            for obs in valid_obstacles]
-                    
-                    fig.add_trace(go.Scatter(
-                        x=x_coords, y=y_coords,
-                        mode='markers',
-                        marker=dict(
-                            size=15,
-                            color=colors,
-                            symbol='circle'
-                        ),
-                        text=texts,
-                        hoverinfo='text',
-                        name='Obstacles'
-                    ))
+        snapshot = self.get_latest_snapshot()
+        if snapshot is not None:
+            obstacle_trace = self.create_obstacle_trace(self.get_obstacle_list(snapshot))
+            if obstacle_trace is not None:
+                fig.add_trace(obstacle_trace)
         
         fig.update_layout(
             title="Obstacle Detection",
@@ -417,113 +683,215 @@ class MobilEyeVisualizer:
             dragmode=False,   # Disable drag to improve performance
         )
         
-        # Cache the result
-        self._plot_cache['obstacle_plot'] = fig
-        self._last_update_time = current_time
-        
         return fig
     
-    def calculate_lane_points(self, lane_data, side='left'):
-        """Calculate lane points using cubic polynomial model"""
-        if not lane_data or lane_data.last_update == 0:
+    def get_obstacle_points(self, obstacle_list):
+        """float32 positions, colors and hover texts of all valid obstacle slots, None if there is none"""
+        if obstacle_list is None:
+            return None
+        
+        valid = obstacle_list.valid_mask()
+        if not valid.any():
+            return None
+        
+        # Whole columns of the valid slots, no per obstacle attribute access
+        velocities = obstacle_list.absolute_long_velocities[valid]
+        colors = np.where(obstacle_list.object_classes[valid] == 1, 'red', 'orange')
+        class_names = obstacle_list.choice_names('object_class', valid)
+        texts = [f'ID: {obstacle_id}<br>Class: {class_name}<br>Velocity: {velocity:.1f} m/s'
+                 for obstacle_id, class_name, velocity in zip(obstacle_list.ids[valid].tolist(), class_names, velocities.tolist())]
+        
+        return {
+            'x': obstacle_list.longitudinal_distances[valid].astype(np.float32),
+            'y': obstacle_list.lateral_distances[valid].astype(np.float32),
+            'color': colors.tolist(),
+            'text': texts,
+        }
+    
+    def create_obstacle_trace(self, obstacle_list):
+        """Create one marker trace for all valid obstacle slots, None if there is none"""
+        points = self.get_obstacle_points(obstacle_list)
+        if points is None:
+            return None
+        
+        return go.Scatter(
+            x=points['x'],
+            y=points['y'],
+            mode='markers',
+            marker=dict(
+                size=15,
+                color=points['color'],
+                symbol='circle'
+            ),
+            text=points['text'],
+            hoverinfo='text',
+            name='Obstacles',
+            showlegend=True
+        )
+    
+    def calculate_lane_points(self, lane_data):
+        """Calculate lane points using cubic polynomial model, only the x coordinates without lane data"""
+        if lane_data is None:
+            return self.lane_geometry.abscissa(self.lane_geometry.points)[1], []
+        if lane_data['last_update'] == 0:
             return [], []
         
-        # Get lane parameters
-        if side == 'left':
-            c0 = lane_data.LaneMarkPosition_C0_Lh_ME
-            c1 = lane_data.LaneMarkHeadingAngle_C1_Lh_ME
-            c2 = lane_data.LaneMarkModelA_C2_Lh_ME
-            c3 = lane_data.LaneMarkModelDerivA_C3_Lh_ME
-        else:  # right
-            c0 = lane_data.LaneMarkPosition_C0_Rh_ME
-            c1 = lane_data.LaneMarkHeadingAngle_C1_Rh_ME
-            c2 = lane_data.LaneMarkModelA_C2_Rh_ME
-            c3 = lane_data.LaneMarkModelDerivA_C3_Rh_ME
-        
-        # Generate x coordinates (distance ahead) - reduced resolution for better performance
-        x = np.linspace(0, 100, 100)  # Reduced from 200 to 100 points
-        
-        # Calculate y coordinates using cubic polynomial
         # Jimmy told me to use the cubic polynomial model
-        y = c0 + c1*x + c2*x**2 + c3*x**3
+        points = self.lane_geometry.evaluate([(self.get_lane_coefficients(lane_data), lane_data['quality'], 0.0)])[0]
+        return points.x, points.y
+    
+    def get_lane_coefficients(self, lane_data):
+        """C0..C3 of a snapshot lane record"""
+        return float(lane_data['c0']), float(lane_data['c1']), float(lane_data['c2']), float(lane_data['c3'])
+    
+    def get_lane_points(self, snapshot):
+        """Lane_Points of both lanes with their boundaries, evaluated in one batch, None for a lane without data"""
+        lane_points = {'left': None, 'right': None}
+        if snapshot is None:
+            return lane_points
+        
+        sides = [side for side in lane_points if snapshot[f'{side}_lane']['last_update'] != 0]
+        lanes = [(self.get_lane_coefficients(snapshot[f'{side}_lane']), snapshot[f'{side}_lane']['quality'],
+                  LANE_WIDTH / 2 if side == 'left' else -LANE_WIDTH / 2)
+                 for side in sides]
+        for side, points in zip(sides, self.lane_geometry.evaluate(lanes)):
+            lane_points[side] = points
+        return lane_points
+    
+    def get_lane_param_lines(self, snapshot, side):
+        """Lane parameter text lines of one side, None without lane data"""
+        if snapshot is None or snapshot[f'{side}_lane']['last_update'] == 0:
+            return None
+        
+        data = snapshot[f'{side}_lane']
+        return [
+            f"Classification: {self.get_choice_name('classification', data['classification'])}",
+            f"Quality: {self.get_choice_name('quality', data['quality'])}",
+            f"Position (C0): {data['c0']:.3f} m",
+            f"Heading (C1): {data['c1']:.3f} rad",
+            f"Curvature (C2): {data['c2']:.6f} 1/m",
+            f"Curvature Rate (C3): {data['c3']:.8f} 1/m²",
+            f"Last Update: {datetime.fromtimestamp(data['last_update']).strftime('%H:%M:%S')}",
+        ]
+    
+    def get_data_table_lines(self, snapshot):
+        """Heading and text lines of the latest data table, None without data"""
+        if snapshot is None:
+            return None
+        
+        latest_time = datetime.fromtimestamp(snapshot['timestamp']).strftime('%H:%M:%S')
+        obstacle_list = self.get_obstacle_list(snapshot)
         
-        return x.tolist(), y.tolist()
+        return f"Latest Update: {latest_time}", [
+            f"Total Data Points: {min(int(snapshot['seq']) - self._cleared_seq, self.snapshot_ring.capacity)}",
+            f"Left Lane Data: {'Available' if snapshot['left_lane']['last_update'] else 'None'}",
+            f"Right Lane Data: {'Available' if snapshot['right_lane']['last_update'] else 'None'}",
+            f"Obstacle Data: {'Available' if obstacle_list.valid_mask().any() else 'None'}",
+        ]
     
     def get_lane_params(self, side):
         """Get formatted lane parameters for display"""
-        if side == 'left' and self.lane_data_history['left']:
-            data = self.lane_data_history['left'][-1]
-            return html.Div([
-                html.P(f"Classification: {data.classification}"),
-                html.P(f"Quality: {data.quality}"),
-                html.P(f"Position (C0): {data.LaneMarkPosition_C0_Lh_ME:.3f} m"),
-                html.P(f"Heading (C1): {data.LaneMarkHeadingAngle_C1_Lh_ME:.3f} rad"),
-                html.P(f"Curvature (C2): {data.LaneMarkModelA_C2_Lh_ME:.6f} 1/m"),
-                html.P(f"Curvature Rate (C3): {data.LaneMarkModelDerivA_C3_Lh_ME:.8f} 1/m²"),
-                html.P(f"Last Update: {datetime.fromtimestamp(data.last_update).strftime('%H:%M:%S')}")
-            ])
-        elif side == 'right' and self.lane_data_history['right']:
-            data = self.lane_data_history['right'][-1]
-            return html.Div([
-                html.P(f"Classification: {data.classification}"),
-                html.P(f"Quality: {data.quality}"),
-                html.P(f"Position (C0): {data.LaneMarkPosition_C0_Rh_ME:.3f} m"),
-                html.P(f"Heading (C1): {data.LaneMarkHeadingAngle_C1_Rh_ME:.3f} rad"),
-                html.P(f"Curvature (C2): {data.LaneMarkModelA_C2_Rh_ME:.6f} 1/m"),
-                html.P(f"Curvature Rate (C3): {data.LaneMarkModelDerivA_C3_Rh_ME:.8f} 1/m²"),
-                html.P(f"Last Update: {datetime.fromtimestamp(data.last_update).strftime('%H:%M:%S')}")
-            ])
-        else:
+        lines = self.get_lane_param_lines(self.get_latest_snapshot(), side)
+        if lines is None:
             return html.P("No data available")
+        return html.Div([html.P(line) for line in lines])
     
     def create_data_table(self):
         """Create a data table showing latest values"""
-        if not self.timestamps:
+        table = self.get_data_table_lines(self.get_latest_snapshot())
+        if table is None:
             return html.P("No data available")
         
-        latest_time = datetime.fromtimestamp(self.timestamps[-1]).strftime('%H:%M:%S')
-        
-        return html.Div([
-            html.H4(f"Latest Update: {latest_time}"),
-            html.P(f"Total Data Points: {len(self.timestamps)}"),
-            html.P(f"Left Lane Data: {'Available' if self.lane_data_history['left'] else 'None'}"),
-            html.P(f"Right Lane Data: {'Available' if self.lane_data_history['right'] else 'None'}"),
-            html.P(f"Obstacle Data: {'Available' if self.obstacle_data_history else 'None'}")
-        ])
+        heading, lines = table
+        return html.Div([html.H4(heading)] + [html.P(line) for line in lines])
+    
+    def get_data_version(self):
+        """Version of the displayed data, bumped by every publish (or completed frame group), a clear or a display option"""
+        if self.publisher is not None:
+            count = self.publisher.version
+        else:
+            count = self.snapshot_ring.count if self.snapshot_ring is not None else 0
+        return count, self._cleared_seq, self.enable_obstacle_detection
+    
+    def render_cached(self, kind, render):
+        """Rendered output of the current data version, render() only runs on the first request of a version"""
+        return self.render_cache.get(kind, self.get_data_version, render).value
+    
+    def get_state_event(self):
+        """Serialized state frame of the current data version for the stream"""
+        entry = self.render_cache.get('state_frame', self.get_data_version, self.create_state_frame)
+        payload = entry.json
+        if entry.value['seq']:
+            self.latency.serialized(entry.value['seq'], time.time())
+        return payload
     
-    def add_lane_data(self, left_lane_data=None, right_lane_data=None):
-        """Add new lane data for visualization"""
-        current_time = time.time()
+    def create_state_frame(self):
+        """Compact JSON state pushed to the browsers, the lane points come from lane_geometry as typed arrays"""
+        snapshot = self.get_latest_snapshot()
+        lane_points = self.get_lane_points(snapshot)
+        frame = {
+            'seq': int(snapshot['seq']) if snapshot is not None else 0,
+            'title': "Real-time Lane Detection with Obstacles" if self.enable_obstacle_detection else "Real-time Lane Detection",
+            'lanes': {},
+            'params': {side: self.get_lane_param_lines(snapshot, side) for side in ('left', 'right')},
+            'table': self.get_data_table_lines(snapshot),
+            'obstacles': None,
+        }
         
-        if left_lane_data:
-            self.lane_data_history['left'].append(left_lane_data)
-            # print(f"Added left lane data: {left_lane_data}")
-            
-        if right_lane_data:
-            self.lane_data_history['right'].append(right_lane_data)
-            # print(f"Added right lane data: {right_lane_data}")
-            
-        if left_lane_data or right_lane_data:
-            self.timestamps.append(current_time)
-            # Clear cache to force update with new data
-            self._plot_cache.clear()
-            # print(f"Cache cleared, total left: {len(self.lane_data_history['left'])}, total right: {len(self.lane_data_history['right'])}")
-    
-    def add_obstacle_data(self, obstacle_data):
-        """Add new obstacle data for visualization"""
-        if obstacle_data:
-            self.obstacle_data_history.append(obstacle_data)
-            # Clear cache to force update with new data
-            self._plot_cache.clear()
+        for side in ('left', 'right'):
+            lane_data = snapshot[f'{side}_lane'] if snapshot is not None else None
+            visible = lane_data is not None and lane_data['last_update'] != 0 and self.is_good_quality(lane_data['quality'])
+            points = lane_points[side] if visible else None
+            frame['lanes'][side] = {
+                'visible': visible,
+                'name': f"{side.title()} Lane ({self.get_choice_name('quality', lane_data['quality'])})" if visible else f"{side.title()} Lane",
+                # The x coordinates of the figure only change with adaptive sampling
+                'x': typed_array(points.x) if points is not None and self.lane_geometry.adaptive else None,
+                'y': typed_array(points.y) if points is not None else None,
+                'boundary': typed_array(points.boundary) if points is not None else None,
+            }
+        
+        if self.enable_obstacle_detection and snapshot is not None:
+            obstacle_points = self.get_obstacle_points(self.get_obstacle_list(snapshot))
+            if obstacle_points is not None:
+                obstacle_points['x'] = typed_array(obstacle_points['x'])
+                obstacle_points['y'] = typed_array(obstacle_points['y'])
+            frame['obstacles'] = obstacle_points
+        
+        if snapshot is not None:
+            self.latency.trace(snapshot, rendered=time.time())
+        return frame
+    
+    def create_latency_table(self):
+        """p50 / p95 / p99 latency of every stage in milliseconds"""
+        quantiles = self.latency.quantiles()
+        rows = [html.Tr([html.Th(heading) for heading in ("Stage", "p50 (ms)", "p95 (ms)", "p99 (ms)", "Frames")])]
+        for stage in LATENCY_STAGES:
+            values = quantiles[stage]
+            if values is None:
+                cells = [stage, "-", "-", "-", 0]
+            else:
+                cells = [stage, *(f"{value * 1e3:.1f}" for value in values[:3]), values[3]]
+            rows.append(html.Tr([html.Td(cell) for cell in cells]))
+        return html.Table(rows)
+    
+    def attach_snapshot_ring(self, snapshot_ring):
+        """Read the data to visualize from the snapshot ring of a parser"""
+        self.snapshot_ring = snapshot_ring
+        self._cleared_seq = 0
+        self.history.attach(snapshot_ring)
+        # The seqs of a new ring start over, drop the renders of the old one
+        self.render_cache.clear()
     
     def clear_data(self):
         """Clear all stored data"""
-        self.lane_data_history['left'].clear()
-        self.lane_data_history['right'].clear()
-        self.obstacle_data_history.clear()
-        self.timestamps.clear()
+        # The ring belongs to the parser, hide the snapshots written so far instead
+        if self.snapshot_ring is not None:
+            self._cleared_seq = self.snapshot_ring.count
+        self.history.clear()
+        self.latency.clear()
         # Clear cache
-        self._plot_cache.clear()
+        self.render_cache.clear()
     
     def get_server_url(self):
         """Get the server URL for remote access"""
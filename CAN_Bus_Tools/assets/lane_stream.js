@@ -0,0 +1,226 @@
+// Author: Navneet Singh
+// lane_stream.js
+// Browser side of the /stream push transport of MobilEyeVisualizer
+//
+// Dash serves every file of assets/ automatically. While the visualization
+// is running the page keeps one EventSource open, the lane, boundary and
+// obstacle points computed by the server (Lane_Geometry) arrive as base64
+// typed arrays and are drawn with Plotly.update on the lane figure, at most
+// once per animation frame. The parameter and data tables are written into
+// elements this script creates inside the Dash divs, Dash never renders
+// those. The history panels are drawn from a second stream, /history_stream,
+// whose payload the server serializes once per history version for every
+// tab. The receive and paint time of every drawn frame is posted to
+// /latency once a second for the latency table.
+
+(function () {
+    // Trace order of MobilEyeVisualizer.create_lane_figure
+    var LANE_TRACES = [1, 2, 3, 4];
+    var OBSTACLE_TRACE = 5;
+    var REPORT_INTERVAL = 1000;
+    var EMPTY = new Float32Array(0);
+
+    var source = null;
+    var historySource = null;
+    var latestHistory = null;
+    var paused = true;
+    var latest = null;
+    var scheduled = false;
+    var lastTitle = null;
+    var reports = [];
+
+    // Wall clock seconds, the clock of the server side timestamps
+    function now() {
+        return (window.performance.timeOrigin + window.performance.now()) / 1000;
+    }
+
+    function reportLatency() {
+        if (reports.length === 0) {
+            return;
+        }
+        var body = JSON.stringify({frames: reports});
+        reports = [];
+        window.fetch('/latency', {
+            method: 'POST',
+            headers: {'Content-Type': 'application/json'},
+            body: body,
+            keepalive: true
+        }).catch(function () {});
+    }
+    window.setInterval(reportLatency, REPORT_INTERVAL);
+
+    function connect() {
+        if (source !== null) {
+            return;
+        }
+        source = new EventSource('/stream');
+        source.onmessage = function (event) {
+            latest = JSON.parse(event.data);
+            latest.received = now();
+            schedule();
+        };
+        historySource = new EventSource('/history_stream');
+        historySource.onmessage = function (event) {
+            var pending = latestHistory === null;
+            latestHistory = JSON.parse(event.data);
+            if (pending) {
+                window.requestAnimationFrame(renderHistory);
+            }
+        };
+    }
+
+    function disconnect() {
+        if (source !== null) {
+            source.close();
+            source = null;
+        }
+        if (historySource !== null) {
+            historySource.close();
+            historySource = null;
+        }
+    }
+
+    function schedule() {
+        if (paused || scheduled || latest === null) {
+            return;
+        }
+        scheduled = true;
+        window.requestAnimationFrame(render);
+    }
+
+    // {dtype: 'f4', bdata: base64} of typed_array() in MobilEye_DataVisualizer.py
+    function decodeTypedArray(spec) {
+        var binary = window.atob(spec.bdata);
+        var bytes = new Uint8Array(binary.length);
+        for (var i = 0; i < binary.length; i++) {
+            bytes[i] = binary.charCodeAt(i);
+        }
+        return new Float32Array(bytes.buffer);
+    }
+
+    function lanePoints(spec) {
+        return spec ? decodeTypedArray(spec) : EMPTY;
+    }
+
+    // Element owned by this script inside a Dash div, Dash never renders children into it
+    function streamContainer(elementId) {
+        var element = document.getElementById(elementId);
+        if (!element) {
+            return null;
+        }
+        var container = element.querySelector(':scope > .lane-stream-content');
+        if (!container) {
+            container = document.createElement('div');
+            container.className = 'lane-stream-content';
+            element.appendChild(container);
+        }
+        return container;
+    }
+
+    function setLines(elementId, heading, lines) {
+        var element = streamContainer(elementId);
+        if (!element) {
+            return;
+        }
+        var children = [];
+        if (lines === null) {
+            lines = ['No data available'];
+        }
+        if (heading) {
+            var title = document.createElement('h4');
+            title.textContent = heading;
+            children.push(title);
+        }
+        lines.forEach(function (line) {
+            var paragraph = document.createElement('p');
+            paragraph.textContent = line;
+            children.push(paragraph);
+        });
+        element.replaceChildren.apply(element, children);
+    }
+
+    function render() {
+        scheduled = false;
+        var frame = latest;
+        var graph = document.querySelector('#lane-plot .js-plotly-plot');
+        if (!graph || !window.Plotly) {
+            // Figure not mounted yet, try again on the next frame
+            schedule();
+            return;
+        }
+
+        var left = frame.lanes.left;
+        var right = frame.lanes.right;
+        var layout = {};
+        if (frame.title !== lastTitle) {
+            layout['title.text'] = frame.title;
+            lastTitle = frame.title;
+        }
+        var lanes = {
+            y: [lanePoints(left.y), lanePoints(left.boundary), lanePoints(right.y), lanePoints(right.boundary)],
+            visible: [left.visible, left.visible, right.visible, right.visible],
+            name: [left.name, 'Left Boundary', right.name, 'Right Boundary']
+        };
+        if (left.x || right.x) {
+            // Adaptive sampling, the point count of a lane follows its curvature
+            var leftX = lanePoints(left.x);
+            var rightX = lanePoints(right.x);
+            lanes.x = [leftX, leftX, rightX, rightX];
+        }
+        window.Plotly.update(graph, lanes, layout, LANE_TRACES);
+
+        var obstacles = frame.obstacles;
+        window.Plotly.restyle(graph, {
+            x: [obstacles ? decodeTypedArray(obstacles.x) : []],
+            y: [obstacles ? decodeTypedArray(obstacles.y) : []],
+            text: [obstacles ? obstacles.text : []],
+            'marker.color': [obstacles ? obstacles.color : []],
+            visible: obstacles !== null
+        }, [OBSTACLE_TRACE]);
+
+        setLines('left-lane-params', null, frame.params.left);
+        setLines('right-lane-params', null, frame.params.right);
+        setLines('data-table', frame.table ? frame.table[0] : null, frame.table ? frame.table[1] : null);
+
+        if (frame.seq) {
+            // The next animation frame starts after this one was painted
+            window.requestAnimationFrame(function () {
+                reports.push({seq: frame.seq, received: frame.received, painted: now()});
+            });
+        }
+    }
+
+    // [[x, y], ...] typed arrays of every history trace in figure order
+    function renderHistory() {
+        var traces = latestHistory;
+        var graph = document.querySelector('#history-plot .js-plotly-plot');
+        if (traces === null) {
+            return;
+        }
+        if (!graph || !window.Plotly) {
+            window.requestAnimationFrame(renderHistory);
+            return;
+        }
+        latestHistory = null;
+        window.Plotly.restyle(graph, {
+            x: traces.map(function (trace) { return decodeTypedArray(trace[0]); }),
+            y: traces.map(function (trace) { return decodeTypedArray(trace[1]); })
+        }, traces.map(function (trace, index) { return index; }));
+    }
+
+    window.dash_clientside = Object.assign({}, window.dash_clientside, {
+        lane_stream: {
+            // Follows the disabled state of lane-interval, toggled by Start / Stop
+            set_paused: function (disabled) {
+                paused = disabled !== false;
+                if (paused) {
+                    disconnect();
+                } else {
+                    connect();
+                    schedule();
+                }
+                return paused;
+            }
+        }
+    });
+})();
@@ -0,0 +1,247 @@
+# Author: Navneet Singh
+# can_bus_benchmark.py
+# Micro benchmarks for the Mobil Eye CAN decoding path
+#
+# Usage:
+#   python3 can_bus_benchmark.py [--frames 200000] [--ticks 200]
+
+import argparse
+import contextlib
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+import can
+import cantools
+from plotly.io.json import to_json_plotly
+
+from can_capture import Capture_Writer, load_capture
+from can_log_batch_decoder import decode_frames, load_candump_log
+from mobil_eye_structures import Process_Mobil_Eye_CAN_Data
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from krv_logger.krv_logger import Flight_Recorder
+
+DBC_FILE = os.path.join(os.path.dirname(__file__), 'dbc_files', 'Zendar_Private_CAN.dbc')
+
+
+def make_frames(database, frame_count, seed=0):
+    """Create random payload frames for every DBC message that is sent on the bus"""
+    rng = random.Random(seed)
+    messages = [message for message in database.messages if message.length > 0]
+    frames = []
+    for index in range(frame_count):
+        message = messages[index % len(messages)]
+        data = bytes(rng.getrandbits(8) for _ in range(message.length))
+        frames.append(can.Message(arbitration_id=message.frame_id, data=data,
+                                  is_extended_id=False, timestamp=index * 0.0001))
+    return frames
+
+
+def write_candump_log(file_name, frames, channel='can0'):
+    """Write frames in the candump -l text format"""
+    with open(file_name, 'w') as log_file:
+        for msg in frames:
+            log_file.write(f"({1750786342 + msg.timestamp:.6f}) {channel} {msg.arbitration_id:03X}#{msg.data.hex().upper()}\n")
+
+
+def report(name, frame_count, elapsed):
+    print(f"{name:<40} {frame_count:>9} frames {elapsed:8.3f} s {frame_count / elapsed:>12,.0f} frames/s")
+
+
+def make_baseline_parsers(database):
+    """
+    The former parser, generated from the DBC: cantools decode_message per frame and plain
+    attribute writes, dispatched by a match statement over the arbitration ids (as before the
+    dispatch table) and by a dict of the same handlers, so the two differ only in the dispatch
+    """
+    dispatch_table = Process_Mobil_Eye_CAN_Data(database).dispatch_table
+    targets = {frame_id: SimpleNamespace() for frame_id in dispatch_table}
+
+    def handler_body(frame_id, field_map, indent):
+        body = ["try:",
+                "    decoded = database.decode_message(msg.arbitration_id, msg.data)",
+                f"    target = targets[{frame_id}]"]
+        body += [f"    target.{field_name} = decoded[{signal_name!r}]" for signal_name, field_name in field_map]
+        body += ["    target.last_update = time.time()",
+                 "except Exception as e:",
+                 "    print(f'Error decoding message: {e}')"]
+        return [" " * indent + line for line in body]
+
+    lines = ["def match_parse(msg):", "    match msg.arbitration_id:"]
+    for frame_id, (_, _, field_map, _, _) in dispatch_table.items():
+        lines += [f"        case {frame_id}:"] + handler_body(frame_id, field_map, 12)
+    lines += ["        case _:", "            pass"]
+    for frame_id, (_, _, field_map, _, _) in dispatch_table.items():
+        lines += [f"def handle_{frame_id}(msg):"] + handler_body(frame_id, field_map, 4)
+    lines += ["handlers = {" + ", ".join(f"{frame_id}: handle_{frame_id}" for frame_id in dispatch_table) + "}",
+              "def table_parse(msg):",
+              "    handler = handlers.get(msg.arbitration_id)",
+              "    if handler is not None:",
+              "        handler(msg)"]
+    namespace = {'database': database, 'targets': targets, 'time': time}
+    exec("\n".join(lines), namespace)
+    return namespace['match_parse'], namespace['table_parse']
+
+
+def bench_parser(database, frames):
+    """Frames/s through Process_Mobil_Eye_CAN_Data.parse_mobil_eye_can_data against the former match dispatch"""
+    # The dispatch alone, on the former cantools decoding
+    match_parse, table_parse = make_baseline_parsers(database)
+    for name, parse in (("baseline: match + cantools", match_parse), ("dispatch table + cantools", table_parse)):
+        start = time.perf_counter()
+        for msg in frames:
+            parse(msg)
+        report(name, len(frames), time.perf_counter() - start)
+
+    # Dispatch table, compiled decoders, columnar store and snapshots
+    parser = Process_Mobil_Eye_CAN_Data(database)
+    start = time.perf_counter()
+    for msg in frames:
+        parser.parse_mobil_eye_can_data(msg)
+    report("parse_mobil_eye_can_data", len(frames), time.perf_counter() - start)
+
+    # Same with every frame kept by the flight recorder
+    parser = Process_Mobil_Eye_CAN_Data(database)
+    parser.flight_recorder = Flight_Recorder()
+    start = time.perf_counter()
+    for msg in frames:
+        parser.parse_mobil_eye_can_data(msg)
+    report("parse_mobil_eye_can_data + flight rec.", len(frames), time.perf_counter() - start)
+
+
+def bench_batch_decoder(database, frames):
+    """Frames/s loading and decoding a candump log with the NumPy batch decoder"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        log_file = os.path.join(temp_dir, 'candump-benchmark.log')
+        write_candump_log(log_file, frames)
+        size_mb = os.path.getsize(log_file) / 1e6
+
+        start = time.perf_counter()
+        log_frames = load_candump_log(log_file)
+        loaded = time.perf_counter()
+        decode_frames(database, log_frames)
+        finished = time.perf_counter()
+
+        # Same frames in the binary capture format
+        capture_file = os.path.join(temp_dir, 'benchmark.cancap')
+        capture_start = time.perf_counter()
+        with Capture_Writer(capture_file) as writer:
+            writer.write_messages(frames)
+        captured = time.perf_counter()
+        capture_mb = os.path.getsize(capture_file) / 1e6
+        capture_frames = load_capture(capture_file)
+        capture_loaded = time.perf_counter()
+        decode_frames(database, capture_frames)
+        capture_finished = time.perf_counter()
+        del capture_frames
+
+    report(f"load_candump_log ({size_mb:.1f} MB)", len(frames), loaded - start)
+    report("decode_frames", len(frames), finished - loaded)
+    report("load + decode", len(frames), finished - start)
+    report("Capture_Writer.write_messages", len(frames), captured - capture_start)
+    report(f"load_capture ({capture_mb:.1f} MB)", len(frames), capture_loaded - captured)
+    report("load_capture + decode", len(frames), capture_finished - captured)
+
+
+def bench_lane_plot_updates(database, frames, ticks):
+    """Server time and JSON payload of one lane plot tick, full figure against patch updates"""
+    from MobilEye_DataVisualizer import MobilEyeVisualizer
+
+    parser = Process_Mobil_Eye_CAN_Data(database)
+    frames_per_tick = max(1, len(frames) // ticks)
+
+    # Lanes held still: only the obstacle frames of each tick are decoded
+    lane_ids = {message.frame_id for message in database.messages if message.name.startswith('ME_')}
+    obstacle_frames = [msg for msg in frames if msg.arbitration_id not in lane_ids]
+
+    for name, patch_updates, tick_frames in (("lane plot tick (full figure)", False, frames),
+                                             ("lane plot tick (patch)", True, frames),
+                                             ("lane plot tick (patch, lanes still)", True, obstacle_frames)):
+        visualizer = MobilEyeVisualizer(snapshot_ring=parser.snapshot_ring, patch_updates=patch_updates)
+        visualizer.enable_obstacle_detection = True
+        payload_bytes = 0
+        elapsed = 0.0
+        shown = None
+        # The full figure path prints the lane quality every tick
+        with contextlib.redirect_stdout(io.StringIO()):
+            for tick in range(ticks):
+                parser.parse_mobil_eye_can_messages(tick_frames[tick * frames_per_tick:(tick + 1) * frames_per_tick])
+
+                start = time.perf_counter()
+                if patch_updates:
+                    # Only what changed since the previous tick of this client
+                    lane_plot, shown = visualizer.create_lane_patch(shown)
+                else:
+                    lane_plot = visualizer.create_lane_plot()
+                # Dash serializes callback outputs with the plotly JSON encoder
+                payload = to_json_plotly(lane_plot)
+                elapsed += time.perf_counter() - start
+                payload_bytes += len(payload)
+
+        print(f"{name:<40} {ticks:>9} ticks  {elapsed / ticks * 1e3:8.3f} ms/tick {payload_bytes / ticks:>10,.0f} bytes/tick")
+
+
+def bench_history_panel(database, frames, ticks):
+    """Server time and JSON payload of one history panel update over the whole decoded frames"""
+    from MobilEye_DataVisualizer import MobilEyeVisualizer
+
+    parser = Process_Mobil_Eye_CAN_Data(database)
+    visualizer = MobilEyeVisualizer(snapshot_ring=parser.snapshot_ring)
+    # Collect often enough that the snapshot ring is never lapped
+    for start in range(0, len(frames), 500):
+        parser.parse_mobil_eye_can_messages(frames[start:start + 500])
+        visualizer.history.update()
+
+    samples = sum(len(series) for series in visualizer.history.lanes.values()) + len(visualizer.history.obstacles)
+    name = f"history panel tick ({samples} samples)"
+    payload_bytes = 0
+    start = time.perf_counter()
+    for tick in range(ticks):
+        payload_bytes += len(to_json_plotly(visualizer.create_history_patch()))
+    elapsed = time.perf_counter() - start
+    print(f"{name:<40} {ticks:>9} ticks  {elapsed / ticks * 1e3:8.3f} ms/tick {payload_bytes / ticks:>10,.0f} bytes/tick")
+
+    # The history changes with every publish and the tabs poll out of phase, so every polled
+    # patch is a new version. The stream renders and serializes one payload per tick for all tabs.
+    tabs = 10
+    for name, streamed in ((f"history poll, {tabs} tabs", False), (f"history stream, {tabs} tabs", True)):
+        elapsed = 0.0
+        for tick in range(ticks):
+            for tab in range(tabs):
+                parser.parse_mobil_eye_can_messages(frames[tab * 500:(tab + 1) * 500])
+                start = time.perf_counter()
+                if streamed:
+                    visualizer.history.update()
+                else:
+                    to_json_plotly(visualizer.render_cache.get(
+                        'history_patch', visualizer.get_history_version, visualizer.create_history_patch).value)
+                elapsed += time.perf_counter() - start
+            start = time.perf_counter()
+            if streamed:
+                visualizer.get_history_event()
+            elapsed += time.perf_counter() - start
+        print(f"{name:<40} {ticks:>9} ticks  {elapsed / ticks * 1e3:8.3f} ms/tick")
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Mobil Eye CAN decoding benchmarks")
+    arg_parser.add_argument('--frames', type=int, default=200000, help="Number of frames per benchmark")
+    arg_parser.add_argument('--ticks', type=int, default=200, help="Number of visualizer ticks")
+    args = arg_parser.parse_args()
+
+    database = cantools.database.load_file(DBC_FILE)
+    frames = make_frames(database, args.frames)
+
+    bench_parser(database, frames)
+    bench_batch_decoder(database, frames)
+    bench_lane_plot_updates(database, frames, args.ticks)
+    bench_history_panel(database, frames, max(1, args.ticks // 10))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+# Author: Navneet Singh
+# can_bus_metrics.py
+# Per arbitration id bus statistics and decode latency in Prometheus text format
+#
+# The parser records every frame it decodes: frame count, inter arrival
+# interval and jitter (from the CAN timestamps), decode time and decode
+# errors. The counters are plain Python ints and floats updated by the
+# decoding task; the /metrics route on the Dash Flask server renders them
+# together with the socketcan interface drop counters from /sys.
+#
+# Usage:
+#   curl http://localhost:8050/metrics
+
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+# Decode times kept per id for the percentiles, a power of two
+DECODE_TIME_SAMPLES = 256
+DECODE_TIME_QUANTILES = (0.5, 0.95, 0.99)
+
+# Smoothing of the interval and jitter averages, same gain as the RFC 3550 jitter
+INTERVAL_GAIN = 1 / 16
+
+# Interface statistics read from /sys/class/net/<interface>/statistics
+SOCKETCAN_COUNTERS = ('rx_packets', 'rx_dropped', 'rx_errors', 'rx_over_errors', 'rx_fifo_errors')
+
+
+class ID_Statistics:
+    " Counters of one arbitration id"
+    __slots__ = ('frames', 'errors', 'last_timestamp', 'interval', 'jitter', 'decode_ns_total', 'decode_ns')
+
+    def __init__(self):
+        self.frames = 0
+        self.errors = 0
+        self.last_timestamp = None
+        self.interval = 0.0  # Smoothed inter arrival time in seconds
+        self.jitter = 0.0  # Smoothed absolute deviation of the inter arrival time in seconds
+        self.decode_ns_total = 0
+        self.decode_ns = [0] * DECODE_TIME_SAMPLES  # Ring of the latest decode times
+
+
+class CAN_Bus_Metrics:
+    """Bus and decoder statistics of the Mobil Eye parser"""
+
+    def __init__(self, message_names=None, interface=None, prefix='mobileye_can'):
+        """
+        Create empty metrics
+
+        Args:
+            message_names: arbitration id -> DBC message name, used as a label
+            interface: socketcan interface whose drop counters are exported, e.g. 'vcan0'
+            prefix: Prefix of the metric names
+        """
+        self.message_names = {} if message_names is None else message_names
+        self.interface = interface
+        self.prefix = prefix
+        self.ids = {}
+        self.unknown_frames = 0
+        # name -> (help, function, type) of extra metrics read at scrape time, e.g. queue depths
+        self.gauges = {}
+        self.start_time = time.time()
+
+    def record(self, arbitration_id, timestamp, decode_ns, error=False):
+        " Account one received frame, called by the parser for every frame of a handled id"
+        stats = self.ids.get(arbitration_id)
+        if stats is None:
+            stats = self.ids[arbitration_id] = ID_Statistics()
+
+        if stats.last_timestamp is not None:
+            interval = timestamp - stats.last_timestamp
+            if stats.frames == 1:
+                stats.interval = interval
+            stats.jitter += (abs(interval - stats.interval) - stats.jitter) * INTERVAL_GAIN
+            stats.interval += (interval - stats.interval) * INTERVAL_GAIN
+        stats.last_timestamp = timestamp
+
+        stats.decode_ns[stats.frames & (DECODE_TIME_SAMPLES - 1)] = decode_ns
+        stats.decode_ns_total += decode_ns
+        stats.frames += 1
+        if error:
+            stats.errors += 1
+
+    def add_gauge(self, name, help_text, function, metric_type='gauge'):
+        " Export the value returned by function() as <prefix>_<name>, metric_type 'counter' for totals"
+        self.gauges[name] = (help_text, function, metric_type)
+
+    def read_socketcan_counters(self):
+        " Interface statistics of the socketcan interface, empty if unknown or not on Linux"
+        counters = {}
+        if not self.interface:
+            return counters
+        statistics_dir = os.path.join('/sys/class/net', self.interface, 'statistics')
+        for counter in SOCKETCAN_COUNTERS:
+            try:
+                with open(os.path.join(statistics_dir, counter)) as counter_file:
+                    counters[counter] = int(counter_file.read())
+            except (OSError, ValueError):
+                continue
+        return counters
+
+    def render(self):
+        " Current metrics in the Prometheus text exposition format"
+        prefix = self.prefix
+        ids = sorted(list(self.ids.items()))
+        lines = []
+
+        def metric(name, metric_type, help_text, samples):
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} {metric_type}")
+            for suffix, labels, value in samples:
+                label_text = ",".join(f'{key}="{label}"' for key, label in labels.items())
+                lines.append(f"{prefix}_{name}{suffix}{{{label_text}}} {value}" if label_text
+                             else f"{prefix}_{name}{suffix} {value}")
+
+        def id_labels(arbitration_id):
+            return {'id': f"0x{arbitration_id:03X}", 'message': self.message_names.get(arbitration_id, '')}
+
+        metric('frames_total', 'counter', "Frames received per arbitration id",
+               [('', id_labels(arbitration_id), stats.frames) for arbitration_id, stats in ids])
+        metric('decode_errors_total', 'counter', "Frames that failed to decode per arbitration id",
+               [('', id_labels(arbitration_id), stats.errors) for arbitration_id, stats in ids])
+        metric('frames_per_second', 'gauge', "Frame rate per arbitration id from the smoothed inter arrival time",
+               [('', id_labels(arbitration_id), f"{1 / stats.interval:.3f}" if stats.interval > 0 else 0)
+                for arbitration_id, stats in ids])
+        metric('interval_seconds', 'gauge', "Smoothed inter arrival time per arbitration id",
+               [('', id_labels(arbitration_id), f"{stats.interval:.6f}") for arbitration_id, stats in ids])
+        metric('jitter_seconds', 'gauge', "Smoothed absolute deviation of the inter arrival time per arbitration id",
+               [('', id_labels(arbitration_id), f"{stats.jitter:.6f}") for arbitration_id, stats in ids])
+
+        decode_samples = []
+        for arbitration_id, stats in ids:
+            count = min(stats.frames, DECODE_TIME_SAMPLES)
+            if count:
+                quantiles = np.quantile(np.array(stats.decode_ns[:count]) / 1e9, DECODE_TIME_QUANTILES)
+                for quantile, value in zip(DECODE_TIME_QUANTILES, quantiles):
+                    decode_samples.append(('', {**id_labels(arbitration_id), 'quantile': quantile}, f"{value:.9f}"))
+            decode_samples.append(('_sum', id_labels(arbitration_id), f"{stats.decode_ns_total / 1e9:.9f}"))
+            decode_samples.append(('_count', id_labels(arbitration_id), stats.frames))
+        metric('decode_seconds', 'summary', f"Decode time per arbitration id, quantiles of the last {DECODE_TIME_SAMPLES} frames",
+               decode_samples)
+
+        metric('unknown_frames_total', 'counter', "Frames with an arbitration id not handled by the parser",
+               [('', {}, self.unknown_frames)])
+
+        socketcan_counters = self.read_socketcan_counters()
+        for counter, value in socketcan_counters.items():
+            lines.append(f"# HELP {prefix}_socketcan_{counter}_total Interface statistics {counter} from /sys")
+            lines.append(f"# TYPE {prefix}_socketcan_{counter}_total counter")
+            lines.append(f'{prefix}_socketcan_{counter}_total{{interface="{self.interface}"}} {value}')
+
+        for name, (help_text, function, metric_type) in list(self.gauges.items()):
+            metric(name, metric_type, help_text, [('', {}, function())])
+
+        metric('uptime_seconds', 'gauge', "Seconds since the metrics were created",
+               [('', {}, f"{time.time() - self.start_time:.1f}")])
+        return "\n".join(lines) + "\n"
+
+
+def add_metrics_route(server, metrics, path='/metrics'):
+    " Serve the metrics from a Flask server, e.g. the server of a Dash app"
+    from flask import Response
+
+    def metrics_endpoint():
+        return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+    server.add_url_rule(path, 'metrics', metrics_endpoint)
+
+
+def serve_metrics(metrics, host='0.0.0.0', port=8051, path='/metrics'):
+    " Serve the metrics from a standard library HTTP server thread, for processes without a Flask server"
+    class Metrics_Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != path:
+                self.send_error(404)
+                return
+            body = metrics.render().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            # Scrapes are not worth a line on stderr each
+            pass
+
+    server = ThreadingHTTPServer((host, port), Metrics_Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
@@ -0,0 +1,79 @@
+# Author: Navneet Singh
+# can_bus_metrics_unit_test.py
+# Checks the per id bus statistics and their Prometheus text rendering
+#
+# Usage:
+#   python3 -m pytest can_bus_metrics_unit_test.py
+#   python3 can_bus_metrics_unit_test.py
+
+import urllib.error
+import urllib.request
+
+from can_bus_metrics import CAN_Bus_Metrics, serve_metrics
+
+
+def test_rate_and_jitter():
+    metrics = CAN_Bus_Metrics({0x268: 'ME_Right_Lane_A'})
+
+    # Steady 50 ms period: 20 frames/s and no jitter
+    for index in range(100):
+        metrics.record(0x268, index * 0.05, 2000)
+    stats = metrics.ids[0x268]
+    assert stats.frames == 100
+    assert abs(stats.interval - 0.05) < 1e-9
+    assert stats.jitter < 1e-9
+
+    # Alternating 40 / 60 ms keeps the rate and raises the jitter towards 10 ms
+    timestamp = 5.0
+    for index in range(200):
+        timestamp += 0.04 if index % 2 else 0.06
+        metrics.record(0x268, timestamp, 2000, error=index == 0)
+    assert abs(stats.interval - 0.05) < 0.002
+    assert 0.008 < stats.jitter < 0.011
+    assert stats.errors == 1
+
+
+def test_prometheus_text():
+    metrics = CAN_Bus_Metrics({0x268: 'ME_Right_Lane_A'})
+    for index in range(10):
+        metrics.record(0x268, index * 0.05, 1000 * (index + 1))
+    metrics.unknown_frames = 3
+    metrics.add_gauge('frame_queue_batches', "Frame batches waiting to be decoded", lambda: 7)
+
+    lines = metrics.render().splitlines()
+    labels = 'id="0x268",message="ME_Right_Lane_A"'
+    assert f'mobileye_can_frames_total{{{labels}}} 10' in lines
+    assert f'mobileye_can_frames_per_second{{{labels}}} 20.000' in lines
+    assert f'mobileye_can_decode_seconds_count{{{labels}}} 10' in lines
+    assert f'mobileye_can_decode_seconds_sum{{{labels}}} 0.000055000' in lines
+    assert f'mobileye_can_decode_seconds{{{labels},quantile="0.5"}} 0.000005500' in lines
+    assert 'mobileye_can_unknown_frames_total 3' in lines
+    assert 'mobileye_can_frame_queue_batches 7' in lines
+    assert '# TYPE mobileye_can_decode_seconds summary' in lines
+
+
+def test_standalone_server():
+    metrics = CAN_Bus_Metrics({0x268: 'ME_Right_Lane_A'})
+    metrics.record(0x268, 0.0, 1000)
+    server = serve_metrics(metrics, host='127.0.0.1', port=0)
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}"
+        with urllib.request.urlopen(url + '/metrics') as response:
+            assert response.headers['Content-Type'].startswith('text/plain')
+            assert 'mobileye_can_frames_total{id="0x268",message="ME_Right_Lane_A"} 1' in response.read().decode()
+        try:
+            urllib.request.urlopen(url + '/other')
+        except urllib.error.HTTPError as e:
+            assert e.code == 404
+        else:
+            raise AssertionError("unknown path was served")
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    test_rate_and_jitter()
+    test_prometheus_text()
+    test_standalone_server()
+    print("All metrics tests passed")
@@ -0,0 +1,284 @@
+# Author: Navneet Singh
+# can_capture.py
+# Raw CAN capture in a compact binary format, read back zero copy with np.memmap
+#
+# A candump -l line takes about 46 bytes per frame and has to be parsed; a
+# capture record takes 24 and is read as is. Layout of a .cancap file:
+#   header  64 bytes: magic, record size, index stride, record count, index offset, channel
+#   records CAPTURE_DTYPE, in capture order
+#   index   (timestamp, record) of every index_stride-th record
+#
+# The record count and the index offset are written by Capture_Writer.close().
+# A capture that was not closed (power loss on the vehicle) still reads: the
+# count comes from the file size and the index is rebuilt in memory.
+#
+# Usage:
+#   python3 can_capture.py to-capture CAN_LOGs/candump-2025-06-24_094342.log drive.cancap
+#   python3 can_capture.py to-candump drive.cancap drive.log
+#   python3 can_capture.py info drive.cancap
+
+import argparse
+import os
+import struct
+import time
+
+import numpy as np
+
+from can_log_batch_decoder import Candump_Frames, load_candump_log
+from candump_log_reader import Candump_Log_Reader
+
+CAPTURE_SUFFIX = '.cancap'
+CAPTURE_MAGIC = b'CANCAP01'
+# magic, record size, index stride, record count, index offset, channel, reserved
+CAPTURE_HEADER = struct.Struct('<8sIIQQ16s16x')
+
+# Frame flags
+FLAG_EXTENDED_ID = 0x01
+FLAG_REMOTE = 0x02
+FLAG_ERROR = 0x04
+
+# One frame, 24 bytes so every timestamp is 8 byte aligned
+CAPTURE_DTYPE = np.dtype([
+    ('timestamp', '<f8'),
+    ('arbitration_id', '<u4'),
+    ('dlc', 'u1'),
+    ('flags', 'u1'),
+    ('reserved', '<u2'),
+    ('data', 'u1', (8,)),
+])
+CAPTURE_RECORD = struct.Struct('<dIBB2x8s')
+
+INDEX_DTYPE = np.dtype([('timestamp', '<f8'), ('record', '<u8')])
+
+# Records per write and per index entry
+BATCH_SIZE = 4096
+INDEX_STRIDE = 4096
+
+
+def is_capture_file(file_name):
+    return str(file_name).endswith(CAPTURE_SUFFIX)
+
+
+class Capture_Writer:
+    """Writes frames to a capture file in batches of preallocated records"""
+
+    def __init__(self, file_name, batch_size=BATCH_SIZE, index_stride=INDEX_STRIDE, channel='can0'):
+        """
+        Create the capture file, call close() to write the index
+
+        Args:
+            file_name: Capture file, overwritten if it exists
+            batch_size: Records buffered before they are written
+            index_stride: Records per time index entry
+            channel: Interface name written back by capture_to_candump
+        """
+        self.file_name = file_name
+        self.batch_size = batch_size
+        self.index_stride = index_stride
+        self.channel = channel
+        self.count = 0  # Records written, buffered ones included
+        self._buffer = bytearray(batch_size * CAPTURE_RECORD.size)
+        self._buffered = 0
+        self._pack_into = CAPTURE_RECORD.pack_into
+        self._index = []  # (timestamp, record) pairs
+        self._file = open(file_name, 'wb')
+        self._file.write(self.header(0, 0))
+
+    def header(self, record_count, index_offset):
+        return CAPTURE_HEADER.pack(CAPTURE_MAGIC, CAPTURE_RECORD.size, self.index_stride, record_count, index_offset,
+                                   self.channel.encode('ascii')[:16])
+
+    def write(self, msg):
+        " Append one can.Message"
+        if self.count % self.index_stride == 0:
+            self._index.append((msg.timestamp, self.count))
+        flags = (FLAG_EXTENDED_ID if msg.is_extended_id else 0) | (FLAG_REMOTE if msg.is_remote_frame else 0) \
+            | (FLAG_ERROR if msg.is_error_frame else 0)
+        self._pack_into(self._buffer, self._buffered * CAPTURE_RECORD.size,
+                        msg.timestamp, msg.arbitration_id, msg.dlc, flags, msg.data)
+        self._buffered += 1
+        self.count += 1
+        if self._buffered == self.batch_size:
+            self.flush()
+
+    def write_messages(self, messages):
+        " Append an iterable of can.Message, e.g. a bus batch"
+        for msg in messages:
+            self.write(msg)
+
+    def write_frames(self, frames, flags=None):
+        """
+        Append columnar frames in one write
+
+        Args:
+            frames: Candump_Frames, e.g. from load_candump_log
+            flags: Flags per frame, by default only the extended id flag of frames.is_extended
+        """
+        self.flush()
+        records = np.zeros(len(frames), dtype=CAPTURE_DTYPE)
+        records['timestamp'] = frames.timestamps
+        records['arbitration_id'] = frames.arbitration_ids
+        records['dlc'] = frames.dlc
+        records['flags'] = np.where(frames.is_extended, FLAG_EXTENDED_ID, 0) if flags is None else flags
+        records['data'] = frames.payloads
+        # Index entries of the records that land on the stride
+        first = -self.count % self.index_stride
+        for record in range(first, len(records), self.index_stride):
+            self._index.append((float(records['timestamp'][record]), self.count + record))
+        self._file.write(records.tobytes())
+        self.count += len(records)
+
+    def flush(self):
+        " Write the buffered records"
+        if self._buffered:
+            self._file.write(memoryview(self._buffer)[:self._buffered * CAPTURE_RECORD.size])
+            self._buffered = 0
+
+    def close(self):
+        " Write the buffered records, the time index and the final header"
+        if self._file.closed:
+            return
+        self.flush()
+        index_offset = CAPTURE_HEADER.size + self.count * CAPTURE_RECORD.size
+        self._file.write(np.array(self._index, dtype=INDEX_DTYPE).tobytes())
+        self._file.seek(0)
+        self._file.write(self.header(self.count, index_offset))
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class Capture_File:
+    """Memory mapped capture file"""
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+        size = os.path.getsize(file_name)
+        with open(file_name, 'rb') as capture_file:
+            header = capture_file.read(CAPTURE_HEADER.size)
+        if len(header) < CAPTURE_HEADER.size:
+            raise ValueError(f"{file_name} is not a capture file")
+        magic, record_size, self.index_stride, count, index_offset, channel = CAPTURE_HEADER.unpack(header)
+        if magic != CAPTURE_MAGIC or record_size != CAPTURE_DTYPE.itemsize:
+            raise ValueError(f"{file_name} is not a capture file of this version")
+        self.channel = channel.rstrip(b'\0').decode('ascii')
+
+        if not index_offset:
+            # Not closed, the complete records are all there is
+            count = (size - CAPTURE_HEADER.size) // CAPTURE_DTYPE.itemsize
+        self.records = (np.memmap(file_name, dtype=CAPTURE_DTYPE, mode='r', offset=CAPTURE_HEADER.size, shape=(count,))
+                        if count else np.zeros(0, dtype=CAPTURE_DTYPE))
+        if index_offset:
+            index_count = (size - index_offset) // INDEX_DTYPE.itemsize
+            self.index = (np.memmap(file_name, dtype=INDEX_DTYPE, mode='r', offset=index_offset, shape=(index_count,))
+                          if index_count else np.zeros(0, dtype=INDEX_DTYPE))
+        else:
+            self.index = np.zeros(-(-count // self.index_stride), dtype=INDEX_DTYPE)
+            self.index['record'] = np.arange(0, count, self.index_stride)
+            self.index['timestamp'] = self.records['timestamp'][::self.index_stride]
+
+    def __len__(self):
+        return len(self.records)
+
+    def frames(self, start=0, stop=None):
+        " Candump_Frames of the records start:stop, the columns but is_extended are views of the memory map"
+        records = self.records[start:stop]
+        return Candump_Frames(records['timestamp'], records['arbitration_id'], records['dlc'], records['data'],
+                              (records['flags'] & FLAG_EXTENDED_ID) != 0)
+
+    def find(self, timestamp, side='left'):
+        " Position of the timestamp in the records as np.searchsorted, the index narrows the search to one stride"
+        entry = int(np.searchsorted(self.index['timestamp'], timestamp, side))
+        low = int(self.index['record'][entry - 1]) if entry > 0 else 0
+        high = int(self.index['record'][entry]) + 1 if entry < len(self.index) else len(self.records)
+        return low + int(np.searchsorted(self.records['timestamp'][low:high], timestamp, side))
+
+    def between(self, start_time, end_time):
+        " Candump_Frames from start_time up to and including end_time, the capture is in time order"
+        return self.frames(self.find(start_time, 'left'), self.find(end_time, 'right'))
+
+
+def load_capture(file_name, start=0, end=None):
+    """
+    Load a capture file into columnar frames, the drop in for load_candump_log
+
+    Args:
+        file_name: Capture file
+        start: Byte offset, the records starting at or after it are loaded
+        end: Byte offset, the records starting before it are loaded.
+             Consecutive ranges split a capture without losing or repeating a record.
+    """
+    capture = Capture_File(file_name)
+    first = max(0, -(-(start - CAPTURE_HEADER.size) // CAPTURE_DTYPE.itemsize))
+    last = len(capture) if end is None else max(0, -(-(end - CAPTURE_HEADER.size) // CAPTURE_DTYPE.itemsize))
+    return capture.frames(first, min(last, len(capture)))
+
+
+def candump_to_capture(log_file, capture_file, channel=None):
+    " Convert a candump -l log, returns the number of frames, the channel is that of the log by default"
+    if channel is None:
+        with Candump_Log_Reader(log_file) as reader:
+            channel = reader.channel or 'can0'
+    frames = load_candump_log(log_file)
+    with Capture_Writer(capture_file, channel=channel) as writer:
+        writer.write_frames(frames)
+    return len(frames)
+
+
+def capture_to_candump(capture_file, log_file, channel=None):
+    " Write a capture as a candump -l log, returns the number of frames"
+    capture = Capture_File(capture_file)
+    channel = channel or capture.channel
+    with open(log_file, 'w') as log:
+        for start in range(0, len(capture), 65536):
+            records = capture.records[start:start + 65536]
+            extended = (records['flags'] & FLAG_EXTENDED_ID) != 0
+            payloads = records['data'].tobytes()
+            for row, (timestamp, arbitration_id, dlc, is_extended) in enumerate(zip(
+                    records['timestamp'].tolist(), records['arbitration_id'].tolist(), records['dlc'].tolist(),
+                    extended.tolist())):
+                identifier = f"{arbitration_id:08X}" if is_extended else f"{arbitration_id:03X}"
+                data = payloads[row * 8:row * 8 + min(dlc, 8)].hex().upper()
+                log.write(f"({timestamp:.6f}) {channel} {identifier}#{data}\n")
+    return len(capture)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Convert between candump logs and binary CAN captures")
+    commands = arg_parser.add_subparsers(dest='command', required=True)
+    to_capture = commands.add_parser('to-capture', help="candump -l log to capture")
+    to_capture.add_argument('log_file')
+    to_capture.add_argument('capture_file')
+    to_capture.add_argument('--channel', help="Interface name stored in the capture, the one of the log by default")
+    to_candump = commands.add_parser('to-candump', help="Capture to candump -l log")
+    to_candump.add_argument('capture_file')
+    to_candump.add_argument('log_file')
+    to_candump.add_argument('--channel', help="Interface name of the log lines, the captured one by default")
+    info = commands.add_parser('info', help="Frames and time span of a capture")
+    info.add_argument('capture_file')
+    args = arg_parser.parse_args()
+
+    start = time.perf_counter()
+    if args.command == 'to-capture':
+        count = candump_to_capture(args.log_file, args.capture_file, args.channel)
+        source, target = args.log_file, args.capture_file
+    elif args.command == 'to-candump':
+        count = capture_to_candump(args.capture_file, args.log_file, args.channel)
+        source, target = args.capture_file, args.log_file
+    else:
+        capture = Capture_File(args.capture_file)
+        timestamps = capture.records['timestamp']
+        span = float(timestamps[-1] - timestamps[0]) if len(capture) else 0.0
+        print(f"{args.capture_file}: {len(capture)} frames on {capture.channel} over {span:.1f} s, "
+              f"{len(capture.index)} index entries")
+        return
+    print(f"Converted {count} frames in {time.perf_counter() - start:.2f} s: "
+          f"{os.path.getsize(source) / 1e6:.1f} MB -> {os.path.getsize(target) / 1e6:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+# Author: Navneet Singh
+# can_capture_unit_test.py
+# Checks the capture format round trips frames and candump logs and finds time ranges through the index
+#
+# Usage:
+#   python3 -m pytest can_capture_unit_test.py
+#   python3 can_capture_unit_test.py
+
+import os
+import tempfile
+
+import can
+import numpy as np
+
+from can_capture import (CAPTURE_HEADER, FLAG_EXTENDED_ID, Capture_File, Capture_Writer, candump_to_capture,
+                         capture_to_candump, load_capture)
+from can_log_batch_decoder import load_candump_log
+
+
+def make_messages(count):
+    return [can.Message(timestamp=1750786342.0 + index * 0.001, arbitration_id=0x700 + index % 16,
+                        data=bytes((index + byte) % 256 for byte in range(index % 9)))
+            for index in range(count)]
+
+
+def test_round_trip(tmp_path):
+    file_name = os.path.join(tmp_path, "frames.cancap")
+    messages = make_messages(1000)
+    messages[5].is_extended_id = True
+    messages[5].arbitration_id = 0x18FF1234
+    # An extended id below 0x800 stays extended
+    messages[6].is_extended_id = True
+    with Capture_Writer(file_name, batch_size=64, index_stride=100) as writer:
+        writer.write_messages(messages)
+    assert os.path.getsize(file_name) == CAPTURE_HEADER.size + 1000 * 24 + 10 * 16
+
+    capture = Capture_File(file_name)
+    assert len(capture) == 1000 and len(capture.index) == 10
+    frames = capture.frames()
+    assert np.array_equal(frames.timestamps, [msg.timestamp for msg in messages])
+    assert frames.arbitration_ids[5] == 0x18FF1234 and capture.records['flags'][5] == FLAG_EXTENDED_ID
+    assert frames.is_extended.tolist() == [msg.is_extended_id for msg in messages]
+    assert frames.dlc[17] == 8 and bytes(frames.payloads[17]) == bytes(messages[17].data)
+    assert bytes(frames.payloads[10][:1]) == bytes(messages[10].data) and not frames.payloads[10][1:].any()
+
+    # Time ranges through the sparse index, both ends included
+    selected = capture.between(messages[250].timestamp, messages[612].timestamp)
+    assert len(selected) == 363 and selected.timestamps[0] == messages[250].timestamp
+    assert len(capture.between(0.0, 1.0)) == 0 and len(capture.between(0.0, 2e9)) == 1000
+
+    # Consecutive byte ranges split the records exactly
+    size = os.path.getsize(file_name)
+    parts = [load_capture(file_name, size * part // 3, size * (part + 1) // 3) for part in range(3)]
+    assert sum(len(part) for part in parts) == 1000
+    assert np.array_equal(np.concatenate([part.timestamps for part in parts]), frames.timestamps)
+
+    # A capture that was never closed reads up to its last complete record
+    unclosed = Capture_Writer(os.path.join(tmp_path, "unclosed.cancap"), batch_size=64, index_stride=100)
+    unclosed.write_messages(messages[:300])
+    unclosed.flush()
+    unclosed._file.flush()
+    capture = Capture_File(unclosed.file_name)
+    assert len(capture) == 300 and len(capture.index) == 3
+    assert len(capture.between(messages[10].timestamp, messages[19].timestamp)) == 10
+    unclosed.close()
+
+
+def test_candump_conversion(tmp_path):
+    log_file = os.path.join(tmp_path, "frames.log")
+    with open(log_file, 'w') as log:
+        for index, msg in enumerate(make_messages(500)):
+            # Every seventh frame has a 29 bit identifier
+            identifier = f"{msg.arbitration_id:08X}" if index % 7 == 3 else f"{msg.arbitration_id:03X}"
+            log.write(f"({msg.timestamp:.6f}) can1 {identifier}#{msg.data.hex().upper()}\n")
+
+    # The channel is taken from the log
+    capture_file = os.path.join(tmp_path, "frames.cancap")
+    assert candump_to_capture(log_file, capture_file) == 500
+    assert Capture_File(capture_file).channel == 'can1'
+    frames = load_capture(capture_file)
+    expected = load_candump_log(log_file)
+    assert expected.is_extended.sum() == 71
+    for column in ('timestamps', 'arbitration_ids', 'dlc', 'payloads', 'is_extended'):
+        assert np.array_equal(getattr(frames, column), getattr(expected, column))
+
+    # Back to the identical text
+    round_trip = os.path.join(tmp_path, "round_trip.log")
+    assert capture_to_candump(capture_file, round_trip) == 500
+    with open(log_file) as original, open(round_trip) as converted:
+        assert original.read() == converted.read()
+
+
+if __name__ == '__main__':
+    # pytest passes tmp_path, here every test gets a directory that is removed afterwards
+    for test in (test_round_trip, test_candump_conversion):
+        with tempfile.TemporaryDirectory() as tmp_path:
+            test(tmp_path)
+    print("All tests passed")
@@ -0,0 +1,285 @@
+# Author: Navneet Singh
+# can_log_batch_decoder.py
+# Offline batch decoding of candump log files with NumPy
+#
+# Instead of replaying a log with canplayer into vcan0 and decoding it frame
+# by frame, the whole log is loaded into flat arrays (timestamps, ids, a
+# uint8[N, 8] payload matrix) and every DBC signal is decoded for all frames
+# of a message in one vectorised pass.
+#
+# Usage:
+#   python3 can_log_batch_decoder.py CAN_LOGs/candump-2025-06-24_094342.log --output decoded.npz
+
+import argparse
+import mmap
+import os
+import re
+import time
+from dataclasses import dataclass
+
+import numpy as np
+import cantools
+from cantools.database.conversion import IdentityConversion
+
+from can_signal_decoder import Signal_Layout, is_compilable
+
+DBC_FILE = os.path.join(os.path.dirname(__file__), 'dbc_files', 'Zendar_Private_CAN.dbc')
+
+# candump -l line: (1750786342.123456) can0 268#0011223344556677
+# CAN FD (ID##) and remote (ID#R) frames do not match and are skipped
+CANDUMP_LINE_PATTERN = re.compile(rb'^\((\d+\.\d+)\) (\S+) ([0-9A-Fa-f]+)#([0-9A-Fa-f]{0,16})[ \t\r]*$', re.MULTILINE)
+
+
+@dataclass
+class Candump_Frames:
+    " Columnar frames of a candump log"
+    timestamps: np.ndarray  # float64[N] seconds
+    arbitration_ids: np.ndarray  # uint32[N]
+    dlc: np.ndarray  # uint8[N] payload length in bytes
+    payloads: np.ndarray  # uint8[N, 8] zero padded payload
+    is_extended: np.ndarray  # bool[N] 29 bit identifier, written with 8 hex digits in the log
+
+    def __len__(self):
+        return len(self.timestamps)
+
+
+# ASCII code -> hex nibble value, -1 for non hex characters
+HEX_NIBBLES = np.full(256, -1, dtype=np.int8)
+for _digit in b'0123456789abcdef':
+    HEX_NIBBLES[_digit] = int(chr(_digit), 16)
+    HEX_NIBBLES[ord(chr(_digit).upper())] = int(chr(_digit), 16)
+
+
+def parse_candump_text(text):
+    " Parse candump -l formatted bytes into columnar frames"
+    frames = parse_candump_columns(np.frombuffer(text, dtype=np.uint8))
+    if frames is None:
+        frames = parse_candump_lines(text)
+    return frames
+
+
+def parse_candump_lines(text):
+    " Regex based parser, handles any mix of line layouts"
+    matches = CANDUMP_LINE_PATTERN.findall(text)
+
+    timestamps = np.array([match[0] for match in matches], dtype=np.float64)
+    arbitration_ids = np.array([int(match[2], 16) for match in matches], dtype=np.uint32)
+    dlc = np.array([len(match[3]) // 2 for match in matches], dtype=np.uint8)
+    is_extended = np.array([len(match[2]) > 3 for match in matches], dtype=bool)
+
+    payload_hex = b''.join(match[3].ljust(16, b'0') for match in matches)
+    payloads = np.frombuffer(bytes.fromhex(payload_hex.decode('ascii')), dtype=np.uint8).reshape(-1, 8)
+
+    return Candump_Frames(timestamps, arbitration_ids, dlc, payloads, is_extended)
+
+
+def parse_candump_columns(buffer):
+    """
+    Vectorised parser for the common case of a log with one classic CAN frame per line
+    and a fixed width timestamp, returns None when the log needs the line by line parser
+    """
+    if len(buffer) == 0:
+        return None
+
+    newlines = np.flatnonzero(buffer == ord('\n'))
+    starts = np.concatenate(([0], newlines + 1))
+    ends = np.concatenate((newlines, [len(buffer)]))
+    keep = ends > starts
+    starts, ends = starts[keep], ends[keep]
+    ends = ends - (buffer[ends - 1] == ord('\r'))
+    line_count = len(starts)
+
+    # Every line needs exactly one '#' and two spaces: (timestamp) iface ID#DATA
+    def positions_per_line(character, expected):
+        positions = np.flatnonzero(buffer == ord(character))
+        if len(positions) != expected * line_count:
+            return None
+        positions = positions.reshape(line_count, expected)
+        if np.any(positions[:, 0] <= starts) or np.any(positions[:, -1] >= ends):
+            return None
+        return positions
+
+    hashes = positions_per_line('#', 1)
+    spaces = positions_per_line(' ', 2)
+    if hashes is None or spaces is None:
+        return None
+    hashes = hashes[:, 0]
+    closing = spaces[:, 0] - 1
+    if np.any(buffer[starts] != ord('(')) or np.any(buffer[closing] != ord(')')) or np.any(hashes < spaces[:, 1]):
+        return None
+
+    # Fixed size windows into the log, padded so windows never run off either end
+    padded = np.concatenate((np.zeros(8, dtype=np.uint8), buffer, np.zeros(24, dtype=np.uint8)))
+    windows = np.lib.stride_tricks.sliding_window_view(padded, 24)
+
+    # Timestamps: same width and decimal point position on every line
+    widths = closing - starts - 1
+    if np.any(widths != widths[0]) or not 3 <= widths[0] <= 18:
+        return None
+    width = int(widths[0])
+    characters = windows[starts + 9, :width]
+    dot = bytes(characters[0]).find(b'.')
+    if dot < 1 or dot == width - 1 or np.any(characters[:, dot] != ord('.')):
+        return None
+    digit_columns = [column for column in range(width) if column != dot]
+    digits = characters[:, digit_columns] - np.uint8(ord('0'))
+    if np.any(digits > 9):
+        return None
+    scaled = digits.astype(np.int64) @ (10 ** np.arange(len(digit_columns) - 1, -1, -1, dtype=np.int64))
+    timestamps = scaled / float(10 ** (width - dot - 1))
+
+    # Arbitration id: up to 8 hex characters before the '#'
+    id_lengths = hashes - spaces[:, 1] - 1
+    if np.any((id_lengths < 1) | (id_lengths > 8)):
+        return None
+    id_nibbles = HEX_NIBBLES[windows[hashes][:, :8]]
+    id_nibbles[np.arange(8) < (8 - id_lengths)[:, None]] = 0
+    if np.any(id_nibbles < 0):
+        return None
+    arbitration_ids = (id_nibbles.astype(np.uint32) << np.arange(28, -1, -4, dtype=np.uint32)).sum(axis=1, dtype=np.uint32)
+
+    # Payload: up to 16 hex characters after the '#'
+    data_lengths = ends - hashes - 1
+    if np.any((data_lengths > 16) | (data_lengths % 2 != 0)):
+        return None
+    data_nibbles = HEX_NIBBLES[windows[hashes + 9][:, :16]]
+    data_nibbles[np.arange(16) >= data_lengths[:, None]] = 0
+    if np.any(data_nibbles < 0):
+        return None
+    payloads = (data_nibbles[:, 0::2] * 16 + data_nibbles[:, 1::2]).astype(np.uint8)
+
+    return Candump_Frames(timestamps, arbitration_ids, (data_lengths // 2).astype(np.uint8), payloads, id_lengths > 3)
+
+
+def load_candump_log(file_name, start=0, end=None):
+    """
+    Load a candump log file into columnar frames
+
+    Args:
+        file_name: candump -l formatted log file
+        start: Byte offset to start from, moved forward to the next line start
+        end: Byte offset to stop at, the line that contains it is still loaded.
+             Consecutive ranges split a log without losing or repeating a line.
+    """
+    with open(file_name, 'rb') as log_file:
+        size = os.fstat(log_file.fileno()).st_size
+        if size == 0:
+            return parse_candump_text(b'')
+        with mmap.mmap(log_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            begin = line_start_at(mapped, start)
+            stop = size if end is None else line_start_at(mapped, min(end, size))
+            with memoryview(mapped)[begin:max(begin, stop)] as text:
+                return parse_candump_text(text)
+
+
+def line_start_at(mapped, position):
+    " Offset of the first line starting at or after the position"
+    if position <= 0:
+        return 0
+    newline = mapped.find(b'\n', position - 1)
+    return len(mapped) if newline < 0 else newline + 1
+
+
+def payload_words(payloads, message_length):
+    " Read the payload rows as big and little endian integers over the message length"
+    payloads = np.ascontiguousarray(payloads)
+    big = payloads.view('>u8').ravel() >> np.uint64(8 * (8 - message_length))
+    little = payloads.view('<u8').ravel()
+    if message_length < 8:
+        little = little & np.uint64((1 << (8 * message_length)) - 1)
+    return big, little
+
+
+def decode_signal_column(signal, layout, big, little):
+    " Decode one signal for every payload word, integer scaling keeps integer columns"
+    words = big if layout.byte_order == 'big_endian' else little
+    raw = (words >> np.uint64(layout.shift)) & np.uint64(layout.mask)
+    raw = raw.astype(np.int64)
+
+    if layout.is_signed:
+        raw = np.where(raw & (1 << (layout.length - 1)), raw - (1 << layout.length), raw)
+
+    scale, offset = signal.conversion.scale, signal.conversion.offset
+    if isinstance(signal.conversion, IdentityConversion):
+        return raw
+    if isinstance(scale, int) and isinstance(offset, int):
+        return raw * scale + offset
+    return raw * float(scale) + float(offset)
+
+
+def decode_message_frames(message, frames):
+    """
+    Decode every frame of one DBC message in a single vectorised pass
+
+    Args:
+        message: cantools Message to decode
+        frames: Candump_Frames of a log
+
+    Returns:
+        Dict of signal name -> column array, plus 'timestamp' for the decoded frames.
+        Value tables are not applied, choice signals stay raw integers. Frames shorter
+        than the message are dropped the same way cantools refuses to decode them.
+    """
+    if not is_compilable(message):
+        raise ValueError(f"Message {message.name} cannot be batch decoded")
+
+    # A 29 bit identifier with the value of a standard message id is another message
+    selected = (frames.arbitration_ids == message.frame_id) & (frames.is_extended == message.is_extended_frame) \
+        & (frames.dlc >= message.length)
+    big, little = payload_words(frames.payloads[selected], message.length)
+
+    columns = {'timestamp': frames.timestamps[selected]}
+    for signal in message.signals:
+        layout = Signal_Layout(signal, message.length)
+        columns[signal.name] = decode_signal_column(signal, layout, big, little)
+    return columns
+
+
+def decode_frames(database, frames):
+    " Decode all DBC messages present in the frames, keyed by message name"
+    present_ids = set(np.unique(frames.arbitration_ids).tolist())
+    return {
+        message.name: decode_message_frames(message, frames)
+        for message in database.messages
+        if message.frame_id in present_ids and is_compilable(message)
+    }
+
+
+def save_decoded(file_name, decoded):
+    " Save decoded columns to a .npz file with <message>.<signal> keys"
+    np.savez(file_name, **{
+        f"{message_name}.{column}": values
+        for message_name, columns in decoded.items()
+        for column, values in columns.items()
+    })
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Decode a candump log with the Mobil Eye DBC")
+    arg_parser.add_argument('log_file', help="candump -l formatted log file or .cancap capture")
+    arg_parser.add_argument('--dbc', default=DBC_FILE, help="DBC file used for decoding")
+    arg_parser.add_argument('--output', help="Write the decoded columns to this .npz file")
+    args = arg_parser.parse_args()
+
+    database = cantools.database.load_file(args.dbc)
+
+    # Imported here, can_capture builds on this module
+    from can_capture import is_capture_file, load_capture
+
+    start = time.perf_counter()
+    frames = load_capture(args.log_file) if is_capture_file(args.log_file) else load_candump_log(args.log_file)
+    loaded = time.perf_counter()
+    decoded = decode_frames(database, frames)
+    finished = time.perf_counter()
+
+    print(f"Loaded {len(frames)} frames in {loaded - start:.3f} s, decoded {len(decoded)} messages in {finished - loaded:.3f} s")
+    for message_name, columns in decoded.items():
+        print(f"  {message_name:<30} {len(columns['timestamp']):>8} frames")
+
+    if args.output:
+        save_decoded(args.output, decoded)
+        print(f"Saved decoded columns to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+# Author: Navneet Singh
+# can_log_batch_decoder_unit_test.py
+# Checks the vectorised log parser and batch decoder are bit exact with the regex parser and cantools
+#
+# Usage:
+#   python3 -m pytest can_log_batch_decoder_unit_test.py
+#   python3 can_log_batch_decoder_unit_test.py
+
+import os
+import random
+import tempfile
+
+import cantools
+import numpy as np
+
+from can_log_batch_decoder import (DBC_FILE, decode_frames, load_candump_log, parse_candump_columns,
+                                   parse_candump_lines)
+
+
+def make_log_lines(database, count, seed=0):
+    """
+    Random payloads of every DBC message, mixed with extended id frames (some with the
+    value of a DBC id) and frames shorter than their message, as (timestamp, id text, payload) tuples
+    """
+    rng = random.Random(seed)
+    messages = database.messages
+    lines = []
+    for index in range(count):
+        timestamp = f"{1750786342 + index * 0.001:.6f}"
+        if index % 34 == 5:
+            identifier, length = f"{0x18FF0000 + index:08X}", 8
+        elif index % 34 == 22:
+            identifier, length = f"{messages[index % len(messages)].frame_id:08X}", 8
+        else:
+            message = messages[index % len(messages)]
+            identifier = f"{message.frame_id:03X}"
+            length = rng.randrange(0, message.length) if index % 13 == 3 else message.length
+        lines.append((timestamp, identifier, bytes(rng.getrandbits(8) for _ in range(length))))
+    return lines
+
+
+def to_text(lines):
+    return "".join(f"({timestamp}) can0 {identifier}#{data.hex().upper()}\n"
+                   for timestamp, identifier, data in lines).encode('ascii')
+
+
+def assert_same_frames(frames, expected):
+    for column in ('timestamps', 'arbitration_ids', 'dlc', 'payloads', 'is_extended'):
+        assert np.array_equal(getattr(frames, column), getattr(expected, column)), column
+
+
+def test_columns_match_lines():
+    database = cantools.database.load_file(DBC_FILE)
+    text = to_text(make_log_lines(database, 2000))
+    frames = parse_candump_columns(np.frombuffer(text, dtype=np.uint8))
+    assert frames is not None and len(frames) == 2000
+    assert_same_frames(frames, parse_candump_lines(text))
+    # Extended by the id width, not by the value
+    assert frames.is_extended[5] and frames.is_extended[22] and frames.arbitration_ids[22] <= 0x7FF
+    assert not frames.is_extended[0]
+
+    # Lines the column parser cannot handle fall back to the regex parser, which skips
+    # CAN FD and remote frames and keeps the rest
+    mixed = text + b"(1750786400.000000) can0 268##1001122\n(1750786400.1) can0 268#R\n\n" \
+        + b"(1750786400.200000) can0 268#0011223344556677\n"
+    assert parse_candump_columns(np.frombuffer(mixed, dtype=np.uint8)) is None
+    frames = parse_candump_lines(mixed)
+    assert len(frames) == 2001 and frames.arbitration_ids[-1] == 0x268 and frames.dlc[-1] == 8
+
+
+def test_decode_matches_cantools(tmp_path):
+    database = cantools.database.load_file(DBC_FILE)
+    lines = make_log_lines(database, 3000, seed=1)
+    log_file = os.path.join(tmp_path, "frames.log")
+    with open(log_file, 'wb') as log:
+        log.write(to_text(lines))
+
+    decoded = decode_frames(database, load_candump_log(log_file))
+    for message in database.messages:
+        columns = decoded[message.name]
+        expected = []
+        for timestamp, identifier, data in lines:
+            if int(identifier, 16) != message.frame_id or len(identifier) > 3:
+                continue
+            if len(data) < message.length:
+                # Short frames are dropped, cantools refuses them too
+                try:
+                    database.decode_message(message.frame_id, data, decode_choices=False)
+                except Exception:
+                    continue
+                raise AssertionError(f"cantools decoded a short {message.name} frame")
+            expected.append((float(timestamp), database.decode_message(message.frame_id, data, decode_choices=False)))
+
+        assert len(columns['timestamp']) == len(expected) > 0
+        assert np.array_equal(columns['timestamp'], [timestamp for timestamp, _ in expected])
+        for signal in message.signals:
+            values = [signals[signal.name] for _, signals in expected]
+            # Same values and the same int or float type per value
+            assert columns[signal.name].tolist() == values, signal.name
+            assert [type(value) for value in columns[signal.name].tolist()] == [type(value) for value in values]
+
+    # Extended id frames are not DBC messages, even with the value of a DBC id
+    assert sum(len(columns['timestamp']) for columns in decoded.values()) \
+        == sum(len(data) >= 8 and len(identifier) == 3 for _, identifier, data in lines)
+
+
+if __name__ == '__main__':
+    test_columns_match_lines()
+    # pytest passes tmp_path, here the test gets a directory that is removed afterwards
+    with tempfile.TemporaryDirectory() as tmp_path:
+        test_decode_matches_cantools(tmp_path)
+    print("All tests passed")
@@ -0,0 +1,150 @@
+# Author: Navneet Singh
+# can_log_batch_runner.py
+# Parallel decoding of a directory of candump logs
+#
+# Log files are split into shards (a whole file, or a line aligned byte
+# range of a large file) which are decoded on a process pool with the NumPy
+# batch decoder. The per shard columns are merged into one time ordered set
+# of columns per DBC message. Binary captures (can_capture.py) are split
+# into record aligned byte ranges the same way.
+#
+# Usage:
+#   python3 can_log_batch_runner.py CAN_LOGs/ --output decoded.npz
+#   python3 can_log_batch_runner.py "CAN_LOGs/candump-2025-06-24_*.log" --workers 8
+
+import argparse
+import glob
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import cantools
+
+from can_capture import CAPTURE_SUFFIX, is_capture_file, load_capture
+from can_log_batch_decoder import DBC_FILE, decode_frames, load_candump_log, save_decoded
+
+# Database of the worker process, loaded once by init_worker
+worker_database = None
+
+
+def init_worker(dbc_file):
+    global worker_database
+    worker_database = cantools.database.load_file(dbc_file)
+
+
+def decode_shard(shard):
+    " Decode one (file name, start, end) shard, runs in a worker process"
+    file_name, start, end = shard
+    load = load_capture if is_capture_file(file_name) else load_candump_log
+    frames = load(file_name, start, end)
+    return shard, len(frames), decode_frames(worker_database, frames)
+
+
+def find_log_files(paths):
+    " Expand directories (*.log and *.cancap inside) and glob patterns into a sorted list of files"
+    log_files = set()
+    for path in paths:
+        if os.path.isdir(path):
+            log_files.update(glob.glob(os.path.join(path, '*.log')))
+            log_files.update(glob.glob(os.path.join(path, '*' + CAPTURE_SUFFIX)))
+        elif glob.has_magic(path):
+            log_files.update(glob.glob(path))
+        elif os.path.isfile(path):
+            log_files.add(path)
+        else:
+            raise FileNotFoundError(f"No log file or directory: {path}")
+    return sorted(log_files)
+
+
+def make_shards(log_files, shard_size):
+    " Split the files into (file name, start, end) byte ranges of at most about shard_size bytes"
+    shards = []
+    for file_name in log_files:
+        size = os.path.getsize(file_name)
+        shard_count = max(1, -(-size // shard_size))
+        for index in range(shard_count):
+            shards.append((file_name, size * index // shard_count, size * (index + 1) // shard_count))
+    return shards
+
+
+def merge_decoded(decoded_shards):
+    " Concatenate the per shard columns of every message and sort them by timestamp"
+    merged = {}
+    message_names = sorted({name for decoded in decoded_shards for name in decoded})
+    for message_name in message_names:
+        parts = [decoded[message_name] for decoded in decoded_shards if message_name in decoded]
+        columns = {column: np.concatenate([part[column] for part in parts]) for column in parts[0]}
+        order = np.argsort(columns['timestamp'], kind='stable')
+        merged[message_name] = {column: values[order] for column, values in columns.items()}
+    return merged
+
+
+def decode_logs(log_files, dbc_file=DBC_FILE, workers=None, shard_size=8 << 20, progress=print):
+    """
+    Decode candump logs in parallel
+
+    Args:
+        log_files: Log files to decode
+        dbc_file: DBC file used for decoding
+        workers: Number of worker processes, defaults to the number of CPUs
+        shard_size: Files larger than this many bytes are split into byte range shards
+        progress: Called with a progress line after every finished shard, None to disable
+
+    Returns:
+        Dict of message name -> dict of signal name -> column, sorted by timestamp
+    """
+    shards = make_shards(log_files, shard_size)
+    shard_sizes = {shard: shard[2] - shard[1] for shard in shards}
+    total_bytes = sum(shard_sizes.values())
+
+    results = {}
+    done_bytes = 0
+    done_frames = 0
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(dbc_file,)) as executor:
+        futures = [executor.submit(decode_shard, shard) for shard in shards]
+        for future in as_completed(futures):
+            shard, frame_count, decoded = future.result()
+            results[shard] = decoded
+            done_bytes += shard_sizes[shard]
+            done_frames += frame_count
+
+            if progress:
+                elapsed = time.perf_counter() - start
+                progress(f"[{len(results)}/{len(shards)}] {done_bytes / 1e6:8.1f}/{total_bytes / 1e6:.1f} MB "
+                         f"{done_bytes / 1e6 / elapsed:7.1f} MB/s {done_frames / elapsed:>12,.0f} frames/s "
+                         f"{os.path.basename(shard[0])}")
+
+    # Merge in file and offset order so equal timestamps keep their log order
+    return merge_decoded([results[shard] for shard in shards])
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Decode candump logs in parallel with the Mobil Eye DBC")
+    arg_parser.add_argument('paths', nargs='+', help="Log files, directories or glob patterns")
+    arg_parser.add_argument('--dbc', default=DBC_FILE, help="DBC file used for decoding")
+    arg_parser.add_argument('--workers', type=int, default=None, help="Worker processes, defaults to the CPU count")
+    arg_parser.add_argument('--shard-mb', type=float, default=8.0, help="Split files larger than this into byte range shards")
+    arg_parser.add_argument('--output', help="Write the merged columns to this .npz file")
+    args = arg_parser.parse_args()
+
+    log_files = find_log_files(args.paths)
+    if not log_files:
+        print("No log files found")
+        return
+
+    start = time.perf_counter()
+    decoded = decode_logs(log_files, args.dbc, args.workers, int(args.shard_mb * (1 << 20)))
+    elapsed = time.perf_counter() - start
+
+    frame_count = sum(len(columns['timestamp']) for columns in decoded.values())
+    print(f"Decoded {frame_count} frames of {len(decoded)} messages from {len(log_files)} files in {elapsed:.2f} s")
+
+    if args.output:
+        save_decoded(args.output, decoded)
+        print(f"Saved decoded columns to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+# Author: Navneet Singh
+# can_log_batch_runner_unit_test.py
+# Checks sharded parallel decoding gives the same time ordered columns as decoding each log in one piece
+#
+# Usage:
+#   python3 -m pytest can_log_batch_runner_unit_test.py
+#   python3 can_log_batch_runner_unit_test.py
+
+import os
+import random
+import tempfile
+
+import cantools
+import numpy as np
+
+from can_capture import candump_to_capture
+from can_log_batch_decoder import DBC_FILE, decode_frames, load_candump_log
+from can_log_batch_runner import decode_logs, find_log_files, make_shards, merge_decoded
+
+
+def write_log(file_name, database, count, start_time, seed):
+    rng = random.Random(seed)
+    messages = database.messages
+    with open(file_name, 'w') as log:
+        for index in range(count):
+            message = messages[rng.randrange(len(messages))]
+            data = bytes(rng.getrandbits(8) for _ in range(message.length))
+            log.write(f"({start_time + index * 0.002:.6f}) can0 {message.frame_id:03X}#{data.hex().upper()}\n")
+
+
+def assert_sorted_and_equal(decoded, expected):
+    assert sorted(decoded) == sorted(expected)
+    for message_name, columns in decoded.items():
+        assert np.all(np.diff(columns['timestamp']) >= 0), message_name
+        for column, values in expected[message_name].items():
+            assert np.array_equal(columns[column], values), (message_name, column)
+
+
+def test_shards(tmp_path):
+    database = cantools.database.load_file(DBC_FILE)
+    # Two logs whose times interleave, the second starts 1 ms after the first
+    first, second = os.path.join(tmp_path, "a.log"), os.path.join(tmp_path, "b.log")
+    write_log(first, database, 3000, 1750786342.0, seed=0)
+    write_log(second, database, 2000, 1750786342.001, seed=1)
+    candump_to_capture(second, os.path.join(tmp_path, "b.cancap"))
+    assert find_log_files([tmp_path]) == [first, os.path.join(tmp_path, "b.cancap"), second]
+
+    # Shards cover every byte exactly once
+    shards = make_shards([first], 10000)
+    assert len(shards) > 10 and shards[0][1] == 0 and shards[-1][2] == os.path.getsize(first)
+    assert all(previous[2] == shard[1] for previous, shard in zip(shards, shards[1:]))
+
+    # Decoded in one piece and merged by hand
+    frames = [load_candump_log(file_name) for file_name in (first, second)]
+    expected = {}
+    for message_name in decode_frames(database, frames[0]):
+        parts = [decode_frames(database, part).get(message_name) for part in frames]
+        parts = [part for part in parts if part is not None]
+        columns = {column: np.concatenate([part[column] for part in parts]) for column in parts[0]}
+        order = np.argsort(columns['timestamp'], kind='stable')
+        expected[message_name] = {column: values[order] for column, values in columns.items()}
+
+    # Small shards put boundaries inside lines and records, no frame is lost or repeated
+    for paths in ([first, second], [first, os.path.join(tmp_path, "b.cancap")]):
+        decoded = decode_logs(paths, workers=2, shard_size=7000, progress=None)
+        assert_sorted_and_equal(decoded, expected)
+
+
+def test_merge_keeps_order():
+    # Shards out of time order and equal timestamps, ties keep the shard order
+    shards = [{'M': {'timestamp': np.array([3.0, 4.0]), 'value': np.array([30, 40])}},
+              {'M': {'timestamp': np.array([1.0, 3.0]), 'value': np.array([10, 31])},
+               'N': {'timestamp': np.array([2.0]), 'value': np.array([20])}},
+              {}]
+    merged = merge_decoded(shards)
+    assert list(merged) == ['M', 'N']
+    assert merged['M']['timestamp'].tolist() == [1.0, 3.0, 3.0, 4.0]
+    assert merged['M']['value'].tolist() == [10, 30, 31, 40]
+    assert merged['N']['value'].tolist() == [20]
+
+
+if __name__ == '__main__':
+    # pytest passes tmp_path, here the test gets a directory that is removed afterwards
+    with tempfile.TemporaryDirectory() as tmp_path:
+        test_shards(tmp_path)
+    test_merge_keeps_order()
+    print("All tests passed")
@@ -0,0 +1,127 @@
+# Author: Navneet Singh
+# can_signal_decoder.py
+# Compiles DBC signal definitions into specialised per message decoders
+#
+# cantools decodes every frame through a generic codec that builds a dict,
+# applies the value tables and validates the payload. For the fixed set of
+# Mobil Eye messages this module generates one small Python function per
+# message which pulls every signal out of the payload with int.from_bytes,
+# a shift and a mask and writes the scaled value straight into the target
+# data structure. The results are identical to cantools decode_message.
+
+from cantools.database.conversion import IdentityConversion
+
+
+class Signal_Layout:
+    " Bit position of a signal inside the payload integer of its message"
+    __slots__ = ('name', 'byte_order', 'shift', 'mask', 'length', 'is_signed')
+
+    def __init__(self, signal, message_length):
+        self.name = signal.name
+        self.byte_order = signal.byte_order
+        self.length = signal.length
+        self.mask = (1 << signal.length) - 1
+        self.is_signed = signal.is_signed
+
+        if signal.byte_order == 'big_endian':
+            # DBC start bit of a Motorola signal is its MSB in the sawtooth bit
+            # numbering, the payload is read as one big endian integer
+            msb = (message_length - 1 - signal.start // 8) * 8 + signal.start % 8
+            self.shift = msb - signal.length + 1
+        else:
+            # Intel signals start at their LSB, the payload is read as one
+            # little endian integer
+            self.shift = signal.start
+
+
+def is_compilable(message):
+    " Check if a message only uses features supported by the compiled decoders"
+    if message.length == 0 or message.is_multiplexed() or message.is_container:
+        return False
+    return not any(signal.is_float for signal in message.signals)
+
+
+def compile_message_decoder(message, field_map=None, decode_choices=True, columns=None, row=0):
+    """
+    Compile a decoder for a DBC message
+
+    Args:
+        message: cantools Message to compile
+        field_map: ((signal name, field name), ...) pairs to decode, defaults to every
+                   signal stored in a field named after the signal
+        decode_choices: Convert values to their value table entry, same as cantools
+        columns: Optional field name -> array mapping, values are then written to
+                 columns[field name][row] instead of the target attributes
+        row: Row of the columns written by the decoder
+
+    Returns:
+        decode(data, target) which writes the decoded signals into the target
+        attributes (or the columns) and raises ValueError on a payload shorter
+        than the message
+    """
+    if not is_compilable(message):
+        raise ValueError(f"Message {message.name} cannot be compiled")
+
+    if field_map is None:
+        field_map = [(signal.name, signal.name) for signal in message.signals]
+
+    length = message.length
+    namespace = {}
+    lines = [
+        "def decode(data, target):",
+        f"    if len(data) != {length}:",
+        f"        if len(data) < {length}:",
+        f"            raise ValueError(f'Wrong data size: {{len(data)}} instead of {length} bytes')",
+        f"        data = data[:{length}]",
+    ]
+
+    byte_orders = {message.get_signal_by_name(signal_name).byte_order for signal_name, _ in field_map}
+    if 'big_endian' in byte_orders:
+        lines.append("    big = int.from_bytes(data, 'big')")
+    if 'little_endian' in byte_orders:
+        lines.append("    little = int.from_bytes(data, 'little')")
+
+    for index, (signal_name, field_name) in enumerate(field_map):
+        signal = message.get_signal_by_name(signal_name)
+        layout = Signal_Layout(signal, length)
+        source = 'big' if layout.byte_order == 'big_endian' else 'little'
+
+        lines.append(f"    raw = ({source} >> {layout.shift}) & {layout.mask:#x}")
+        if layout.is_signed:
+            lines.append(f"    if raw & {1 << (layout.length - 1):#x}:")
+            lines.append(f"        raw -= {1 << layout.length:#x}")
+
+        if isinstance(signal.conversion, IdentityConversion):
+            value = "raw"
+        else:
+            namespace[f'scale_{index}'] = signal.conversion.scale
+            namespace[f'offset_{index}'] = signal.conversion.offset
+            value = f"raw * scale_{index} + offset_{index}"
+
+        if decode_choices and signal.choices:
+            namespace[f'choices_{index}'] = signal.choices
+            lines.append(f"    choice = choices_{index}.get(raw)")
+            value = f"{value} if choice is None else choice"
+
+        if columns is None:
+            lines.append(f"    target.{field_name} = {value}")
+        else:
+            namespace[f'column_{index}'] = columns[field_name]
+            lines.append(f"    column_{index}[{int(row)}] = {value}")
+
+    source_code = "\n".join(lines) + "\n"
+    exec(compile(source_code, f"<decoder {message.name}>", 'exec'), namespace)
+
+    decode = namespace['decode']
+    decode.__name__ = f"decode_{message.name}"
+    decode.source = source_code
+    return decode
+
+
+def compile_database_decoders(database, decode_choices=True):
+    " Compile a decoder for every supported message of a database, keyed by frame id"
+    return {
+        message.frame_id: compile_message_decoder(message, decode_choices=decode_choices)
+        for message in database.messages
+        if is_compilable(message)
+    }
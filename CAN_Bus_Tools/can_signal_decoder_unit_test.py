@@ -0,0 +1,117 @@
+# Author: Navneet Singh
+# can_signal_decoder_unit_test.py
+# Checks the compiled signal decoders are bit exact with cantools
+#
+# Usage:
+#   python3 -m pytest can_signal_decoder_unit_test.py
+#   python3 can_signal_decoder_unit_test.py
+
+import os
+import random
+from types import SimpleNamespace
+
+import cantools
+
+from can_signal_decoder import compile_database_decoders, compile_message_decoder, is_compilable
+
+DBC_FILE = os.path.join(os.path.dirname(__file__), 'dbc_files', 'Zendar_Private_CAN.dbc')
+
+# Signed and Intel signals are not used by the Mobil Eye DBC, cover them with a small test database
+TEST_DBC = '''VERSION ""
+
+BS_:
+
+BU_: FCM
+
+BO_ 100 Test_Layouts: 8 FCM
+ SG_ Signed_Big : 7|12@0- (0.5,-3) [-1027|1020.5] "" FCM
+ SG_ Unsigned_Little : 16|9@1+ (1,0) [0|511] "" FCM
+ SG_ Signed_Little : 25|16@1- (0.01,0) [-327.68|327.67] "" FCM
+ SG_ Choice_Little : 41|3@1+ (1,0) [0|7] "" FCM
+ SG_ Full_Byte : 63|8@0+ (2,1) [1|511] "" FCM
+
+VAL_ 100 Choice_Little 0 "Zero" 1 "One" 2 "Two" ;
+'''
+
+EDGE_PAYLOADS = [bytes(8), b'\xff' * 8, b'\x80' * 8, b'\x01' * 8, bytes(range(8))]
+
+
+def random_payloads(length, count, seed):
+    rng = random.Random(seed)
+    return [bytes(rng.getrandbits(8) for _ in range(length)) for _ in range(count)] + \
+        [payload[:length] for payload in EDGE_PAYLOADS]
+
+
+def assert_bit_exact(database, payload_count=2000):
+    decoders = {
+        decode_choices: compile_database_decoders(database, decode_choices=decode_choices)
+        for decode_choices in (True, False)
+    }
+
+    checked = 0
+    for message in database.messages:
+        if not is_compilable(message):
+            continue
+
+        for payload in random_payloads(message.length, payload_count, seed=message.frame_id):
+            for decode_choices, message_decoders in decoders.items():
+                expected = database.decode_message(message.frame_id, payload, decode_choices=decode_choices)
+                target = SimpleNamespace()
+                message_decoders[message.frame_id](payload, target)
+                decoded = vars(target)
+
+                assert decoded.keys() == expected.keys(), message.name
+                for name, value in expected.items():
+                    # Same type and value, choices must be the very same NamedSignalValue
+                    assert type(decoded[name]) is type(value), (message.name, name, payload.hex())
+                    assert decoded[name] == value or decoded[name] is value, (message.name, name, payload.hex())
+        checked += 1
+
+    return checked
+
+
+def test_mobil_eye_dbc_bit_exact():
+    database = cantools.database.load_file(DBC_FILE)
+    checked = assert_bit_exact(database)
+
+    # Every message sent on the bus is compiled, only the zero length signal holder is skipped
+    assert checked == len([message for message in database.messages if message.length > 0])
+
+
+def test_signed_and_little_endian_bit_exact():
+    database = cantools.database.load_string(TEST_DBC, database_format='dbc')
+    assert assert_bit_exact(database) == 1
+
+
+def test_field_map_and_excess_data():
+    database = cantools.database.load_file(DBC_FILE)
+    message = database.get_message_by_name('Obstacle_Data_1_A')
+    decode = compile_message_decoder(message, (('Longitudinal_Distance_1_A', 'longitudinal_distance'),))
+
+    payload = bytes(range(8))
+    target = SimpleNamespace()
+    decode(payload + b'\xaa\xbb', target)
+
+    assert vars(target) == {
+        'longitudinal_distance': database.decode_message(message.frame_id, payload)['Longitudinal_Distance_1_A']
+    }
+
+
+def test_truncated_data_raises():
+    database = cantools.database.load_file(DBC_FILE)
+    decode = compile_message_decoder(database.get_message_by_name('ME_Left_Lane_A'))
+
+    try:
+        decode(b'\x00' * 7, SimpleNamespace())
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("Truncated payload was decoded")
+
+
+if __name__ == "__main__":
+    test_mobil_eye_dbc_bit_exact()
+    test_signed_and_little_endian_bit_exact()
+    test_field_map_and_excess_data()
+    test_truncated_data_raises()
+    print("All compiled decoder tests passed")
@@ -0,0 +1,135 @@
+# Author: Navneet Singh
+# candump_log_reader.py
+# Streaming reader for candump log files
+#
+# The log is memory mapped and read one line at a time, so memory stays flat
+# for multi hour logs. The reader offers the recv() / shutdown() part of the
+# python-can bus interface, which lets CAN_BUS_Parser.py decode a log file
+# directly instead of replaying it with canplayer into vcan0.
+
+import mmap
+import os
+import time
+
+import can
+
+from can_log_batch_decoder import CANDUMP_LINE_PATTERN
+
+
+def parse_candump_line(line):
+    " Parse one candump -l line into a can.Message, None for lines that are not classic CAN frames"
+    match = CANDUMP_LINE_PATTERN.match(line)
+    if match is None:
+        return None
+
+    timestamp, channel, arbitration_id, data = match.groups()
+    return can.Message(
+        timestamp=float(timestamp),
+        arbitration_id=int(arbitration_id, 16),
+        is_extended_id=len(arbitration_id) > 3,
+        data=bytes.fromhex(data.decode('ascii')),
+        channel=channel.decode('ascii'),
+    )
+
+
+class Candump_Log_Reader:
+    """Memory mapped candump log reader, usable as a frame generator or as a bus"""
+
+    def __init__(self, file_name, start=0, end=None):
+        """
+        Open a candump log
+
+        Args:
+            file_name: candump -l formatted log file
+            start: Byte offset to start reading from, moved forward to the next line start
+            end: Byte offset to stop at, the line that contains it is still read; nothing is read
+                 if it is not after start
+        """
+        self.file_name = file_name
+        self._file = open(file_name, 'rb')
+        self._size = os.fstat(self._file.fileno()).st_size
+        self._mapped = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self._size else b''
+
+        empty = end is not None and end <= start
+        if start > 0:
+            start = self.find_line_end(start - 1)
+        self._position = start
+        if empty:
+            # find() would count a negative offset from the end of the log
+            self._end = start
+        else:
+            self._end = self._size if end is None else min(self.find_line_end(end - 1), self._size)
+
+    def find_line_end(self, position):
+        " Offset just after the newline at or after the position"
+        newline = self._mapped.find(b'\n', position)
+        return self._size if newline < 0 else newline + 1
+
+    @property
+    def channel(self):
+        " Interface name of the first frame in the log, None for a log without frames"
+        match = CANDUMP_LINE_PATTERN.search(self._mapped)
+        return match.group(2).decode('ascii') if match else None
+
+    @property
+    def at_eof(self):
+        return self._position >= self._end
+
+    def read_message(self):
+        " Next frame of the log, None at the end of the log"
+        while self._position < self._end:
+            line_end = self.find_line_end(self._position)
+            line = self._mapped[self._position:line_end].rstrip()
+            self._position = line_end
+
+            msg = parse_candump_line(line)
+            if msg is not None:
+                return msg
+        return None
+
+    def __iter__(self):
+        while True:
+            msg = self.read_message()
+            if msg is None:
+                return
+            yield msg
+
+    def iter_batches(self, batch_size=1000):
+        " Yield lists of at most batch_size frames"
+        batch = []
+        for msg in self:
+            batch.append(msg)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def recv(self, timeout=None):
+        """
+        Bus interface, returns the next frame
+
+        Reading the log never waits, the timeout only applies at the end of the log, which
+        behaves like an idle bus: None after waiting timeout seconds, so a can.Notifier does
+        not spin. With timeout=None can.BusABC blocks until a frame arrives, no frame ever
+        arrives after the end of a log, so EOFError is raised instead of blocking forever.
+        """
+        msg = self.read_message()
+        if msg is None:
+            if timeout is None:
+                raise EOFError(f"End of the log {self.file_name}")
+            if timeout > 0:
+                time.sleep(timeout)
+        return msg
+
+    def shutdown(self):
+        " Bus interface, releases the memory map"
+        if self._size:
+            self._mapped.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown()
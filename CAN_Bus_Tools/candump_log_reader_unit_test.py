@@ -0,0 +1,96 @@
+# Author: Navneet Singh
+# candump_log_reader_unit_test.py
+# Checks the streaming log reader against the batch loader, byte range shards and the bus interface
+#
+# Usage:
+#   python3 -m pytest candump_log_reader_unit_test.py
+#   python3 candump_log_reader_unit_test.py
+
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from can_log_batch_decoder import load_candump_log
+from candump_log_reader import Candump_Log_Reader, parse_candump_line
+
+
+def write_log(directory, count=1000):
+    " Log with lines of different lengths, extended ids and a line the reader skips"
+    file_name = os.path.join(directory, "frames.log")
+    with open(file_name, 'w') as log:
+        for index in range(count):
+            identifier = f"{0x18FF0000 + index:08X}" if index % 10 == 7 else f"{0x238 + index % 30:03X}"
+            log.write(f"({1750786342 + index * 0.001:.6f}) can0 {identifier}#{bytes(range(index % 9)).hex().upper()}\n")
+            if index == 500:
+                log.write("(1750786342.500500) can0 268#R\n")
+    return file_name
+
+
+def read_all(reader):
+    with reader:
+        return [(msg.timestamp, msg.arbitration_id, msg.is_extended_id, bytes(msg.data)) for msg in reader]
+
+
+def test_matches_batch_loader(tmp_path):
+    file_name = write_log(tmp_path)
+    messages = read_all(Candump_Log_Reader(file_name))
+    frames = load_candump_log(file_name)
+    assert len(messages) == len(frames) == 1000
+    assert np.array_equal([msg[0] for msg in messages], frames.timestamps)
+    assert np.array_equal([msg[1] for msg in messages], frames.arbitration_ids)
+    assert [msg[3] for msg in messages] == [bytes(row[:dlc]) for row, dlc in zip(frames.payloads, frames.dlc)]
+    assert [msg[2] for msg in messages] == [index % 10 == 7 for index in range(1000)]
+    assert parse_candump_line(b"(1750786342.000000) can0 268#R") is None
+
+
+def test_shards_split_lines(tmp_path):
+    file_name = write_log(tmp_path)
+    size = os.path.getsize(file_name)
+    expected = read_all(Candump_Log_Reader(file_name))
+    with open(file_name, 'rb') as log:
+        line_starts = [0] + [index + 1 for index, byte in enumerate(log.read()) if byte == ord('\n')]
+
+    # Boundaries on, just before and just after line starts, and in the middle of lines
+    for boundaries in ([0, line_starts[10], size], [0, line_starts[10] - 1, line_starts[500] + 1, size],
+                       [0, 1, 2, size - 1, size], list(range(0, size, 997)) + [size]):
+        messages = []
+        for start, end in zip(boundaries, boundaries[1:]):
+            messages += read_all(Candump_Log_Reader(file_name, start, end))
+        assert messages == expected, boundaries
+
+        # The batch loader splits at the same lines
+        parts = [load_candump_log(file_name, start, end) for start, end in zip(boundaries, boundaries[1:])]
+        assert np.array_equal(np.concatenate([part.timestamps for part in parts]), [msg[0] for msg in expected])
+
+    # A range that does not end after its start is empty, end=0 included
+    for start, end in ((0, 0), (line_starts[10], line_starts[10]), (line_starts[10] + 5, line_starts[10] + 3)):
+        assert read_all(Candump_Log_Reader(file_name, start, end)) == [], (start, end)
+        assert len(load_candump_log(file_name, start, end).timestamps) == 0, (start, end)
+
+
+def test_recv(tmp_path):
+    file_name = write_log(tmp_path, count=3)
+    with Candump_Log_Reader(file_name) as reader:
+        assert [reader.recv().arbitration_id for _ in range(2)] == [0x238, 0x239]
+        assert reader.recv(timeout=1.0).arbitration_id == 0x23A
+        assert reader.at_eof and reader.recv(timeout=0) is None
+        # Blocking for the next frame would never return after the end of the log
+        try:
+            reader.recv()
+            raise AssertionError("recv(None) returned at the end of the log")
+        except EOFError:
+            pass
+        # The end of the log waits like an idle bus
+        start = time.perf_counter()
+        assert reader.recv(timeout=0.05) is None
+        assert time.perf_counter() - start >= 0.05
+
+
+if __name__ == '__main__':
+    # pytest passes tmp_path, here every test gets a directory that is removed afterwards
+    for test in (test_matches_batch_loader, test_shards_split_lines, test_recv):
+        with tempfile.TemporaryDirectory() as tmp_path:
+            test(tmp_path)
+    print("All tests passed")
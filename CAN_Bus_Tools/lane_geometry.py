@@ -0,0 +1,145 @@
+# Author: Navneet Singh
+# lane_geometry.py
+# Lane and boundary points of the Mobil Eye cubic lane model
+#
+# A lane mark is y = C0 + C1*x + C2*x^2 + C3*x^3 over the distance ahead x.
+# The abscissa is computed once per point count, all requested lanes and
+# their boundaries are evaluated in one Horner pass over a coefficient
+# matrix, and the float32 points are memoized in an LRU keyed by the
+# quantized coefficients and quality, so an unchanged lane costs a dict
+# lookup. Adaptive sampling picks the fewest points that keep the chord error
+# below a tolerance, a straight road needs only two.
+
+import math
+from collections import OrderedDict
+
+import numpy as np
+
+# Quantization step of C0..C3 in the memo key, finer than the DBC resolution of each coefficient
+COEFFICIENT_QUANTA = (1e-3, 1e-5, 1e-7, 1e-9)
+
+
+class Lane_Points:
+    " Points of one lane mark and its boundary, read only float32 arrays ready for a typed array payload"
+    __slots__ = ('x', 'y', 'boundary')
+
+    def __init__(self, x, y, boundary):
+        self.x = x
+        self.y = y
+        self.boundary = boundary
+
+
+class Lane_Geometry:
+    """Memoized, batched evaluation of the cubic lane model"""
+
+    def __init__(self, length=100.0, points=100, cache_size=256, adaptive=False, tolerance=0.02, min_points=2):
+        """
+        Create the engine
+
+        Args:
+            length: Distance ahead covered by the lanes in meters
+            points: Number of points per lane, the maximum with adaptive sampling
+            cache_size: Number of evaluated lanes kept in the LRU memo
+            adaptive: Use fewer points where the lane is straight
+            tolerance: Maximum distance in meters between the sampled polyline and the curve
+            min_points: Minimum number of points per lane with adaptive sampling
+        """
+        self.length = length
+        self.points = points
+        self.cache_size = cache_size
+        self.adaptive = adaptive
+        self.tolerance = tolerance
+        self.min_points = min_points
+
+        self._abscissas = {}  # point count -> (float64 x, float32 x)
+        self._memo = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def abscissa(self, points):
+        " Distance ahead of every point, (float64, float32) arrays computed once per point count"
+        abscissa = self._abscissas.get(points)
+        if abscissa is None:
+            x = np.linspace(0, self.length, points)
+            x32 = x.astype(np.float32)
+            x.flags.writeable = False
+            x32.flags.writeable = False
+            abscissa = self._abscissas[points] = (x, x32)
+        return abscissa
+
+    def point_count(self, coefficients):
+        " Number of points that keeps the chord error below the tolerance"
+        if not self.adaptive:
+            return self.points
+
+        # Chord error of a segment of width h is at most h^2 * max|y''| / 8,
+        # y'' = 2*C2 + 6*C3*x is largest at one end of the range
+        c2, c3 = coefficients[2], coefficients[3]
+        curvature = max(abs(2 * c2), abs(2 * c2 + 6 * c3 * self.length))
+        if curvature == 0:
+            return self.min_points
+        spacing = math.sqrt(8 * self.tolerance / curvature)
+        return int(min(self.points, max(self.min_points, math.ceil(self.length / spacing) + 1)))
+
+    @staticmethod
+    def memo_key(coefficients, quality, boundary_offset):
+        return (tuple(round(value / quantum) for value, quantum in zip(coefficients, COEFFICIENT_QUANTA)),
+                int(quality), boundary_offset)
+
+    def evaluate(self, lanes):
+        """
+        Points of several lanes at once
+
+        Args:
+            lanes: ((C0, C1, C2, C3), quality, boundary offset in meters) per lane
+
+        Returns:
+            Lane_Points per lane, in the same order. The arrays are shared with
+            the memo and read only.
+        """
+        results = [None] * len(lanes)
+        misses = []
+        for index, (coefficients, quality, boundary_offset) in enumerate(lanes):
+            key = self.memo_key(coefficients, quality, boundary_offset)
+            cached = self._memo.get(key)
+            if cached is not None:
+                self._memo.move_to_end(key)
+                self.hits += 1
+                results[index] = cached
+            else:
+                misses.append((index, key, coefficients, boundary_offset))
+
+        if not misses:
+            return results
+        self.misses += len(misses)
+
+        # One batch per point count, a single batch without adaptive sampling
+        batches = {}
+        for miss in misses:
+            batches.setdefault(self.point_count(miss[2]), []).append(miss)
+
+        for points, batch in batches.items():
+            x, x32 = self.abscissa(points)
+
+            # One row per lane and one per boundary, the boundary is the lane shifted by its offset
+            matrix = np.repeat(np.array([miss[2] for miss in batch], dtype=np.float64), 2, axis=0)
+            matrix[1::2, 0] += [miss[3] for miss in batch]
+
+            # Horner over all rows: ((C3*x + C2)*x + C1)*x + C0
+            y = matrix[:, 3:4] * x
+            y += matrix[:, 2:3]
+            y *= x
+            y += matrix[:, 1:2]
+            y *= x
+            y += matrix[:, 0:1]
+            # float32 resolves micrometers over 100 m, far below the DBC resolution of C0
+            rows = y.astype(np.float32)
+            rows.flags.writeable = False
+
+            for row, (index, key, _, _) in enumerate(batch):
+                lane_points = Lane_Points(x32, rows[2 * row], rows[2 * row + 1])
+                self._memo[key] = lane_points
+                results[index] = lane_points
+        while len(self._memo) > self.cache_size:
+            self._memo.popitem(last=False)
+        return results
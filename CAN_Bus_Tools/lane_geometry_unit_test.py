@@ -0,0 +1,59 @@
+# Author: Navneet Singh
+# lane_geometry_unit_test.py
+# Checks the batched lane evaluation against the cubic model, the memo and adaptive sampling
+#
+# Usage:
+#   python3 -m pytest lane_geometry_unit_test.py
+#   python3 lane_geometry_unit_test.py
+
+import numpy as np
+
+from lane_geometry import Lane_Geometry
+
+
+def test_matches_polynomial():
+    geometry = Lane_Geometry()
+    lanes = [((1.8, 0.01, 2e-4, -1e-6), 3, 1.75), ((-1.7, -0.02, 0.0, 3e-6), 2, -1.75)]
+    x = np.linspace(0, 100, 100)
+    for (coefficients, _, offset), points in zip(lanes, geometry.evaluate(lanes)):
+        c0, c1, c2, c3 = coefficients
+        y = c0 + c1 * x + c2 * x**2 + c3 * x**3
+        assert points.y.dtype == np.float32
+        assert np.allclose(points.x, x)
+        assert np.allclose(points.y, y, atol=1e-3)
+        assert np.allclose(points.boundary, y + offset, atol=1e-3)
+
+
+def test_memo():
+    geometry = Lane_Geometry(cache_size=2)
+    lane = ((1.8, 0.01, 2e-4, -1e-6), 3, 1.75)
+    first = geometry.evaluate([lane])[0]
+    # Differences below the quantization step hit the memo
+    second = geometry.evaluate([((1.8 + 1e-5, 0.01, 2e-4, -1e-6), 3, 1.75)])[0]
+    assert second is first
+    assert (geometry.hits, geometry.misses) == (1, 1)
+
+    # A different quality is a different lane, the oldest entry is evicted
+    geometry.evaluate([(lane[0], 2, 1.75), ((0.0, 0.0, 0.0, 0.0), 3, 1.75)])
+    assert geometry.evaluate([lane])[0] is not first
+    assert geometry.misses == 4
+
+
+def test_adaptive_sampling():
+    geometry = Lane_Geometry(adaptive=True)
+    straight, curve = geometry.evaluate([((1.8, 0.01, 0.0, 0.0), 3, 1.75), ((1.8, 0.0, 1e-3, 1e-5), 3, 1.75)])
+    assert len(straight.x) == 2
+    assert np.allclose(straight.y, [1.8, 2.8])
+    assert 2 < len(curve.x) <= 100
+
+    # The chord error stays below the tolerance
+    fine = np.linspace(0, 100, 10001)
+    exact = 1.8 + 1e-3 * fine**2 + 1e-5 * fine**3
+    assert np.max(np.abs(np.interp(fine, curve.x, curve.y) - exact)) < geometry.tolerance + 1e-3
+
+
+if __name__ == '__main__':
+    test_matches_polynomial()
+    test_memo()
+    test_adaptive_sampling()
+    print("All tests passed")
@@ -0,0 +1,208 @@
+# Author: Navneet Singh
+# mobil_eye_history.py
+# Time series of the lane coefficients and the nearest obstacle for the history panels
+#
+# The snapshot ring only holds the last second or so of snapshots. The
+# history collects every lane and obstacle update out of it into columnar
+# rings that cover minutes (10 minutes at 100 Hz by default). A history
+# panel can not draw tens of thousands of points per trace at display rate,
+# so the window is downsampled with Largest-Triangle-Three-Buckets to about
+# one point per screen pixel before it is sent to the browser.
+
+import threading
+
+import numpy as np
+
+# Lane fields kept per side, in LANE_DTYPE names
+LANE_HISTORY_FIELDS = ('c0', 'c1', 'c2', 'c3', 'quality')
+# Fields of the nearest obstacle, in OBSTACLE_DTYPE names
+OBSTACLE_HISTORY_FIELDS = ('longitudinal_distance', 'absolute_long_velocity')
+
+
+def lttb_indices(x, y, threshold):
+    """
+    Largest-Triangle-Three-Buckets downsampling
+
+    The first and last points are kept, the points in between are split into
+    threshold - 2 buckets and from every bucket the point forming the largest
+    triangle with the point kept from the previous bucket and the average of
+    the next bucket is kept.
+
+    Args:
+        x: Increasing x coordinates, shape (n,)
+        y: y coordinates, shape (n,) or (series, n) for several series sharing x
+        threshold: Number of points kept per series
+
+    Returns:
+        Indices of the kept points, shape (threshold,) or (series, threshold)
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    single = y.ndim == 1
+    y = np.atleast_2d(y)
+    series, n = y.shape
+    if threshold >= n or threshold < 3:
+        indices = np.broadcast_to(np.arange(n), (series, n))
+        return indices[0] if single else indices
+
+    # Bucket b covers [edges[b], edges[b + 1]), the first and last point are buckets of their own
+    edges = (np.arange(threshold - 1) * ((n - 2) / (threshold - 2))).astype(np.intp) + 1
+    edges[-1] = n - 1
+
+    # Average of every bucket, the last point stands in for the bucket after the last one
+    x_sums = np.add.reduceat(x[1:n - 1], edges[:-1] - 1)
+    y_sums = np.add.reduceat(y[:, 1:n - 1], edges[:-1] - 1, axis=1)
+    sizes = np.diff(edges)
+    x_averages = np.append(x_sums / sizes, x[-1])
+    y_averages = np.concatenate([y_sums / sizes, y[:, -1:]], axis=1)
+
+    indices = np.empty((series, threshold), dtype=np.intp)
+    indices[:, 0] = 0
+    indices[:, -1] = n - 1
+    rows = np.arange(series)
+    a = np.zeros(series, dtype=np.intp)
+    for bucket in range(threshold - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        ax, ay = x[a], y[rows, a]
+        cx, cy = x_averages[bucket + 1], y_averages[:, bucket + 1]
+        # Twice the triangle area, the constant factor does not change the arg max
+        areas = np.abs((ax - cx)[:, None] * (y[:, start:end] - ay[:, None])
+                       - (ax[:, None] - x[start:end]) * (cy - ay)[:, None])
+        a = start + areas.argmax(axis=1)
+        indices[:, bucket + 1] = a
+    return indices[0] if single else indices
+
+
+class Time_Series_Ring:
+    """Fixed capacity ring of timestamped samples, one float64 column per field"""
+
+    def __init__(self, fields, capacity=65536):
+        self.fields = tuple(fields)
+        self.capacity = capacity
+        self.timestamps = np.zeros(capacity)
+        self.columns = np.zeros((len(self.fields), capacity))
+        self.count = 0  # Samples appended since the last clear
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def extend(self, timestamps, values):
+        " Append samples in time order, values has one row per field"
+        timestamps = timestamps[-self.capacity:]
+        values = np.asarray(values)[:, -self.capacity:]
+        slots = (self.count + np.arange(len(timestamps))) % self.capacity
+        self.timestamps[slots] = timestamps
+        self.columns[:, slots] = values
+        self.count += len(timestamps)
+
+    def last_timestamp(self):
+        return float(self.timestamps[(self.count - 1) % self.capacity]) if self.count else None
+
+    def window(self, seconds=None):
+        " (timestamps, columns) in time order, only the samples of the last seconds if given"
+        size = len(self)
+        slots = (self.count - size + np.arange(size)) % self.capacity
+        if seconds is not None and size:
+            newest = self.timestamps[slots[-1]]
+            slots = slots[np.searchsorted(self.timestamps[slots], newest - seconds):]
+        return self.timestamps[slots], self.columns[:, slots]
+
+    def clear(self):
+        self.count = 0
+
+
+class Snapshot_History:
+    """Lane and nearest obstacle history collected from a Snapshot_Ring"""
+
+    def __init__(self, snapshot_ring=None, window_seconds=600.0, capacity=65536):
+        """
+        Create an empty history, call update() regularly to collect the new snapshots
+
+        Args:
+            snapshot_ring: Snapshot_Ring written by the parser
+            window_seconds: Time span returned by window()
+            capacity: Samples kept per series, at least window_seconds times the update rate
+        """
+        self.snapshot_ring = snapshot_ring
+        self.window_seconds = window_seconds
+        self.lanes = {side: Time_Series_Ring(LANE_HISTORY_FIELDS, capacity) for side in ('left', 'right')}
+        self.obstacles = Time_Series_Ring(OBSTACLE_HISTORY_FIELDS, capacity)
+        self.lost_snapshots = 0  # Snapshots overwritten in the ring before they were collected
+        self.version = 0  # Bumped whenever the collected samples change, renders are cached by it
+        self._last_seq = 0
+        self._last_updates = {'left': 0.0, 'right': 0.0, 'obstacles': 0.0}
+        self._lock = threading.Lock()
+
+    def update(self):
+        " Collect the snapshots written since the last update, returns the number collected"
+        ring = self.snapshot_ring
+        if ring is None or ring.count == self._last_seq:
+            return 0
+
+        with self._lock:
+            records = ring.history(since_seq=self._last_seq)
+            if not len(records):
+                return 0
+            if self._last_seq:
+                self.lost_snapshots += int(records['seq'][0]) - self._last_seq - 1
+            self._last_seq = int(records['seq'][-1])
+            self.version += 1
+
+            # A lane is sampled when its last update (the wall clock decode time) changed, at the CAN
+            # time of the snapshot, the frame that completed the lane group, like the obstacles
+            for side, series in self.lanes.items():
+                lanes = records[f'{side}_lane']
+                changed = self.changed(side, lanes['last_update'])
+                series.extend(records['timestamp'][changed], [lanes[field][changed] for field in LANE_HISTORY_FIELDS])
+
+            # The obstacles are sampled when any slot changed, the nearest obstacle with data is kept
+            obstacles = records['obstacles']
+            last_updates = obstacles['last_update']
+            changed = self.changed('obstacles', last_updates.max(axis=1)) & (last_updates > 0).any(axis=1)
+            distances = np.where(last_updates > 0, obstacles['longitudinal_distance'], np.inf)
+            nearest = obstacles[np.arange(len(obstacles)), distances.argmin(axis=1)][changed]
+            self.obstacles.extend(records['timestamp'][changed], [nearest[field] for field in OBSTACLE_HISTORY_FIELDS])
+            return len(records)
+
+    def changed(self, key, last_updates):
+        " Mask of the records whose last update differs from the previous record"
+        previous = np.concatenate(([self._last_updates[key]], last_updates[:-1]))
+        self._last_updates[key] = float(last_updates[-1])
+        return (last_updates != previous) & (last_updates != 0)
+
+    def window(self):
+        """
+        Downsampling ready history of the window
+
+        Returns:
+            {'left': (timestamps, columns), 'right': ..., 'obstacles': ...} in time
+            order, the columns in LANE_HISTORY_FIELDS / OBSTACLE_HISTORY_FIELDS order
+        """
+        with self._lock:
+            windows = {side: series.window(self.window_seconds) for side, series in self.lanes.items()}
+            windows['obstacles'] = self.obstacles.window(self.window_seconds)
+        return windows
+
+    def newest_timestamp(self):
+        " CAN time of the newest sample of any series, None while the history is empty"
+        timestamps = [series.last_timestamp() for series in (*self.lanes.values(), self.obstacles)]
+        timestamps = [timestamp for timestamp in timestamps if timestamp is not None]
+        return max(timestamps) if timestamps else None
+
+    def attach(self, snapshot_ring):
+        " Collect from another ring, the history starts over"
+        with self._lock:
+            self.snapshot_ring = snapshot_ring
+            self._reset(0)
+
+    def clear(self):
+        " Drop the collected history, the snapshots written so far are skipped"
+        with self._lock:
+            self._reset(self.snapshot_ring.count if self.snapshot_ring is not None else 0)
+
+    def _reset(self, last_seq):
+        for series in (*self.lanes.values(), self.obstacles):
+            series.clear()
+        self._last_seq = last_seq
+        self._last_updates = dict.fromkeys(self._last_updates, 0.0)
+        self.version += 1
@@ -0,0 +1,98 @@
+# Author: Navneet Singh
+# mobil_eye_history_unit_test.py
+# Checks the LTTB downsampling and the history collected from the snapshot ring
+#
+# Usage:
+#   python3 -m pytest mobil_eye_history_unit_test.py
+#   python3 mobil_eye_history_unit_test.py
+
+import numpy as np
+
+from mobil_eye_history import Snapshot_History, Time_Series_Ring, lttb_indices
+from mobil_eye_structures import SNAPSHOT_DTYPE, Snapshot_Ring
+
+
+def test_lttb_keeps_peaks():
+    x = np.arange(10000, dtype=float)
+    y = np.sin(x / 500)
+    y[4321] = 10.0  # A single spike must survive the downsampling
+    indices = lttb_indices(x, np.vstack([y, -y]), 200)
+    assert indices.shape == (2, 200)
+    assert indices[0, 0] == 0 and indices[0, -1] == len(x) - 1
+    assert (np.diff(indices, axis=1) > 0).all()
+    assert 4321 in indices[0] and 4321 in indices[1]
+
+    # Short series are returned whole
+    assert lttb_indices(x[:50], y[:50], 200).tolist() == list(range(50))
+
+
+def test_time_series_ring_window():
+    ring = Time_Series_Ring(('value',), capacity=8)
+    ring.extend(np.arange(12.0), [np.arange(12.0) * 2])
+    timestamps, columns = ring.window()
+    assert timestamps.tolist() == list(range(4, 12))
+    assert columns[0].tolist() == [2.0 * t for t in range(4, 12)]
+    assert ring.window(seconds=2)[0].tolist() == [9.0, 10.0, 11.0]
+
+
+def test_history_samples_changes_only():
+    snapshot_ring = Snapshot_Ring(capacity=16)
+    history = Snapshot_History(snapshot_ring)
+    snapshot = np.zeros((), dtype=SNAPSHOT_DTYPE)
+    for index in range(10):
+        # The left lane changes every other snapshot, obstacle slot 3 every snapshot
+        if index % 2 == 0:
+            snapshot['left_lane']['c0'] = index / 10
+            snapshot['left_lane']['quality'] = 3
+            snapshot['left_lane']['last_update'] = 1 + index * 0.1
+        snapshot['obstacles']['longitudinal_distance'][[3, 5]] = (50.0 - index, 80.0)
+        snapshot['obstacles']['last_update'][[3, 5]] = (1 + index * 0.1, 0.05)
+        snapshot_ring.write(snapshot, index * 0.1)
+    assert history.update() == 10 and history.version == 1
+
+    windows = history.window()
+    timestamps, columns = windows['left']
+    assert len(timestamps) == 5
+    assert columns[0].tolist() == [0.0, 0.2, 0.4, 0.6, 0.8]
+    assert len(windows['right'][0]) == 0
+    # The nearest obstacle is slot 3
+    assert windows['obstacles'][1][0].tolist() == [50.0 - index for index in range(10)]
+
+    history.clear()
+    assert len(history.window()['left'][0]) == 0
+    assert history.update() == 0 and history.version == 2
+
+
+def test_history_uses_can_time():
+    # A replayed log: decoded now, recorded a year ago and read faster than real time
+    snapshot_ring = Snapshot_Ring(capacity=16)
+    history = Snapshot_History(snapshot_ring, window_seconds=0.5)
+    snapshot = np.zeros((), dtype=SNAPSHOT_DTYPE)
+    for index in range(10):
+        decoded = 1.8e9 + index * 0.001
+        if index % 2 == 0:
+            snapshot['left_lane']['c0'] = index
+            snapshot['left_lane']['last_update'] = decoded
+        else:
+            snapshot['obstacles']['longitudinal_distance'][0] = index
+            snapshot['obstacles']['last_update'][0] = decoded
+        snapshot_ring.write(snapshot, 1.75e9 + index * 0.1, decoded)
+    history.update()
+
+    # Lanes and obstacles on the one CAN time axis, the window keeps the last 0.5 s of both
+    windows = history.window()
+    assert windows['left'][0].tolist() == [1.75e9 + index * 0.1 for index in (4, 6, 8)]
+    assert windows['left'][1][0].tolist() == [4.0, 6.0, 8.0]
+    assert windows['obstacles'][0].tolist() == [1.75e9 + index * 0.1 for index in (5, 7, 9)]
+    assert history.newest_timestamp() == 1.75e9 + 0.9
+    # The panels plot the seconds before the newest sample of any series
+    newest = history.newest_timestamp()
+    assert all(-0.5 <= timestamp - newest <= 0 for key in ('left', 'obstacles') for timestamp in windows[key][0])
+
+
+if __name__ == '__main__':
+    test_lttb_keeps_peaks()
+    test_time_series_ring_window()
+    test_history_samples_changes_only()
+    test_history_uses_can_time()
+    print("All tests passed")
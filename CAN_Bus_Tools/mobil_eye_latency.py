@@ -0,0 +1,139 @@
+# Author: Navneet Singh
+# mobil_eye_latency.py
+# Latency of the displayed state, from the CAN frame timestamp to the browser paint
+#
+# Every published snapshot carries the kernel timestamp of the frame that
+# completed it, the time it was decoded and the time it was published. The
+# visualizer adds the time the state frame was rendered and serialized, the
+# browser (assets/lane_stream.js) reports when it received and painted the
+# frame. All times are wall clock seconds (time.time(), the clock of the
+# socketcan timestamps); the deliver and total stages compare the browser
+# clock with the server clock and need both synchronized, e.g. by NTP.
+# Frames replayed from a log carry the timestamps of the recording, the
+# decode and total stages are then left out.
+#
+# Stages:
+#   decode     frame timestamp -> snapshot committed by the parser
+#   publish    decoded -> taken by the publisher at display rate
+#   render     published -> state frame built, includes the wait for the next stream tick
+#   serialize  rendered -> JSON ready for the stream
+#   deliver    serialized -> received by the browser
+#   paint      received -> painted by the browser
+#   total      frame timestamp -> painted
+
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+LATENCY_STAGES = ('decode', 'publish', 'render', 'serialize', 'deliver', 'paint', 'total')
+LATENCY_QUANTILES = (0.5, 0.95, 0.99)
+
+# Latencies kept per stage for the quantiles, a power of two
+LATENCY_SAMPLES = 1024
+# Server side traces kept for the browser reports, a few seconds at display rate
+TRACE_COUNT = 256
+
+
+class Latency_Tracker:
+    """Per stage latency quantiles of the frames shown in the browser"""
+
+    def __init__(self, samples=LATENCY_SAMPLES, trace_count=TRACE_COUNT, replay=False):
+        """
+        Create the tracker
+
+        Args:
+            samples: Latencies kept per stage, a power of two
+            trace_count: Rendered snapshots kept until the browser reports them
+            replay: The frame timestamps come from a recorded log, skip the stages that start at them
+        """
+        if samples < 1 or samples & (samples - 1):
+            raise ValueError(f"Latency samples must be a power of two, not {samples}")
+        self.samples = samples
+        self.replay = replay
+        self.trace_count = trace_count
+        self._latencies = {stage: [0.0] * samples for stage in LATENCY_STAGES}
+        self._counts = dict.fromkeys(LATENCY_STAGES, 0)
+        self._traces = OrderedDict()  # seq -> {'can': ..., 'decoded': ..., 'published': ..., 'rendered': ..., 'serialized': ...}
+        self._lock = threading.Lock()
+
+    def record(self, stage, seconds):
+        " Account one latency of a stage"
+        count = self._counts[stage]
+        self._latencies[stage][count & (self.samples - 1)] = seconds
+        self._counts[stage] = count + 1
+
+    def trace(self, snapshot, rendered):
+        " Remember the server times of a rendered snapshot until the browser reports it"
+        seq = int(snapshot['seq'])
+        with self._lock:
+            if seq in self._traces:
+                return
+            self._traces[seq] = {
+                'can': float(snapshot['timestamp']),
+                'decoded': float(snapshot['decoded']),
+                'published': float(snapshot['published']),
+                'rendered': rendered,
+            }
+            while len(self._traces) > self.trace_count:
+                self._traces.popitem(last=False)
+
+    def serialized(self, seq, now):
+        " The state frame of seq is serialized, records the server stages once per seq"
+        with self._lock:
+            trace = self._traces.get(seq)
+            if trace is None or 'serialized' in trace:
+                return
+            trace['serialized'] = now
+            if not self.replay:
+                self.record('decode', trace['decoded'] - trace['can'])
+            if trace['published']:
+                # Without a publisher the render reads the ring directly
+                self.record('publish', trace['published'] - trace['decoded'])
+                self.record('render', trace['rendered'] - trace['published'])
+            self.record('serialize', now - trace['rendered'])
+
+    def report(self, seq, received, painted):
+        " Browser report of a frame, received and painted in wall clock seconds"
+        with self._lock:
+            trace = self._traces.get(seq)
+            if trace is None or 'serialized' not in trace:
+                return False
+            self.record('deliver', received - trace['serialized'])
+            self.record('paint', painted - received)
+            if not self.replay:
+                self.record('total', painted - trace['can'])
+            return True
+
+    def quantiles(self):
+        " stage -> (p50, p95, p99 in seconds, number of samples), None for a stage without samples"
+        with self._lock:
+            result = {}
+            for stage in LATENCY_STAGES:
+                count = min(self._counts[stage], self.samples)
+                if not count:
+                    result[stage] = None
+                    continue
+                values = np.quantile(np.array(self._latencies[stage][:count]), LATENCY_QUANTILES)
+                result[stage] = (*values.tolist(), self._counts[stage])
+            return result
+
+    def clear(self):
+        with self._lock:
+            self._counts = dict.fromkeys(LATENCY_STAGES, 0)
+            self._traces.clear()
+
+
+def add_latency_route(server, tracker, path='/latency'):
+    " Receive the paint reports of the browsers on a Flask server, e.g. the server of a Dash app"
+    from flask import request
+
+    def latency_endpoint():
+        report = request.get_json(silent=True) or {}
+        for frame in report.get('frames', [])[:tracker.trace_count]:
+            try:
+                tracker.report(int(frame['seq']), float(frame['received']), float(frame['painted']))
+            except (KeyError, TypeError, ValueError):
+                continue
+        return '', 204
+    server.add_url_rule(path, 'latency', latency_endpoint, methods=['POST'])
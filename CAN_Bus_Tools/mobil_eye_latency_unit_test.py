@@ -0,0 +1,72 @@
+# Author: Navneet Singh
+# mobil_eye_latency_unit_test.py
+# Checks the per stage latencies computed from the snapshot trace and the browser reports
+#
+# Usage:
+#   python3 -m pytest mobil_eye_latency_unit_test.py
+#   python3 mobil_eye_latency_unit_test.py
+
+import numpy as np
+
+from mobil_eye_latency import Latency_Tracker
+from mobil_eye_structures import SNAPSHOT_DTYPE
+
+
+def make_snapshot(seq, timestamp):
+    snapshot = np.zeros((), dtype=SNAPSHOT_DTYPE)
+    snapshot['seq'] = seq
+    snapshot['timestamp'] = timestamp
+    snapshot['decoded'] = timestamp + 0.001
+    snapshot['published'] = timestamp + 0.011
+    return snapshot
+
+
+def test_stages():
+    tracker = Latency_Tracker(samples=8, trace_count=4)
+    for seq in range(1, 11):
+        start = 100.0 + seq
+        tracker.trace(make_snapshot(seq, start), rendered=start + 0.013)
+        tracker.serialized(seq, start + 0.014)
+        # A second serialization of the same frame is not counted again
+        tracker.serialized(seq, start + 0.5)
+        assert tracker.report(seq, start + 0.015, start + 0.031)
+
+    quantiles = tracker.quantiles()
+    expected = {'decode': 1, 'publish': 10, 'render': 2, 'serialize': 1, 'deliver': 1, 'paint': 16, 'total': 31}
+    for stage, milliseconds in expected.items():
+        p50, p95, p99, count = quantiles[stage]
+        assert count == 10
+        assert abs(p50 - milliseconds / 1e3) < 1e-6 and abs(p99 - milliseconds / 1e3) < 1e-6
+
+    # Only the newest traces are kept, a late report of an old frame is ignored
+    assert not tracker.report(1, 0.0, 0.0)
+    tracker.clear()
+    assert tracker.quantiles()['total'] is None
+
+
+def test_replay_and_samples():
+    # Recorded timestamps are days old, the stages that start at them are left out
+    tracker = Latency_Tracker(replay=True)
+    snapshot = make_snapshot(1, 5000.0)
+    snapshot['timestamp'] = 100.0
+    tracker.trace(snapshot, rendered=5000.013)
+    tracker.serialized(1, 5000.014)
+    assert tracker.report(1, 5000.015, 5000.031)
+    quantiles = tracker.quantiles()
+    assert quantiles['decode'] is None and quantiles['total'] is None
+    assert abs(quantiles['render'][0] - 0.002) < 1e-6 and quantiles['paint'][3] == 1
+
+    # The sample index is masked, any other size would skip slots
+    for samples in (0, 3, 1000):
+        try:
+            Latency_Tracker(samples=samples)
+            raise AssertionError(f"accepted {samples} samples")
+        except ValueError:
+            pass
+    assert Latency_Tracker(samples=1).samples == 1
+
+
+if __name__ == '__main__':
+    test_stages()
+    test_replay_and_samples()
+    print("All tests passed")
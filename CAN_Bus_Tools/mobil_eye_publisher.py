@@ -0,0 +1,89 @@
+# Author: Navneet Singh
+# mobil_eye_publisher.py
+# Rate limited hand over of the parser snapshots to the visualizer
+#
+# The parser writes a snapshot into the ring for every completed frame
+# group, hundreds of times per second. The visualizer only needs the latest
+# consistent state at display rate, so the publisher takes the newest
+# snapshot of the ring at a fixed rate (20-60 Hz) and bumps its version only
+# then. Everything downstream (render cache, SSE stream) keys off that
+# version, the snapshots in between are coalesced.
+
+import asyncio
+import logging
+import threading
+import time
+
+LOG = logging.getLogger(__name__)
+
+
+class Snapshot_Publisher:
+    """Publishes the newest snapshot of a Snapshot_Ring at a fixed rate"""
+
+    def __init__(self, snapshot_ring, rate_hz=20.0):
+        """
+        Create the publisher, call run() (asyncio) or start_thread() to start publishing
+
+        Args:
+            snapshot_ring: Snapshot_Ring written by the parser
+            rate_hz: Publish rate, the display rate of the visualizer
+        """
+        self.snapshot_ring = snapshot_ring
+        self.rate_hz = rate_hz
+        self.period = 1.0 / rate_hz
+
+        self.snapshot = None  # Latest published snapshot, a copy that is never modified
+        self.version = 0  # Bumped on every publish
+        self.published = 0
+        self.coalesced = 0  # Snapshots written by the parser but never published
+        self._last_seq = 0
+        # Called without arguments after every publish on the publishing thread, e.g. to collect history
+        self.subscribers = []
+
+    def publish(self):
+        " Publish the newest snapshot of the ring if it changed, returns True if it did"
+        if self.snapshot_ring.count == self._last_seq:
+            return False
+
+        snapshot = self.snapshot_ring.latest()
+        if snapshot is None:
+            return False
+
+        seq = int(snapshot['seq'])
+        if self._last_seq:
+            self.coalesced += max(0, seq - self._last_seq - 1)
+        self._last_seq = seq
+
+        # End of the publish stage of the latency trace
+        snapshot['published'] = time.time()
+        # The snapshot is set before the version, a reader that sees the new
+        # version also sees the new snapshot
+        self.snapshot = snapshot
+        self.version += 1
+        self.published += 1
+        for subscriber in self.subscribers:
+            try:
+                subscriber()
+            except Exception:
+                # The other subscribers and the next publish still run
+                LOG.exception("Publisher subscriber error")
+        return True
+
+    async def run(self):
+        " Publish at the configured rate on the running event loop"
+        next_tick = time.monotonic()
+        while True:
+            self.publish()
+            next_tick += self.period
+            delay = next_tick - time.monotonic()
+            if delay <= 0:
+                # Behind schedule, skip the missed ticks instead of bursting
+                next_tick = time.monotonic()
+                delay = 0
+            await asyncio.sleep(delay)
+
+    def start_thread(self):
+        " Publish from a daemon thread, its subscribers then never block the caller's event loop"
+        thread = threading.Thread(target=lambda: asyncio.run(self.run()), name="snapshot-publisher", daemon=True)
+        thread.start()
+        return thread
@@ -0,0 +1,74 @@
+# Author: Navneet Singh
+# mobil_eye_publisher_unit_test.py
+# Checks the publisher coalesces the ring writes between ticks and survives failing subscribers
+#
+# Usage:
+#   python3 -m pytest mobil_eye_publisher_unit_test.py
+#   python3 mobil_eye_publisher_unit_test.py
+
+import time
+
+import numpy as np
+
+from mobil_eye_publisher import Snapshot_Publisher
+from mobil_eye_structures import SNAPSHOT_DTYPE, Snapshot_Ring
+
+
+def write_snapshots(ring, count):
+    snapshot = np.zeros((), dtype=SNAPSHOT_DTYPE)
+    for _ in range(count):
+        ring.write(snapshot, timestamp=float(ring.count + 1))
+
+
+def test_publish_coalesces():
+    ring = Snapshot_Ring(capacity=16)
+    publisher = Snapshot_Publisher(ring, rate_hz=20.0)
+    published_seqs = []
+    publisher.subscribers.append(lambda: published_seqs.append(int(publisher.snapshot['seq'])))
+
+    # Nothing written, nothing published
+    assert not publisher.publish() and publisher.snapshot is None
+
+    # The parser writes several snapshots per tick, only the newest is published
+    write_snapshots(ring, 5)
+    assert publisher.publish()
+    assert published_seqs == [5] and publisher.version == 1 and publisher.coalesced == 0
+    assert publisher.snapshot['published'] > 0 and ring.latest()['published'] == 0
+
+    # No new seq, no publish and no subscriber call
+    assert not publisher.publish()
+    assert published_seqs == [5] and publisher.version == 1
+
+    write_snapshots(ring, 3)
+    assert publisher.publish() and not publisher.publish()
+    assert published_seqs == [5, 8] and publisher.version == 2 and publisher.published == 2
+    # Seqs 6 and 7 were never published
+    assert publisher.coalesced == 2
+
+
+def test_failing_subscriber_keeps_publishing():
+    ring = Snapshot_Ring(capacity=16)
+    publisher = Snapshot_Publisher(ring, rate_hz=200.0)
+    published_seqs = []
+
+    def failing_subscriber():
+        raise RuntimeError("subscriber failed")
+
+    # The failing subscriber runs first, the ones after it are still called
+    publisher.subscribers += [failing_subscriber, lambda: published_seqs.append(int(publisher.snapshot['seq']))]
+    thread = publisher.start_thread()
+    for _ in range(3):
+        write_snapshots(ring, 4)
+        deadline = time.monotonic() + 2.0
+        while publisher.snapshot is None or int(publisher.snapshot['seq']) != ring.count:
+            assert time.monotonic() < deadline, "the publisher thread stopped"
+            time.sleep(0.005)
+    assert thread.is_alive()
+    # Once per new seq, in seq order
+    assert published_seqs == sorted(set(published_seqs)) and published_seqs[-1] == 12
+
+
+if __name__ == '__main__':
+    test_publish_coalesces()
+    test_failing_subscriber_keeps_publishing()
+    print("All tests passed")
@@ -0,0 +1,89 @@
+# Author: Navneet Singh
+# mobil_eye_render_cache.py
+# Versioned render cache shared by every callback and client of the visualizer
+#
+# The data version is bumped only when the parser publishes a snapshot,
+# i.e. when a complete frame group landed. Every kind of output (lane figure,
+# patch, tables, stream frame) is rendered at most once per version and its
+# serialized JSON is computed at most once as well, no matter how many
+# callbacks or browser tabs ask for it.
+
+import threading
+
+from plotly.io.json import to_json_plotly
+
+
+class Render_Entry:
+    " One rendered output and its lazily serialized JSON"
+    __slots__ = ('version', 'value', '_json')
+
+    def __init__(self, version, value):
+        self.version = version
+        self.value = value
+        self._json = None
+
+    @property
+    def json(self):
+        if self._json is None:
+            self._json = to_json_plotly(self.value)
+        return self._json
+
+
+class Render_Cache:
+    """Latest rendered value per output kind, keyed by data version"""
+
+    def __init__(self):
+        self._entries = {}
+        # One lock per kind, a slow render of one kind does not hold up the others; the shared
+        # lock only guards the lock table and the counters
+        self._locks = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _kind_lock(self, kind):
+        " Lock of an output kind, created on first use"
+        lock = self._locks.get(kind)
+        if lock is None:
+            with self._lock:
+                lock = self._locks.setdefault(kind, threading.Lock())
+        return lock
+
+    def get(self, kind, version, render):
+        """
+        Rendered entry of an output kind for a data version
+
+        Args:
+            kind: Name of the output, e.g. 'lane_plot'
+            version: Function returning the hashable data version, the entry is rendered again when it
+                     changes. It is called under the lock of the kind and before render(), so an entry
+                     never carries a newer version than the data it was rendered from.
+            render: Called without arguments on a miss, returns the value to cache
+
+        Returns:
+            Render_Entry shared by every caller of the same kind and version
+        """
+        with self._kind_lock(kind):
+            version = version()
+            entry = self._entries.get(kind)
+            if entry is not None and entry.version == version:
+                with self._lock:
+                    self.hits += 1
+                return entry
+
+            # Render under the lock of the kind, concurrent callers of the same kind wait for this result
+            with self._lock:
+                self.misses += 1
+            entry = Render_Entry(version, render())
+            self._entries[kind] = entry
+            return entry
+
+    def clear(self):
+        for kind in list(self._entries):
+            with self._kind_lock(kind):
+                self._entries.pop(kind, None)
+
+    @property
+    def hit_ratio(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
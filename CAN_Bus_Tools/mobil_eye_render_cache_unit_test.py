@@ -0,0 +1,98 @@
+# Author: Navneet Singh
+# mobil_eye_render_cache_unit_test.py
+# Checks outputs are rendered once per data version and never cached under a newer version than their data
+#
+# Usage:
+#   python3 -m pytest mobil_eye_render_cache_unit_test.py
+#   python3 mobil_eye_render_cache_unit_test.py
+
+import threading
+import time
+
+from mobil_eye_render_cache import Render_Cache
+
+
+def test_versions():
+    cache = Render_Cache()
+    data = {'version': 1}
+    renders = []
+
+    def render():
+        renders.append(data['version'])
+        return f"rendered {data['version']}"
+
+    def version():
+        return data['version']
+
+    assert cache.get('plot', version, render).value == "rendered 1"
+    assert cache.get('plot', version, render).value == "rendered 1" and renders == [1]
+    assert cache.get('table', version, render).json == '"rendered 1"'
+    data['version'] = 2
+    assert cache.get('plot', version, render).value == "rendered 2"
+    assert (cache.hits, cache.misses) == (1, 3)
+    cache.clear()
+    assert cache.get('plot', version, render).value == "rendered 2" and cache.misses == 4
+
+
+def test_version_read_under_lock():
+    cache = Render_Cache()
+    data = {'version': 1}
+    started = threading.Event()
+
+    def slow_render():
+        started.set()
+        time.sleep(0.05)
+        return data['version']
+
+    thread = threading.Thread(target=lambda: cache.get('plot', lambda: data['version'], slow_render))
+    thread.start()
+    started.wait()
+    # Published while the first render runs, the waiting caller must see the new version
+    data['version'] = 2
+    entry = cache.get('plot', lambda: data['version'], lambda: data['version'])
+    thread.join()
+    assert entry.version == 2 and entry.value == 2
+
+
+def test_kinds_render_concurrently():
+    cache = Render_Cache()
+    started = threading.Event()
+    release = threading.Event()
+
+    def slow_render():
+        started.set()
+        release.wait(5)
+        return "history"
+
+    thread = threading.Thread(target=lambda: cache.get('history', lambda: 1, slow_render))
+    thread.start()
+    started.wait()
+    # Another kind is rendered while the slow one still holds its lock
+    assert cache.get('lane', lambda: 1, lambda: "lane").value == "lane"
+    release.set()
+    thread.join()
+    assert cache.get('history', lambda: 1, slow_render).value == "history" and cache.hits == 1
+
+
+def test_counts_across_kinds():
+    cache = Render_Cache()
+
+    def lookups(kind):
+        for _ in range(2000):
+            cache.get(kind, lambda: 1, lambda: kind)
+
+    # Kinds are looked up in parallel under their own locks, no count is lost
+    threads = [threading.Thread(target=lookups, args=(f"kind {index}",)) for index in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert cache.misses == 8 and cache.hits + cache.misses == 8 * 2000
+
+
+if __name__ == '__main__':
+    test_versions()
+    test_version_read_under_lock()
+    test_kinds_render_concurrently()
+    test_counts_across_kinds()
+    print("All tests passed")
@@ -0,0 +1,104 @@
+# Author: Navneet Singh
+# mobil_eye_shared_ring.py
+# Snapshot_Ring in shared memory, written by the parser process and read by the visualizer process
+#
+# Layout of the shared memory block:
+#   header  64 bytes: uint64 write counter, capacity, record size, magic
+#   records capacity * SNAPSHOT_DTYPE
+#
+# The write counter is the sequence of a seqlock: the parser copies a
+# snapshot into its slot and only then stores the counter, a reader copies
+# a slot and checks afterwards that the counter did not reach the slot again
+# (see Snapshot_Ring.read). Neither side takes a lock, so decoding never
+# waits for the visualizer. Python has no memory barrier, the counter check
+# relies on x86 not reordering stores with stores and loads with loads. On
+# other CPUs (ARM, POWER) a reader could see the new counter before the
+# record, so create() refuses to build the ring there.
+
+import platform
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from mobil_eye_structures import SNAPSHOT_DTYPE, Snapshot_Ring
+
+HEADER_BYTES = 64
+RING_MAGIC = 0x4D45534E4150  # "MESNAP"
+# CPUs with total store order, the only ones the seqlock above is correct on
+ORDERED_MACHINES = ('x86_64', 'amd64', 'i386', 'i486', 'i586', 'i686', 'x86')
+
+
+def has_ordered_stores(machine=None):
+    " True if the CPU keeps stores and loads in program order, as the seqlock requires"
+    return (machine or platform.machine()).lower() in ORDERED_MACHINES
+
+
+class Shared_Snapshot_Ring(Snapshot_Ring):
+    """Snapshot_Ring whose records and write counter live in a multiprocessing.shared_memory block"""
+
+    def __init__(self, block, owner=False, writable=True, choices=None):
+        """
+        Map a shared memory block, use create() or attach() instead of calling this directly
+
+        Args:
+            block: SharedMemory holding the header and the records
+            owner: The block is unlinked by close(), True for the process that created it
+            writable: False maps the header and the records read only
+            choices: field name -> {raw value: name} for the value table fields
+        """
+        header = np.ndarray((HEADER_BYTES // 8,), dtype=np.uint64, buffer=block.buf)
+        if int(header[3]) != RING_MAGIC or int(header[2]) != SNAPSHOT_DTYPE.itemsize:
+            del header  # Lets the caller close the block
+            raise ValueError(f"Shared memory block {block.name} does not hold a snapshot ring of this version")
+        records = np.ndarray((int(header[1]),), dtype=SNAPSHOT_DTYPE, buffer=block.buf, offset=HEADER_BYTES)
+        if not writable:
+            header.flags.writeable = False
+            records.flags.writeable = False
+
+        super().__init__(records=records, header=header[:1], choices=choices)
+        self.block = block
+        self.owner = owner
+        self.writable = writable
+
+    @classmethod
+    def create(cls, capacity=1024, writable=True, choices=None):
+        " Allocate a new ring in a new shared memory block, the caller owns and eventually unlinks it"
+        if not has_ordered_stores():
+            raise RuntimeError(f"The shared snapshot ring needs an x86 CPU, not {platform.machine()}")
+        if capacity < 2:
+            raise ValueError(f"Snapshot ring capacity must be at least 2, not {capacity}")
+        block = shared_memory.SharedMemory(create=True, size=HEADER_BYTES + capacity * SNAPSHOT_DTYPE.itemsize)
+        header = np.ndarray((HEADER_BYTES // 8,), dtype=np.uint64, buffer=block.buf)
+        header[:] = 0
+        header[1:4] = (capacity, SNAPSHOT_DTYPE.itemsize, RING_MAGIC)
+        del header
+        return cls(block, owner=True, writable=writable, choices=choices)
+
+    @classmethod
+    def attach(cls, name, writable=True, choices=None):
+        """
+        Map the ring created by another process
+
+        The attaching process should be started by the creator through
+        multiprocessing, so both share the resource tracker and only the
+        creator's close() removes the block.
+        """
+        block = shared_memory.SharedMemory(name=name)
+        try:
+            return cls(block, owner=False, writable=writable, choices=choices)
+        except ValueError:
+            block.close()
+            raise
+
+    @property
+    def name(self):
+        " Name of the shared memory block, pass it to attach() in the other process"
+        return self.block.name
+
+    def close(self):
+        " Unmap the ring, the owner also removes the block"
+        # The mapping can only be closed once no array points into it
+        self.records = self.header = self._seqs = self._timestamps = self._decoded = None
+        self.block.close()
+        if self.owner:
+            self.block.unlink()
@@ -0,0 +1,67 @@
+# Author: Navneet Singh
+# mobil_eye_shared_ring_unit_test.py
+# Checks that snapshots written through one mapping of the shared ring are read through another
+#
+# Usage:
+#   python3 -m pytest mobil_eye_shared_ring_unit_test.py
+#   python3 mobil_eye_shared_ring_unit_test.py
+
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from mobil_eye_shared_ring import Shared_Snapshot_Ring, has_ordered_stores
+from mobil_eye_structures import SNAPSHOT_DTYPE
+
+
+def test_write_and_read_through_shared_memory():
+    reader = Shared_Snapshot_Ring.create(capacity=4, writable=False)
+    writer = Shared_Snapshot_Ring.attach(reader.name)
+    try:
+        snapshot = np.zeros((), dtype=SNAPSHOT_DTYPE)
+        for index in range(6):
+            snapshot['left_lane']['c0'] = index
+            writer.write(snapshot, 10.0 + index)
+
+        assert reader.count == 6
+        latest = reader.latest()
+        assert (latest['seq'], latest['timestamp'], latest['left_lane']['c0']) == (6, 15.0, 5.0)
+        # The oldest slot is about to be rewritten, the history leaves it out
+        assert reader.history()['seq'].tolist() == [4, 5, 6]
+
+        # The reader maps the ring read only
+        try:
+            reader.write(snapshot, 0.0)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("read only ring accepted a write")
+    finally:
+        writer.close()
+        reader.close()
+
+
+def test_attach_rejects_other_blocks():
+    block = shared_memory.SharedMemory(create=True, size=4096)
+    try:
+        Shared_Snapshot_Ring.attach(block.name)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("attached to a block without a snapshot ring")
+    finally:
+        block.close()
+        block.unlink()
+
+
+def test_ordered_machines():
+    # The seqlock is only correct where stores are not reordered
+    assert has_ordered_stores('x86_64') and has_ordered_stores('AMD64') and has_ordered_stores('i686')
+    assert not has_ordered_stores('aarch64') and not has_ordered_stores('armv7l') and not has_ordered_stores('ppc64le')
+
+
+if __name__ == '__main__':
+    test_write_and_read_through_shared_memory()
+    test_attach_rejects_other_blocks()
+    test_ordered_machines()
+    print("All tests passed")
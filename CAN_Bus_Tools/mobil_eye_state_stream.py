@@ -0,0 +1,131 @@
+# Author: Navneet Singh
+# mobil_eye_state_stream.py
+# Server sent events stream of the live Mobil Eye state
+#
+# One producer thread takes the serialized JSON state frame at display rate
+# and hands the encoded event to every connected client. Each client only
+# receives the already encoded bytes, so the server cost per tick does not
+# grow with the number of open browser tabs. assets/lane_stream.js renders
+# the frames in the browser.
+#
+# Usage:
+#   curl -N http://localhost:8050/stream
+
+import logging
+import queue
+import threading
+import time
+
+from flask import Response
+
+LOG = logging.getLogger(__name__)
+
+# Seconds between comment lines that keep idle connections open through proxies
+KEEPALIVE_INTERVAL = 15.0
+
+
+class Live_State_Stream:
+    """Single producer, fan out to any number of SSE clients"""
+
+    def __init__(self, get_payload, rate_hz=20.0, client_queue_size=4):
+        """
+        Create the stream, the producer starts with the first client and stops after the last one
+
+        Args:
+            get_payload: Returns the serialized JSON state frame, None while there is nothing to show
+            rate_hz: Frames per second published to the clients
+            client_queue_size: Events queued per client, a slow client loses its oldest events
+        """
+        self.get_payload = get_payload
+        self.period = 1.0 / rate_hz
+        self.client_queue_size = client_queue_size
+        self.clients = set()
+        self.published_frames = 0
+        self.dropped_events = 0
+        self._lock = threading.Lock()
+        self._thread = None
+        self._last_event = None
+
+    def subscribe(self):
+        " Register a client, returns its event queue"
+        client = queue.Queue(maxsize=self.client_queue_size)
+        with self._lock:
+            self.clients.add(client)
+            # A new client starts from the latest state instead of waiting for a change
+            if self._last_event is not None:
+                client.put_nowait(self._last_event)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self.run, name="state-stream", daemon=True)
+                self._thread.start()
+        return client
+
+    def unsubscribe(self, client):
+        with self._lock:
+            self.clients.discard(client)
+
+    def publish(self, event):
+        " Hand one encoded event to every client, dropping the oldest event of a full client queue"
+        with self._lock:
+            self._last_event = event
+            clients = list(self.clients)
+        for client in clients:
+            try:
+                client.put_nowait(event)
+            except queue.Full:
+                try:
+                    client.get_nowait()
+                except queue.Empty:
+                    pass
+                self.dropped_events += 1
+                client.put_nowait(event)
+
+    def run(self):
+        " Producer loop, sends each changed frame once to all clients until none is left"
+        last_payload = None
+        next_tick = time.monotonic()
+        while True:
+            with self._lock:
+                # Nothing is rendered without clients, the next subscribe() starts a new producer
+                if not self.clients:
+                    self._thread = None
+                    return
+            try:
+                payload = self.get_payload()
+                if payload is not None:
+                    # The payload is cached per data version, unchanged data is the same object
+                    if payload is not last_payload and payload != last_payload:
+                        last_payload = payload
+                        self.published_frames += 1
+                        self.publish(f"data: {payload}\n\n")
+            except Exception:
+                # The producer keeps running, the next tick tries again
+                LOG.exception("State stream error")
+
+            next_tick += self.period
+            delay = next_tick - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                # Behind schedule, skip the missed ticks instead of bursting
+                next_tick = time.monotonic()
+
+    def events(self):
+        " Generator of the SSE response body of one client"
+        client = self.subscribe()
+        try:
+            yield "retry: 1000\n\n"
+            while True:
+                try:
+                    yield client.get(timeout=KEEPALIVE_INTERVAL)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+        finally:
+            self.unsubscribe(client)
+
+
+def add_stream_route(server, stream, path='/stream'):
+    " Serve the stream from a Flask server, e.g. the server of a Dash app, several streams need several paths"
+    def stream_endpoint():
+        return Response(stream.events(), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    server.add_url_rule(path, path.strip('/').replace('/', '_'), stream_endpoint)
@@ -0,0 +1,46 @@
+# Author: Navneet Singh
+# mobil_eye_state_stream_unit_test.py
+# Checks the stream renders only while clients are connected and restarts with the next client
+#
+# Usage:
+#   python3 -m pytest mobil_eye_state_stream_unit_test.py
+#   python3 mobil_eye_state_stream_unit_test.py
+
+import time
+
+from mobil_eye_state_stream import Live_State_Stream
+
+
+def test_producer_stops_without_clients():
+    payloads = []
+
+    def get_payload():
+        payloads.append(len(payloads))
+        return str(len(payloads))
+
+    stream = Live_State_Stream(get_payload, rate_hz=200.0)
+    client = stream.subscribe()
+    assert client.get(timeout=1.0) == "data: 1\n\n"
+    thread = stream._thread
+
+    # The producer exits after the last client left and nothing is rendered any more
+    stream.unsubscribe(client)
+    thread.join(timeout=1.0)
+    assert not thread.is_alive() and stream._thread is None
+    rendered = len(payloads)
+    time.sleep(0.05)
+    assert len(payloads) == rendered
+
+    # The next client starts a new producer and first gets the last event
+    client = stream.subscribe()
+    assert client.get(timeout=1.0) == f"data: {rendered}\n\n"
+    assert client.get(timeout=1.0) == f"data: {rendered + 1}\n\n"
+    thread = stream._thread
+    stream.unsubscribe(client)
+    thread.join(timeout=1.0)
+    assert not thread.is_alive()
+
+
+if __name__ == '__main__':
+    test_producer_stops_without_clients()
+    print("All tests passed")
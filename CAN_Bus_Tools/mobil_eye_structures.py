@@ -2,39 +2,171 @@
 # mobil_eye_structures.py
 # Data structures for the Mobil Eye CAN Data
 
-from dataclasses import dataclass, field
+from dataclasses import dataclass
 from typing import Dict, List, Optional
+import re
 import time 
 import can
 import cantools 
+import numpy as np
+
+from can_signal_decoder import compile_message_decoder, is_compilable
+
+
+OBSTACLE_COUNT = 10
+
+# Seconds between two decode error reports, the errors in between are only counted
+DECODE_ERROR_INTERVAL = 10.0
+
+# One row per obstacle slot, value table fields (object_class, motion_status) hold the raw DBC value
+OBSTACLE_DTYPE = np.dtype([
+    ('object_class', np.int8),
+    ('longitudinal_distance', np.float64),
+    ('lateral_distance', np.float64),
+    ('absolute_long_velocity', np.float64),
+    ('absolute_lateral_velocity', np.float64),
+    ('id', np.int16),
+    ('motion_status', np.int8),
+    ('object_age', np.int16),
+    ('last_update', np.float64),
+])
+
+
+# Value table fields of an obstacle, object_class and motion_status hold the raw DBC value,
+# the <field>_name properties give the name from the DBC as the fields did before
+OBSTACLE_CHOICE_FIELDS = ('object_class', 'motion_status')
 
 
-@dataclass
 class Obstacle_Data:
-    " Data Structure for the Obstacle Data"
-    object_class: int = 0
-    longitudinal_distance: float = 0.0
-    lateral_distance: float = 0.0
-    absolute_long_velocity: float = 0.0
-    absolute_lateral_velocity: float = 0.0
-    id: int = 0
-    motion_status: str = ""
-    object_age: int = 0
-    last_update: float = 0.0
+    " View of one obstacle slot in an Obstacle_Data_List, reads and writes go to the slot row"
+    __slots__ = ('_columns', '_choices', '_slot')
+
+    def __init__(self, obstacle_data_list=None, slot=0):
+        if obstacle_data_list is None:
+            obstacle_data_list = Obstacle_Data_List(count=1)
+        self._columns = obstacle_data_list.columns
+        self._choices = obstacle_data_list.choices
+        self._slot = slot
+
+    @property
+    def slot(self):
+        return self._slot
+
+    def __repr__(self):
+        values = []
+        for name in OBSTACLE_DTYPE.names:
+            value = f"{name}={self._columns[name][self._slot].item()!r}"
+            if name in OBSTACLE_CHOICE_FIELDS:
+                value += f" ({getattr(self, name + '_name')})"
+            values.append(value)
+        return f"Obstacle_Data({', '.join(values)})"
+
+
+def _obstacle_field(name):
+    def get(self):
+        return self._columns[name][self._slot].item()
+
+    def set(self, value):
+        self._columns[name][self._slot] = value
+
+    return property(get, set)
+
+
+def _obstacle_choice(name):
+    def get(self):
+        " Value table name of the raw value, the raw value as text when it has no name"
+        value = self._columns[name][self._slot].item()
+        return str(self._choices.get(name, {}).get(value, value)).strip()
+
+    return property(get)
+
+
+for _name in OBSTACLE_DTYPE.names:
+    setattr(Obstacle_Data, _name, _obstacle_field(_name))
+for _name in OBSTACLE_CHOICE_FIELDS:
+    setattr(Obstacle_Data, f"{_name}_name", _obstacle_choice(_name))
+
 
-@dataclass
 class Obstacle_Data_List:
+    " Columnar store of the obstacle slots, one NumPy structured array row per slot"
+    __slots__ = ('data', 'columns', 'choices')
+
+    def __init__(self, data=None, count=OBSTACLE_COUNT, choices=None):
+        self.data = np.zeros(count, dtype=OBSTACLE_DTYPE) if data is None else data
+        # field name -> column view, so writes through a slot view skip the field lookup
+        self.columns = {name: self.data[name] for name in OBSTACLE_DTYPE.names}
+        # field name -> {raw value: name} from the DBC value tables
+        self.choices = {} if choices is None else choices
 
-    object1: Obstacle_Data = field(default_factory=Obstacle_Data)
-    object2: Obstacle_Data = field(default_factory=Obstacle_Data)
-    object3: Obstacle_Data = field(default_factory=Obstacle_Data)
-    object4: Obstacle_Data = field(default_factory=Obstacle_Data)
-    object5: Obstacle_Data = field(default_factory=Obstacle_Data)
-    object6: Obstacle_Data = field(default_factory=Obstacle_Data)
-    object7: Obstacle_Data = field(default_factory=Obstacle_Data)
-    object8: Obstacle_Data = field(default_factory=Obstacle_Data)
-    object9: Obstacle_Data = field(default_factory=Obstacle_Data)
-    object10: Obstacle_Data = field(default_factory=Obstacle_Data)
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, slot):
+        if not -len(self.data) <= slot < len(self.data):
+            raise IndexError(f"Obstacle slot {slot} out of range")
+        return Obstacle_Data(self, slot % len(self.data))
+
+    def __iter__(self):
+        return (Obstacle_Data(self, slot) for slot in range(len(self.data)))
+
+    def __repr__(self):
+        rows = ", ".join(f"{slot}: {self[slot]}" for slot in self.valid_slots())
+        return f"Obstacle_Data_List({rows})"
+
+    def copy(self):
+        return Obstacle_Data_List(self.data.copy(), choices=self.choices)
+
+    def clear(self):
+        self.data[:] = 0
+
+    @property
+    def object_classes(self):
+        return self.columns['object_class']
+
+    @property
+    def longitudinal_distances(self):
+        return self.columns['longitudinal_distance']
+
+    @property
+    def lateral_distances(self):
+        return self.columns['lateral_distance']
+
+    @property
+    def absolute_long_velocities(self):
+        return self.columns['absolute_long_velocity']
+
+    @property
+    def absolute_lateral_velocities(self):
+        return self.columns['absolute_lateral_velocity']
+
+    @property
+    def ids(self):
+        return self.columns['id']
+
+    @property
+    def motion_statuses(self):
+        return self.columns['motion_status']
+
+    @property
+    def object_ages(self):
+        return self.columns['object_age']
+
+    @property
+    def last_updates(self):
+        return self.columns['last_update']
+
+    def valid_mask(self, since=0.0):
+        " Slots updated after the given time, by default every slot that received data"
+        return self.columns['last_update'] > since
+
+    def valid_slots(self, since=0.0):
+        return np.flatnonzero(self.valid_mask(since))
+
+    def choice_names(self, field_name, mask=None):
+        " Value table names of a field for the (masked) slots, the raw value when it has no name"
+        names = self.choices.get(field_name, {})
+        values = self.columns[field_name] if mask is None else self.columns[field_name][mask]
+        return [str(names.get(value, value)).strip() for value in values.tolist()]
 
 @dataclass
 class Left_Lane_Data:
@@ -58,440 +190,419 @@ class Right_Lane_Data:
     LaneMarkModelDerivA_C3_Rh_ME: float = 0.0  # Lane mark model derivative A (C3) in 1/m2
     last_update: float = 0.0
 
-   
+
+@dataclass
+class Lane_Additional_Data:
+    "Data Structure for the neighbouring lane data (ME_Lane_Additional_Data_1..3)"
+    lh_neighbor_type: str = ""  # Type of the lane mark left of the left lane
+    rh_neighbor_type: str = ""  # Type of the lane mark right of the right lane
+    lh_neighbor_lanemark_pos_c0: float = 0.0  # Left neighbour lane mark position C0 in meters
+    rh_neighbor_lanemark_pos_c0: float = 0.0  # Right neighbour lane mark position C0 in meters
+    last_update: float = 0.0
+
+
+# Snapshot ring: the parser writes one snapshot every time a frame group
+# (lane A+B or obstacle A+B+C) is complete, so a snapshot never mixes halves
+# of two different frame groups. The ring is preallocated and written in
+# place; readers copy a record out and check the write counter afterwards to
+# make sure the writer did not lap them, so no lock is needed on either side.
+
+# Lane model of one side, classification and quality hold the raw DBC value
+LANE_DTYPE = np.dtype([
+    ('classification', np.int8),
+    ('quality', np.int8),
+    ('c0', np.float64),  # Lane mark position in meters
+    ('c1', np.float64),  # Lane mark heading angle in radians
+    ('c2', np.float64),  # Lane mark model coefficient A in 1/m
+    ('c3', np.float64),  # Lane mark model derivative A in 1/m2
+    ('last_update', np.float64),
+])
+
+SNAPSHOT_DTYPE = np.dtype([
+    ('seq', np.uint64),  # Write counter value of the snapshot, starts at 1
+    ('timestamp', np.float64),  # CAN timestamp of the frame that completed the group
+    ('decoded', np.float64),  # Wall clock time the group was decoded
+    ('published', np.float64),  # Wall clock time the publisher handed the snapshot on, set on its copy
+    ('left_lane', LANE_DTYPE),
+    ('right_lane', LANE_DTYPE),
+    ('obstacles', OBSTACLE_DTYPE, (OBSTACLE_COUNT,)),
+])
+
+
+class Snapshot_Ring:
+    """Single writer, lock free multi reader ring of SNAPSHOT_DTYPE records"""
+
+    def __init__(self, capacity=1024, records=None, header=None, choices=None):
+        """
+        Create the ring
+
+        Args:
+            capacity: Number of snapshots kept
+            records: Optional preallocated SNAPSHOT_DTYPE array to use as storage
+            header: Optional preallocated uint64[1] array holding the write counter
+            choices: field name -> {raw value: name} for the value table fields
+        """
+        self.records = np.zeros(capacity, dtype=SNAPSHOT_DTYPE) if records is None else records
+        self.header = np.zeros(1, dtype=np.uint64) if header is None else header
+        self.capacity = len(self.records)
+        # The slot the writer rewrites next is never read, one slot alone is never readable
+        if self.capacity < 2:
+            raise ValueError(f"Snapshot ring capacity must be at least 2, not {self.capacity}")
+        self.choices = {} if choices is None else choices
+        self._seqs = self.records['seq']
+        self._timestamps = self.records['timestamp']
+        self._decoded = self.records['decoded']
+
+    @property
+    def count(self):
+        " Number of snapshots written since the ring was created"
+        return int(self.header[0])
+
+    def write(self, snapshot, timestamp, decoded=0.0):
+        " Copy a SNAPSHOT_DTYPE record into the next slot, nothing is allocated"
+        seq = int(self.header[0]) + 1
+        slot = (seq - 1) % self.capacity
+        self.records[slot] = snapshot
+        self._seqs[slot] = seq
+        self._timestamps[slot] = timestamp
+        self._decoded[slot] = decoded
+        # Publish the snapshot only once it is completely written
+        self.header[0] = seq
+
+    def read(self, seq):
+        " Copy of the snapshot with the given seq, None if it is not (or no longer) in the ring"
+        count = self.count
+        if seq < 1 or seq > count:
+            return None
+
+        record = self.records[(seq - 1) % self.capacity].copy()
+        # The slot is rewritten once the writer starts on seq + capacity, while
+        # the counter is still below that the copy is consistent
+        if self.count >= seq + self.capacity - 1 or record['seq'] != seq:
+            return None
+        return record
+
+    def latest(self):
+        " Copy of the newest snapshot, None if nothing was written yet"
+        while True:
+            count = self.count
+            if count == 0:
+                return None
+            record = self.read(count)
+            if record is not None:
+                return record
+
+    def history(self, count=None, since_seq=0):
+        " Copy of the newest snapshots in write order, at most count and only newer than since_seq"
+        end = self.count
+        # The oldest slot is the next one the writer rewrites, leave it out
+        first = max(since_seq + 1, end - self.capacity + 2, 1)
+        if count is not None:
+            first = max(first, end - count + 1)
+        if first > end:
+            return np.zeros(0, dtype=SNAPSHOT_DTYPE)
+
+        seqs = np.arange(first, end + 1, dtype=np.uint64)
+        records = self.records[(seqs - 1) % self.capacity]
+        # Drop the records the writer lapped while they were copied
+        intact = (records['seq'] == seqs) & (seqs >= self.count - self.capacity + 2)
+        return records[intact]
+
+
+def raw_value(value):
+    " Raw DBC value of a value table field, which holds a NamedSignalValue once decoded"
+    return getattr(value, 'value', value) or 0
+
+
+# Decode status of a frame in the flight recorder
+FRAME_DECODED = 0
+FRAME_UNKNOWN = 1
+FRAME_DECODE_ERROR = 2
+
+# Obstacle messages are named Obstacle_Data_<object number>_<frame part>
+OBSTACLE_MESSAGE_PATTERN = re.compile(r'^Obstacle_Data_(\d+)_[ABC]$')
+# Obstacle signals are named <Field_Name>_<object number>_<frame part>
+OBSTACLE_SIGNAL_PATTERN = re.compile(r'^(\w+?)_\d+_[ABC]$')
+
+# Lane message name -> attribute of Process_Mobil_Eye_CAN_Data the message is decoded into
+LANE_MESSAGE_TARGETS = {
+    'ME_Left_Lane_A': 'left_lane_data',
+    'ME_Left_Lane_B': 'left_lane_data',
+    'ME_Right_Lane_A': 'right_lane_data',
+    'ME_Right_Lane_B': 'right_lane_data',
+    'ME_Lane_Additional_Data_1': 'lane_additional_data',
+    'ME_Lane_Additional_Data_2': 'lane_additional_data',
+    'ME_Lane_Additional_Data_3': 'lane_additional_data',
+}
+
+# Lane model coefficients C0..C3 of the lane structures, in LANE_DTYPE order
+LANE_MODEL_FIELDS = {
+    'left_lane_data': ('LaneMarkPosition_C0_Lh_ME', 'LaneMarkHeadingAngle_C1_Lh_ME',
+                       'LaneMarkModelA_C2_Lh_ME', 'LaneMarkModelDerivA_C3_Lh_ME'),
+    'right_lane_data': ('LaneMarkPosition_C0_Rh_ME', 'LaneMarkHeadingAngle_C1_Rh_ME',
+                        'LaneMarkModelA_C2_Rh_ME', 'LaneMarkModelDerivA_C3_Rh_ME'),
+}
+
+# Lane signals whose field name differs from the signal name
+LANE_SIGNAL_FIELDS = {
+    'Classification_Lh_ME': 'classification',
+    'Quality_Lh_ME': 'quality',
+    'Classification_Rh_ME': 'classification',
+    'Quality_Rh_ME': 'quality',
+    'Lh_Neightbor_Type': 'lh_neighbor_type',
+    'Rh_Neightbor_Type': 'rh_neighbor_type',
+    'Lh_Neighbor_LaneMark_Pos_C0': 'lh_neighbor_lanemark_pos_c0',
+    'Rh_Neighbor_LaneMark_Pos_C0': 'rh_neighbor_lanemark_pos_c0',
+}
+
+
+def message_part_index(message_name):
+    " Index of a message in the A/B/C order of its frame group"
+    return ord(message_name[-1]) - ord('A')
+
+
+class Frame_Group:
+    " Messages that together carry one update of a structure (lane A+B, obstacle A+B+C)"
+    __slots__ = ('commit', 'complete_mask', 'received_mask')
+
+    def __init__(self, commit):
+        self.commit = commit  # Copies the structure into the pending snapshot
+        self.complete_mask = 0
+        self.received_mask = 0
+
+    def add_part(self, index):
+        " Register the message at index of the A/B/C order, returns the bit of that message"
+        part = 1 << index
+        self.complete_mask |= part
+        return part
+
+
 class Process_Mobil_Eye_CAN_Data:
     " Class to process the Mobil Eye CAN Data"
-    def __init__(self, database):
-        self.obstacle_data_list = Obstacle_Data_List()
+    def __init__(self, database, snapshot_capacity=1024, metrics=None, snapshot_ring=None):
+        # Value table of the numeric fields, shared by the obstacle store and the snapshot ring
+        self.choices = {}
+        self.obstacle_data_list = Obstacle_Data_List(choices=self.choices)
         self.left_lane_data = Left_Lane_Data()
         self.right_lane_data = Right_Lane_Data()
+        self.lane_additional_data = Lane_Additional_Data()
         self.can_data_base = database
 
-    def parse_mobil_eye_can_data(self, msg, obstacle_data_list):
-        " Process the Mobil Eye CAN Data"
-
-        match msg.arbitration_id:
-            case 568:
-                # Decode the message using cantools database
-                try:
-                    decoded = self.can_data_base.decode_message(msg.arbitration_id, msg.data)
-                    # print("--------------------------------")
-                    # print(decoded)
-                    # print("--------------------------------")
-                    # Update object1 data from the decoded dictionary
-                    self.obstacle_data_list.object1.object_class = decoded['Object_Class_1_A']
-                    self.obstacle_data_list.object1.longitudinal_distance = decoded['Longitudinal_Distance_1_A'] 
-                    self.obstacle_data_list.object1.lateral_distance = decoded['Lateral_Distance_1_A']
-                    self.obstacle_data_list.object1.absolute_long_velocity = decoded['Absolute_Long_Velocity_1_A']
-                    self.obstacle_data_list.object1.absolute_lateral_velocity = decoded['Absolute_Lateral_Velocity_1_A']
-                    self.obstacle_data_list.object1.id = decoded['ID_1_A']
-                    self.obstacle_data_list.object1.last_update = time.time()
-
-                except Exception as e:
-                    print(f"Error decoding message: {e}")
-                
-            case 569:
-                try:
-                    decoded = self.can_data_base.decode_message(msg.arbitration_id, msg.data)
-                    motion_status = decoded['Motion_Status_1_B']
-                    
-                    self.obstacle_data_list.object1.motion_status = motion_status
-                    self.obstacle_data_list.object1.last_update = time.time()
-                    
-                except Exception as e:
-                    print(f"Error decoding motion status message: {e}")
-            
-            case 570:
-                try:
-                    decoded = self.can_data_base.decode_message(msg.arbitration_id, msg.data)
-                    object_age = decoded['Object_Age_1_C']
-                    self.obstacle_data_list.object1.object_age = object_age
-                    self.obstacle_data_list.object1.last_update = time.time()
-                    
-                except Exception as e:
-                    print(f"Error decoding object age message: {e}")
-
-            case 571:
-                # Decode the message using cantools database
-                try:
-                    decoded = self.can_data_base.decode_message(msg.arbitration_id, msg.data)
-                    # Update object1 data from the decoded dictionary
-                    self.obstacle_data_list.object2.object_class = decoded['Object_Class_2_A']
-                    self.obstacle_data_list.object2.longitudinal_distance = decoded['Longitudinal_Distance_2_A'] 
-                    self.obstacle_data_list.object2.lateral_distance = decoded['Lateral_Distance_2_A']
-                    self.obstacle_data_list.object2.absolute_long_velocity = decoded['Absolute_Long_Velocity_2_A']
-                    self.obstacle_data_list.object2.absolute_lateral_velocity = decoded['Absolute_Lateral_Velocity_2_A']
-                    self.obstacle_data_list.object2.id = decoded['ID_2_A']
-                    self.obstacle_data_list.object2.last_update = time.time()
-
-                except Exception as e:
-                    print(f"Error decoding message: {e}")
-                
-            case 572:
-                try:
-                    decoded = self.can_data_base.decode_message(msg.arbitration_id, msg.data)
-                    motion_status = decoded['Motion_Status_2_B']
-                    
-                    self.obstacle_data_list.object2.motion_status = motion_status
-                    self.obstacle_data_list.object2.last_update = time.time()
-                    
-                except Exception as e:
-                    print(f"Error decoding motion status message: {e}")
-            
-            case 573:
-                try:
-                    decoded = self.can_data_base.decode_message(msg.arbitration_id, msg.data)
-                    object_age = decoded['Object_Age_2_C']
-                    self.obstacle_data_list.object2.object_age = object_age
-                    self.obstacle_data_list.object2.last_update = time.time()
-                    
-                except Exception as e:
-                    print(f"Error decoding object age message: {e}")
-
-            case 574:
-                # Decode the message using cantools database
-                try:
-                    decoded = self.can_data_base.decode_message(msg.arbitration_id, msg.data)
-                    # Update object1 data from the decoded dictionary
-                    self.obstacle_data_list.object3.object_class = decoded['Object_Class_3_A']
-                    self.obstacle_data_list.object3.longitudinal_distance = decoded['Longitudinal_Distance_3_A'] 
-                    self.obstacle_data_list.object3.lateral_distance = decoded['Lateral_Distance_3_A']
-                    self.obstacle_data_list.object3.absolute_long_velocity = decoded['Absolute_Long_Velocity_3_A']
-                    self.obstacle_data_list.object3.absolute_lateral_velocity = decoded['Absolute_Lateral_Velocity_3_A']
-                    self.obstacle_data_list.object3.id = decoded['ID_3_A']
-                    self.obstacle_data_list.object3.last_update = time.time()
-
-                except Exception as e:
-                    print(f"Error decoding message: {e}")
-                
-            case 575:
-                try:
-                    decoded = self.can_data_base.decode_message(msg.arbitration_id, msg.data)
-                    motion_status = decoded['Motion_Status_3_B']
-                    
-                    self.obstacle_data_list.object3.motion_status = motion_status
-                    self.obstacle_data_list.object3.last_update = time.time()
-                    
-                except Exception as e:
-                    print(f"Error decoding motion status message: {e}")
-            
-            case 576:
-                try:
-                    decoded = self.can_data_base.decode_message(msg.arbitration_id, msg.data)
-                    object_age = decoded['Object_Age_3_C']
-                    self.obstacle_data_list.object3.object_age = object_age
-                    self.obstacle_data_list.object3.last_update = time.time()
-                    
-                except Exception as e:
-                    print(f"Error decoding object age message: {e}")
-
-            case 577:
-                # Decode the message using cantools database
-                try:
-                    decoded = self.can_data_base.decode_message(msg.arbitration_id, msg.data)
-                    # Update object1 data from the decoded dictionary
-                    self.obstacle_data_list.object4.object_class = decoded['Object_Class_4_A']
-                    self.obstacle_data_list.object4.longitudinal_distance = decoded['Longitudinal_Distance_4_A'] 
-                    self.obstacle_data_list.object4.lateral_distance = decoded['Lateral_Distance_4_A']
-                    self.obstacle_data_list.object4.absolute_long_velocity = decoded['Absolute_Long_Velocity_4_A']
-                    self.obstacle_data_list.object4.absolute_lateral_velocity = decoded['Absolute_Lateral_Velocity_4_A']
-                    self.obstacle_data_list.object4.id = decoded['ID_4_A']
-                    self.obstacle_data_list.object4.last_update = time.time()
-
-                except Exception as e:
-                    print(f"Error decoding message: {e}")
-                
-            case 578:
-                try:
-                    decoded = self.can_data_base.decode_message(msg.arbitration_id, msg.data)
-                    motion_status = decoded['Motion_Status_4_B']
-                    
-                    self.obstacle_data_list.object4.motion_status = motion_status
-                    self.obstacle_data_list.object4.last_update = time.time()
-                    
-                except Exception as e:
-                    print(f"Error decoding motion status message: {e}")
-            
-            case 579:
-                try:
-                    decoded = self.can_data_base.decode_message(msg.arbitration_id, msg.data)
-                    object_age = decoded['Object_Age_4_C']
-                    self.obstacle_data_list.object4.object_age = object_age
-                    self.obstacle_data_list.object4.last_update = time.time()
-                    
-                except Exception as e:
-                    print(f"Error decoding object age message: {e}")
-
-            case 580:
-                # Decode the message using cantools database
-                try:
-                    decoded = self.can_data_base.decode_message(msg.arbitration_id, msg.data)
-                    # Update object1 data from the decoded dictionary
-                    self.obstacle_data_list.object5.object_class = decoded['Object_Class_5_A']
-                    self.obstacle_data_list.object5.longitudinal_distance = decoded['Longitudinal_Distance_5_A'] 
-                    self.obstacle_data_list.object5.lateral_distance = decoded['Lateral_Distance_5_A']
-                    self.obstacle_data_list.object5.absolute_long_velocity = decoded['Absolute_Long_Velocity_5_A']
-                    self.obstacle_data_list.object5.absolute_lateral_velocity = decoded['Absolute_Lateral_Velocity_5_A']
-                    self.obstacle_data_list.object5.id = decoded['ID_5_A']
-                    self.obstacle_data_list.object5.last_update = time.time()
-
-                except Exception as e:
-                    print(f"Error decoding message: {e}")
-                
-            case 581:
-                try:
-                    decoded = self.can_data_base.decode_message(msg.arbitration_id, msg.data)
-                    motion_status = decoded['Motion_Status_5_B']
-                    
-                    self.obstacle_data_list.object5.motion_status = motion_status
-                    self.obstacle_data_list.object5.last_update = time.time()
-                    
-                except Exception as e:
-                    print(f"Error decoding motion status message: {e}")
-            
-            case 582:
-                try:
-                    decoded = self.can_data_base.decode_message(msg.arbitration_id, msg.data)
-                    object_age = decoded['Object_Age_5_C']
-                    self.obstacle_data_list.object5.object_age = object_age
-                    self.obstacle_data_list.object5.last_update = time.time()
-                    
-                except Exception as e:
-                    print(f"Error decoding object age message: {e}")
-
-            case 583:
-                # Decode the message using cantools database
-                try:
-                    decoded = self.can_data_base.decode_message(msg.arbitration_id, msg.data)
-                    # Update object1 data from the decoded dictionary
-                    self.obstacle_data_list.object6.object_class = decoded['Object_Class_6_A']
-                    self.obstacle_data_list.object6.longitudinal_distance = decoded['Longitudinal_Distance_6_A'] 
-                    self.obstacle_data_list.object6.lateral_distance = decoded['Lateral_Distance_6_A']
-                    self.obstacle_data_list.object6.absolute_long_velocity = decoded['Absolute_Long_Velocity_6_A']
-                    self.obstacle_data_list.object6.absolute_lateral_velocity = decoded['Absolute_Lateral_Velocity_6_A']
-                    self.obstacle_data_list.object6.id = decoded['ID_6_A']
-                    self.obstacle_data_list.object6.last_update = time.time()
-
-                except Exception as e:
-                    print(f"Error decoding message: {e}")
-                
-            case 584:
-                try:
-                    decoded = self.can_data_base.decode_message(msg.arbitration_id, msg.data)
-                    motion_status = decoded['Motion_Status_6_B']
-                    
-                    self.obstacle_data_list.object6.motion_status = motion_status
-                    self.obstacle_data_list.object6.last_update = time.time()
-                    
-                except Exception as e:
-                    print(f"Error decoding motion status message: {e}")
-            
-            case 585:
-                try:
-                    decoded = self.can_data_base.decode_message(msg.arbitration_id, msg.data)
-                    object_age = decoded['Object_Age_6_C']
-                    self.obstacle_data_list.object6.object_age = object_age
-                    self.obstacle_data_list.object6.last_update = time.time()
-                    
-                except Exception as e:
-                    print(f"Error decoding object age message: {e}")
-
-            case 586:
-                # Decode the message using cantools database
-                try:
-                    decoded = self.can_data_base.decode_message(msg.arbitration_id, msg.data)
-                    # Update object1 data from the decoded dictionary
-                    self.obstacle_data_list.object7.object_class = decoded['Object_Class_7_A']
-                    self.obstacle_data_list.object7.longitudinal_distance = decoded['Longitudinal_Distance_7_A'] 
-                    self.obstacle_data_list.object7.lateral_distance = decoded['Lateral_Distance_7_A']
-                    self.obstacle_data_list.object7.absolute_long_velocity = decoded['Absolute_Long_Velocity_7_A']
-                    self.obstacle_data_list.object7.absolute_lateral_velocity = decoded['Absolute_Lateral_Velocity_7_A']
-                    self.obstacle_data_list.object7.id = decoded['ID_7_A']
-                    self.obstacle_data_list.object7.last_update = time.time()
-
-                except Exception as e:
-                    print(f"Error decoding message: {e}")
-                
-            case 587:
-                try:
-                    decoded = self.can_data_base.decode_message(msg.arbitration_id, msg.data)
-                    motion_status = decoded['Motion_Status_7_B']
-                    
-                    self.obstacle_data_list.object7.motion_status = motion_status
-                    self.obstacle_data_list.object7.last_update = time.time()
-                    
-                except Exception as e:
-                    print(f"Error decoding motion status message: {e}")
-            
-            case 588:
-                try:
-                    decoded = self.can_data_base.decode_message(msg.arbitration_id, msg.data)
-                    object_age = decoded['Object_Age_7_C']
-                    self.obstacle_data_list.object7.object_age = object_age
-                    self.obstacle_data_list.object7.last_update = time.time()
-                    
-                except Exception as e:
-                    print(f"Error decoding object age message: {e}")
-
-            case 589:
-                # Decode the message using cantools database
-                try:
-                    decoded = self.can_data_base.decode_message(msg.arbitration_id, msg.data)
-                    # Update object1 data from the decoded dictionary
-                    self.obstacle_data_list.object8.object_class = decoded['Object_Class_8_A']
-                    self.obstacle_data_list.object8.longitudinal_distance = decoded['Longitudinal_Distance_8_A'] 
-                    self.obstacle_data_list.object8.lateral_distance = decoded['Lateral_Distance_8_A']
-                    self.obstacle_data_list.object8.absolute_long_velocity = decoded['Absolute_Long_Velocity_8_A']
-                    self.obstacle_data_list.object8.absolute_lateral_velocity = decoded['Absolute_Lateral_Velocity_8_A']
-                    self.obstacle_data_list.object8.id = decoded['ID_8_A']
-                    self.obstacle_data_list.object8.last_update = time.time()
-
-                except Exception as e:
-                    print(f"Error decoding message: {e}")
-                
-            case 590:
-                try:
-                    decoded = self.can_data_base.decode_message(msg.arbitration_id, msg.data)
-                    motion_status = decoded['Motion_Status_8_B']
-                    
-                    self.obstacle_data_list.object8.motion_status = motion_status
-                    self.obstacle_data_list.object8.last_update = time.time()
-                    
-                except Exception as e:
-                    print(f"Error decoding motion status message: {e}")
-            
-            case 591:
-                try:
-                    decoded = self.can_data_base.decode_message(msg.arbitration_id, msg.data)
-                    object_age = decoded['Object_Age_8_C']
-                    self.obstacle_data_list.object8.object_age = object_age
-                    self.obstacle_data_list.object8.last_update = time.time()
-                    
-                except Exception as e:
-                    print(f"Error decoding object age message: {e}")
-
-            case 592:
-                # Decode the message using cantools database
-                try:
-                    decoded = self.can_data_base.decode_message(msg.arbitration_id, msg.data)
-                    # Update object1 data from the decoded dictionary
-                    self.obstacle_data_list.object9.object_class = decoded['Object_Class_9_A']
-                    self.obstacle_data_list.object9.longitudinal_distance = decoded['Longitudinal_Distance_9_A'] 
-                    self.obstacle_data_list.object9.lateral_distance = decoded['Lateral_Distance_9_A']
-                    self.obstacle_data_list.object9.absolute_long_velocity = decoded['Absolute_Long_Velocity_9_A']
-                    self.obstacle_data_list.object9.absolute_lateral_velocity = decoded['Absolute_Lateral_Velocity_9_A']
-                    self.obstacle_data_list.object9.id = decoded['ID_9_A']
-                    self.obstacle_data_list.object9.last_update = time.time()
-
-                except Exception as e:
-                    print(f"Error decoding message: {e}")
-                
-            case 593:
-                try:
-                    decoded = self.can_data_base.decode_message(msg.arbitration_id, msg.data)
-                    motion_status = decoded['Motion_Status_9_B']
-                    
-                    self.obstacle_data_list.object9.motion_status = motion_status
-                    self.obstacle_data_list.object9.last_update = time.time()
-                    
-                except Exception as e:
-                    print(f"Error decoding motion status message: {e}")
-            
-            case 594:
-                try:
-                    decoded = self.can_data_base.decode_message(msg.arbitration_id, msg.data)
-                    object_age = decoded['Object_Age_9_C']
-                    self.obstacle_data_list.object9.object_age = object_age
-                    self.obstacle_data_list.object9.last_update = time.time()
-                    
-                except Exception as e:
-                    print(f"Error decoding object age message: {e}")
-
-            case 595:
-                # Decode the message using cantools database
-                try:
-                    decoded = self.can_data_base.decode_message(msg.arbitration_id, msg.data)
-                    # Update object1 data from the decoded dictionary
-                    self.obstacle_data_list.object10.object_class = decoded['Object_Class_10_A']
-                    self.obstacle_data_list.object10.longitudinal_distance = decoded['Longitudinal_Distance_10_A'] 
-                    self.obstacle_data_list.object10.lateral_distance = decoded['Lateral_Distance_10_A']
-                    self.obstacle_data_list.object10.absolute_long_velocity = decoded['Absolute_Long_Velocity_10_A']
-                    self.obstacle_data_list.object10.absolute_lateral_velocity = decoded['Absolute_Lateral_Velocity_10_A']
-                    self.obstacle_data_list.object10.id = decoded['ID_10_A']
-                    self.obstacle_data_list.object10.last_update = time.time()
-
-                except Exception as e:
-                    print(f"Error decoding message: {e}")
-                
-            case 596:
-                try:
-                    decoded = self.can_data_base.decode_message(msg.arbitration_id, msg.data)
-                    motion_status = decoded['Motion_Status_10_B']
-                    
-                    self.obstacle_data_list.object10.motion_status = motion_status
-                    self.obstacle_data_list.object10.last_update = time.time()
-                    
-                except Exception as e:
-                    print(f"Error decoding motion status message: {e}")
-            
-            case 597:
-                try:
-                    decoded = self.can_data_base.decode_message(msg.arbitration_id, msg.data)
-                    object_age = decoded['Object_Age_10_C']
-                    self.obstacle_data_list.object10.object_age = object_age
-                    self.obstacle_data_list.object10.last_update = time.time()
-                    
-                except Exception as e:
-                    print(f"Error decoding object age message: {e}")
-            
-            case 614:
-                try:
-                    # Decode the message using cantools database
-                    decoded = self.can_data_base.decode_message(msg.arbitration_id, msg.data)
-                    self.left_lane_data.classification = decoded['Classification_Lh_ME']
-                    self.left_lane_data.quality = decoded['Quality_Lh_ME']
-                    self.left_lane_data.LaneMarkPosition_C0_Lh_ME = decoded['LaneMarkPosition_C0_Lh_ME']
-                    self.left_lane_data.LaneMarkModelA_C2_Lh_ME = decoded['LaneMarkModelA_C2_Lh_ME']
-                    # Update timestamp immediately when first part of left lane data arrives
-                    self.left_lane_data.last_update = time.time()
-                except Exception as e:
-                    print(f"Error decoding message: {e}")
-
-            case 615:
-                try:
-                    # Decode the message using cantools database
-                    decoded = self.can_data_base.decode_message(msg.arbitration_id, msg.data)
-                    self.left_lane_data.LaneMarkHeadingAngle_C1_Lh_ME = decoded['LaneMarkHeadingAngle_C1_Lh_ME']
-                    self.left_lane_data.LaneMarkModelDerivA_C3_Lh_ME = decoded['LaneMarkModelDerivA_C3_Lh_ME']
-                    # Update timestamp when second part of left lane data arrives
-                    self.left_lane_data.last_update = time.time()
-                except Exception as e:
-                    print(f"Error decoding message: {e}")
-
-            case 616:
-                try:
-                    # Decode the message using cantools database
-                    decoded = self.can_data_base.decode_message(msg.arbitration_id, msg.data)
-                    self.right_lane_data.classification = decoded['Classification_Rh_ME']
-                    self.right_lane_data.quality = decoded['Quality_Rh_ME']
-                    self.right_lane_data.LaneMarkPosition_C0_Rh_ME = decoded['LaneMarkPosition_C0_Rh_ME']
-                    self.right_lane_data.LaneMarkModelA_C2_Rh_ME = decoded['LaneMarkModelA_C2_Rh_ME']
-                    # Update timestamp immediately when first part of right lane data arrives
-                    self.right_lane_data.last_update = time.time()
-                except Exception as e:
-                    print(f"Error decoding message: {e}")
-
-            case 617:
-                try:
-                    # Decode the message using cantools database
-                    decoded = self.can_data_base.decode_message(msg.arbitration_id, msg.data)
-                    self.right_lane_data.LaneMarkHeadingAngle_C1_Rh_ME = decoded['LaneMarkHeadingAngle_C1_Rh_ME']
-                    self.right_lane_data.LaneMarkModelDerivA_C3_Rh_ME = decoded['LaneMarkModelDerivA_C3_Rh_ME']
-                    # Update timestamp when second part of right lane data arrives
-                    self.right_lane_data.last_update = time.time()
-                except Exception as e:
-                    print(f"Error decoding message: {e}")
-
-            case _:
-                pass
-                # print("Unknown message ID")
\ No newline at end of file
+        # Snapshot being assembled and the ring the completed snapshots are published to
+        self.snapshot = np.zeros((), dtype=SNAPSHOT_DTYPE)
+        # A given ring (e.g. a Shared_Snapshot_Ring read by another process) receives the value tables
+        if snapshot_ring is None:
+            snapshot_ring = Snapshot_Ring(snapshot_capacity)
+        snapshot_ring.choices = self.choices
+        self.snapshot_ring = snapshot_ring
+
+        # arbitration id -> (decode(data, target) function, target structure,
+        #                    ((signal name, field name), ...), Frame_Group or None, part bit)
+        self.dispatch_table = self.build_dispatch_table(database)
+
+        # Optional CAN_Bus_Metrics, records every frame with its decode time
+        self.metrics = metrics
+        # Optional krv_logger Flight_Recorder, keeps the last frames with their decode status
+        self.flight_recorder = None
+        # Optional logging.Logger of the decode errors, an ERROR there also dumps the flight recorder
+        self.logger = None
+        self.decode_errors = 0
+        self._reported_errors = 0
+        self._last_error_report = None
+
+    def build_dispatch_table(self, database):
+        " Build the arbitration id -> handler table from the DBC messages"
+        dispatch_table = {}
+        frame_groups = {}
+        for message in database.messages:
+            target = self.get_message_target(message.name)
+            if target is None:
+                continue
+
+            field_map = []
+            for signal in message.signals:
+                field_name = self.get_signal_field(message.name, signal.name)
+                if hasattr(target, field_name):
+                    field_map.append((signal.name, field_name))
+            field_map = tuple(field_map)
+
+            # The obstacle store is numeric, value table names are kept aside in its choices
+            decode_choices = not isinstance(target, Obstacle_Data)
+            for signal_name, field_name in field_map:
+                choices = message.get_signal_by_name(signal_name).choices
+                if choices:
+                    self.choices.setdefault(field_name, dict(choices))
+
+            if is_compilable(message) and not decode_choices:
+                # Obstacle signals are written straight into the store columns
+                decode = compile_message_decoder(message, field_map, decode_choices,
+                                                 columns=self.obstacle_data_list.columns, row=target.slot)
+            elif is_compilable(message):
+                decode = compile_message_decoder(message, field_map, decode_choices)
+            else:
+                decode = self.make_cantools_decoder(message, field_map, decode_choices)
+
+            # Obstacle views are created per message, group them by slot
+            group_key = target.slot if isinstance(target, Obstacle_Data) else LANE_MESSAGE_TARGETS[message.name]
+            if group_key not in frame_groups:
+                frame_groups[group_key] = self.make_frame_group(message.name, target)
+            group = frame_groups[group_key]
+            part = group.add_part(message_part_index(message.name)) if group is not None else 0
+
+            dispatch_table[message.frame_id] = (decode, target, field_map, group, part)
+
+        return dispatch_table
+
+    def make_frame_group(self, message_name, target):
+        " Frame group of the structure a message is decoded into, None if it is not part of the snapshot"
+        if isinstance(target, Obstacle_Data):
+            slot = target.slot
+            obstacle_rows = self.obstacle_data_list.data
+            snapshot_obstacles = self.snapshot['obstacles']
+
+            def commit():
+                snapshot_obstacles[slot] = obstacle_rows[slot]
+            return Frame_Group(commit)
+
+        target_name = LANE_MESSAGE_TARGETS.get(message_name)
+        if target_name not in LANE_MODEL_FIELDS:
+            return None
+
+        model_fields = LANE_MODEL_FIELDS[target_name]
+        lane_record = self.snapshot['left_lane' if target_name == 'left_lane_data' else 'right_lane']
+
+        def commit():
+            lane_record[()] = (
+                raw_value(target.classification),
+                raw_value(target.quality),
+                *(getattr(target, field_name) for field_name in model_fields),
+                target.last_update,
+            )
+        return Frame_Group(commit)
+
+    @staticmethod
+    def make_cantools_decoder(message, field_map, decode_choices=True):
+        " Fallback decoder for messages the signal compiler does not support"
+        def decode(data, target):
+            decoded = message.decode(data, decode_choices=decode_choices)
+            for signal_name, field_name in field_map:
+                setattr(target, field_name, decoded[signal_name])
+        return decode
+
+    def get_message_target(self, message_name):
+        " Get the data structure a DBC message is decoded into, None if the message is not handled"
+        obstacle_match = OBSTACLE_MESSAGE_PATTERN.match(message_name)
+        if obstacle_match:
+            slot = int(obstacle_match.group(1)) - 1
+            return self.obstacle_data_list[slot] if 0 <= slot < len(self.obstacle_data_list) else None
+
+        if message_name in LANE_MESSAGE_TARGETS:
+            return getattr(self, LANE_MESSAGE_TARGETS[message_name])
+
+        return None
+
+    def get_signal_field(self, message_name, signal_name):
+        " Get the data structure field a DBC signal is stored in"
+        if OBSTACLE_MESSAGE_PATTERN.match(message_name):
+            signal_match = OBSTACLE_SIGNAL_PATTERN.match(signal_name)
+            if signal_match:
+                return signal_match.group(1).lower()
+
+        return LANE_SIGNAL_FIELDS.get(signal_name, signal_name)
+
+    def get_message_names(self):
+        " arbitration id -> DBC message name of the handled messages"
+        return {
+            message.frame_id: message.name
+            for message in self.can_data_base.messages
+            if message.frame_id in self.dispatch_table
+        }
+
+    def get_can_filters(self):
+        " python-can filters for the handled arbitration ids, socketcan installs them in the kernel"
+        return [
+            {
+                'can_id': message.frame_id,
+                'can_mask': 0x1FFFFFFF if message.is_extended_frame else 0x7FF,
+                'extended': message.is_extended_frame,
+            }
+            for message in self.can_data_base.messages
+            if message.frame_id in self.dispatch_table
+        ]
+
+    def parse_mobil_eye_can_data(self, msg):
+        " Process the Mobil Eye CAN Data, returns True if the message was decoded"
+        entry = self.dispatch_table.get(msg.arbitration_id)
+        recorder = self.flight_recorder
+        if entry is None:
+            if self.metrics is not None:
+                self.metrics.unknown_frames += 1
+            if recorder is not None:
+                recorder.record(msg.timestamp, msg.arbitration_id, msg.data, FRAME_UNKNOWN)
+            return False
+
+        metrics = self.metrics
+        if metrics is not None:
+            start = time.perf_counter_ns()
+
+        decode, target, _, group, part = entry
+        try:
+            decode(msg.data, target)
+        except Exception as e:
+            # The structure may be half written, wait for the next cycle of the group
+            if group is not None:
+                group.received_mask = 0
+            # Recorded first, so a dump triggered by the report holds the frame
+            if recorder is not None:
+                recorder.record(msg.timestamp, msg.arbitration_id, msg.data, FRAME_DECODE_ERROR)
+            if metrics is not None:
+                metrics.record(msg.arbitration_id, msg.timestamp, time.perf_counter_ns() - start, error=True)
+            self.report_decode_error(msg, e)
+            return False
+
+        target.last_update = decoded = time.time()
+        if recorder is not None:
+            recorder.record(msg.timestamp, msg.arbitration_id, msg.data, FRAME_DECODED)
+
+        if group is not None:
+            # Part A starts a new cycle, a later part only counts when the parts before it arrived,
+            # so the parts of cycles with lost frames are never published together
+            if part == 1:
+                group.received_mask = part
+            elif group.received_mask == part - 1:
+                group.received_mask |= part
+            else:
+                group.received_mask = 0
+            if group.received_mask == group.complete_mask:
+                # Every frame of the group arrived, publish a consistent snapshot
+                group.received_mask = 0
+                group.commit()
+                self.snapshot_ring.write(self.snapshot, msg.timestamp, decoded)
+
+        if metrics is not None:
+            metrics.record(msg.arbitration_id, msg.timestamp, time.perf_counter_ns() - start)
+        return True
+
+    def report_decode_error(self, msg, error):
+        " Log a decode error, at most one every DECODE_ERROR_INTERVAL seconds with the count in between"
+        self.decode_errors += 1
+        now = time.monotonic()
+        if self._last_error_report is not None and now - self._last_error_report < DECODE_ERROR_INTERVAL:
+            return
+        self._last_error_report = now
+        text = f"Error decoding message {msg.arbitration_id:#x}: {error}"
+        if self.decode_errors - self._reported_errors > 1:
+            text += f" ({self.decode_errors - self._reported_errors - 1} more since the last report)"
+        self._reported_errors = self.decode_errors
+        if self.logger is not None:
+            self.logger.error(text)
+        else:
+            print(text)
+
+    def parse_mobil_eye_can_messages(self, messages):
+        " Process an iterable of CAN messages (bus batch or log reader), returns the number decoded"
+        decoded_count = 0
+        for msg in messages:
+            if self.parse_mobil_eye_can_data(msg):
+                decoded_count += 1
+        return decoded_count
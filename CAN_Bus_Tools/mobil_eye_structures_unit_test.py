@@ -0,0 +1,212 @@
+# Author: Navneet Singh
+# mobil_eye_structures_unit_test.py
+# Checks the columnar obstacle store, the frame groups and the snapshot ring
+#
+# Usage:
+#   python3 -m pytest mobil_eye_structures_unit_test.py
+#   python3 mobil_eye_structures_unit_test.py
+
+import os
+from types import SimpleNamespace
+
+import can
+import cantools
+import numpy as np
+
+from mobil_eye_structures import (DECODE_ERROR_INTERVAL, OBSTACLE_COUNT, SNAPSHOT_DTYPE, Obstacle_Data,
+                                  Obstacle_Data_List, Process_Mobil_Eye_CAN_Data, Snapshot_Ring)
+
+DBC_FILE = os.path.join(os.path.dirname(__file__), 'dbc_files', 'Zendar_Private_CAN.dbc')
+
+
+def make_message(database, name, timestamp=0.0, **signals):
+    " Frame of a DBC message, the signals not given are zero"
+    message = database.get_message_by_name(name)
+    values = {signal.name: 0 for signal in message.signals}
+    values.update(signals)
+    return can.Message(timestamp=timestamp, arbitration_id=message.frame_id, is_extended_id=False,
+                       data=message.encode(values))
+
+
+def test_obstacle_views():
+    obstacles = Obstacle_Data_List(choices={'object_class': {2: ' Car'}})
+    assert len(obstacles) == OBSTACLE_COUNT
+    view = obstacles[3]
+    view.longitudinal_distance = 12.5
+    view.object_class = 2
+    view.last_update = 1.0
+    # Views write straight into the columns
+    assert obstacles.longitudinal_distances[3] == 12.5 and obstacles.data['object_class'][3] == 2
+    assert obstacles[-7].longitudinal_distance == 12.5 and isinstance(view.longitudinal_distance, float)
+    assert obstacles.valid_slots().tolist() == [3]
+    assert obstacles.choice_names('object_class', obstacles.valid_mask()) == ['Car']
+    # The copy owns its data and keeps the value tables
+    copy = obstacles.copy()
+    obstacles.clear()
+    assert copy[3].longitudinal_distance == 12.5 and copy.choices is obstacles.choices
+    assert not obstacles.valid_mask().any()
+    try:
+        obstacles[OBSTACLE_COUNT]
+        raise AssertionError("slot out of range")
+    except IndexError:
+        pass
+    assert Obstacle_Data().slot == 0
+
+
+def test_obstacle_decoding():
+    database = cantools.database.load_file(DBC_FILE)
+    parser = Process_Mobil_Eye_CAN_Data(database)
+    assert parser.parse_mobil_eye_can_data(make_message(
+        database, 'Obstacle_Data_2_A', Longitudinal_Distance_2_A=40.5, Object_Class_2_A=2, Lateral_Distance_2_A=-1.5,
+        ID_2_A=17))
+    assert parser.parse_mobil_eye_can_data(make_message(database, 'Obstacle_Data_2_B', Motion_Status_2_B=3))
+
+    # Value table fields hold the raw int8, the names come from the DBC through choices
+    obstacles = parser.obstacle_data_list
+    assert obstacles.data.dtype['object_class'] == np.int8 and obstacles.data.dtype['motion_status'] == np.int8
+    obstacle = obstacles[1]
+    assert obstacle.object_class == 2 and obstacle.motion_status == 3 and obstacle.id == 17
+    # The names of the value tables next to the raw values
+    assert obstacle.object_class_name == 'Car' and obstacle.motion_status_name == 'Stopped'
+    assert "object_class=2 (Car)" in repr(obstacle) and "motion_status=3 (Stopped)" in repr(obstacle)
+    assert abs(obstacle.longitudinal_distance - 40.5) < 1e-9 and abs(obstacle.lateral_distance + 1.5) < 1e-9
+    assert obstacles.valid_slots().tolist() == [1]
+    assert obstacles.choice_names('object_class', obstacles.valid_mask()) == ['Car']
+    assert obstacles.choice_names('motion_status', obstacles.valid_mask()) == ['Stopped']
+    # A raw value without a name is shown as is
+    obstacles.columns['motion_status'][1] = 7
+    assert obstacles.choice_names('motion_status', obstacles.valid_mask()) == ['7']
+    assert obstacles[1].motion_status_name == '7'
+
+
+def test_frame_groups():
+    database = cantools.database.load_file(DBC_FILE)
+    parser = Process_Mobil_Eye_CAN_Data(database, snapshot_capacity=8)
+    ring = parser.snapshot_ring
+
+    # Lane A+B: nothing is published until both halves of the cycle arrived
+    assert parser.parse_mobil_eye_can_data(make_message(database, 'ME_Left_Lane_A', 1.0, LaneMarkPosition_C0_Lh_ME=1.5))
+    assert ring.count == 0
+    assert parser.parse_mobil_eye_can_data(make_message(database, 'ME_Left_Lane_B', 1.1))
+    assert ring.count == 1
+    snapshot = ring.latest()
+    assert snapshot['seq'] == 1 and snapshot['timestamp'] == 1.1
+    assert abs(snapshot['left_lane']['c0'] - 1.5) < 1e-9 and snapshot['left_lane']['last_update'] > 0
+
+    # The mask starts over after a publish, a repeated half alone publishes nothing
+    assert parser.parse_mobil_eye_can_data(make_message(database, 'ME_Left_Lane_B', 1.2))
+    assert parser.parse_mobil_eye_can_data(make_message(database, 'ME_Left_Lane_B', 1.3))
+    assert ring.count == 1
+    assert parser.parse_mobil_eye_can_data(make_message(database, 'ME_Left_Lane_A', 1.4, LaneMarkPosition_C0_Lh_ME=-2.0))
+    assert ring.count == 1
+    assert parser.parse_mobil_eye_can_data(make_message(database, 'ME_Left_Lane_B', 1.5))
+    assert ring.count == 2 and abs(ring.latest()['left_lane']['c0'] + 2.0) < 1e-9
+
+    # Obstacle A+B+C, the snapshot still holds the old slot until C arrives
+    for msg in (make_message(database, 'Obstacle_Data_4_A', 2.0, Longitudinal_Distance_4_A=30.0),
+                make_message(database, 'Obstacle_Data_4_B', 2.1, Motion_Status_4_B=1)):
+        assert parser.parse_mobil_eye_can_data(msg)
+        assert ring.count == 2 and parser.snapshot['obstacles']['last_update'][3] == 0
+    parser.parse_mobil_eye_can_data(make_message(database, 'Obstacle_Data_4_C', 2.2))
+    assert ring.count == 3
+    obstacles = ring.latest()['obstacles']
+    assert obstacles['longitudinal_distance'][3] == 30.0 and obstacles['motion_status'][3] == 1
+    assert np.flatnonzero(obstacles['last_update']).tolist() == [3]
+    # The lane of the earlier snapshot is carried over
+    assert abs(ring.latest()['left_lane']['c0'] + 2.0) < 1e-9
+
+    # Lane additional data and unknown ids are not part of a group
+    parser.parse_mobil_eye_can_data(make_message(database, 'ME_Lane_Additional_Data_1', 3.0))
+    assert not parser.parse_mobil_eye_can_data(can.Message(arbitration_id=0x7FF, data=bytes(8)))
+    assert ring.count == 3
+
+
+def test_dropped_frames():
+    database = cantools.database.load_file(DBC_FILE)
+    parser = Process_Mobil_Eye_CAN_Data(database, snapshot_capacity=8)
+    ring = parser.snapshot_ring
+
+    # B of cycle 1 (its A was lost) and A of cycle 2 (its B is lost) are never published together
+    parser.parse_mobil_eye_can_data(make_message(database, 'ME_Left_Lane_B', 1.0))
+    parser.parse_mobil_eye_can_data(make_message(database, 'ME_Left_Lane_A', 2.0, LaneMarkPosition_C0_Lh_ME=1.0))
+    assert ring.count == 0
+    parser.parse_mobil_eye_can_data(make_message(database, 'ME_Left_Lane_A', 3.0, LaneMarkPosition_C0_Lh_ME=2.0))
+    parser.parse_mobil_eye_can_data(make_message(database, 'ME_Left_Lane_B', 3.1))
+    assert ring.count == 1
+    assert ring.latest()['timestamp'] == 3.1 and abs(ring.latest()['left_lane']['c0'] - 2.0) < 1e-9
+
+    # Obstacle A+B of one cycle with C lost, then B+C of the next cycle with A lost, or out of order
+    for name in ('Obstacle_Data_1_A', 'Obstacle_Data_1_B', 'Obstacle_Data_1_B', 'Obstacle_Data_1_C',
+                 'Obstacle_Data_1_A', 'Obstacle_Data_1_C', 'Obstacle_Data_1_B'):
+        parser.parse_mobil_eye_can_data(make_message(database, name, 4.0))
+    assert ring.count == 1
+    for name in ('Obstacle_Data_1_A', 'Obstacle_Data_1_B', 'Obstacle_Data_1_C'):
+        parser.parse_mobil_eye_can_data(make_message(database, name, 4.1))
+    assert ring.count == 2
+
+    # A frame that fails to decode drops the cycle it belongs to
+    parser.parse_mobil_eye_can_data(make_message(database, 'ME_Right_Lane_A', 5.0))
+    short_frame = can.Message(arbitration_id=database.get_message_by_name('ME_Right_Lane_B').frame_id, data=bytes(2))
+    parser.logger = SimpleNamespace(error=lambda text: None)
+    assert not parser.parse_mobil_eye_can_data(short_frame)
+    parser.parse_mobil_eye_can_data(make_message(database, 'ME_Right_Lane_B', 5.1))
+    assert ring.count == 2
+
+
+def test_decode_error_reports():
+    database = cantools.database.load_file(DBC_FILE)
+    parser = Process_Mobil_Eye_CAN_Data(database)
+    reports = []
+    parser.logger = SimpleNamespace(error=reports.append)
+    short_frame = can.Message(arbitration_id=database.get_message_by_name('ME_Left_Lane_A').frame_id, data=bytes(2))
+
+    # The first error is reported, the next ones within the interval are only counted
+    for _ in range(5):
+        assert not parser.parse_mobil_eye_can_data(short_frame)
+    assert parser.decode_errors == 5 and len(reports) == 1 and reports[0].startswith("Error decoding message 0x")
+    parser._last_error_report -= DECODE_ERROR_INTERVAL
+    parser.parse_mobil_eye_can_data(short_frame)
+    assert len(reports) == 2 and reports[1].endswith("(4 more since the last report)")
+
+
+def test_ring_laps():
+    # The slot the writer rewrites next is never read, a single slot ring could never be read
+    for capacity in (0, 1):
+        try:
+            Snapshot_Ring(capacity=capacity)
+            raise AssertionError("capacity below 2")
+        except ValueError:
+            pass
+    assert Snapshot_Ring(capacity=2).latest() is None
+
+    ring = Snapshot_Ring(capacity=4)
+    assert ring.latest() is None and ring.read(1) is None and len(ring.history()) == 0
+    snapshot = np.zeros((), dtype=SNAPSHOT_DTYPE)
+    for seq in range(1, 11):
+        ring.write(snapshot, timestamp=float(seq))
+    assert ring.count == 10 and ring.latest()['seq'] == 10
+
+    # Seqs 7..10 are in the slots, 7 is the next one the writer rewrites
+    assert ring.read(6) is None and ring.read(7) is None and ring.read(11) is None and ring.read(0) is None
+    assert [ring.read(seq)['timestamp'] for seq in (8, 9, 10)] == [8.0, 9.0, 10.0]
+    assert ring.history()['seq'].tolist() == [8, 9, 10]
+    assert ring.history(count=2)['seq'].tolist() == [9, 10]
+    assert ring.history(since_seq=9)['seq'].tolist() == [10]
+    assert len(ring.history(since_seq=10)) == 0
+
+    # Once the writer starts on the slot of a seq, readers get nothing rather than a newer snapshot
+    ring.write(snapshot, timestamp=11.0)
+    assert ring.read(8) is None and ring.read(9)['timestamp'] == 9.0
+    ring.write(snapshot, timestamp=12.0)
+    assert ring.records[(8 - 1) % ring.capacity]['seq'] == 12 and ring.read(8) is None
+    assert ring.history()['seq'].tolist() == [10, 11, 12]
+
+
+if __name__ == '__main__':
+    test_obstacle_views()
+    test_obstacle_decoding()
+    test_frame_groups()
+    test_dropped_frames()
+    test_decode_error_reports()
+    test_ring_laps()
+    print("All tests passed")
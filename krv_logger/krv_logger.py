@@ -1,9 +1,439 @@
+import atexit
+import datetime
+import glob
+import gzip
+import json
 import logging
+import logging.handlers
+import os
+import queue
+import shutil
+import struct
+import sys
+import threading
+import time
+
+# Records waiting for the background writer in queue mode
+QUEUE_SIZE = 10000
+
+# File suffix of the compressed segments
+COMPRESSION_SUFFIXES = {None: '', 'gzip': '.gz', 'zstd': '.zst'}
+
+# Flight recorder record: timestamp, arbitration id, dlc, decode status, 8 byte payload
+FLIGHT_RECORD = struct.Struct('<dIBB8s')
+# Dump file header: magic, record size, records in the file, records written since start, reason
+FLIGHT_HEADER = struct.Struct('<8sIIQ40s')
+FLIGHT_MAGIC = b'KRVFLT01'
+
+# Failures of the log machinery itself (compression, flight recorder dumps) go to stderr
+# through their own handler, never to stdout or into the files that failed
+INTERNAL_LOG = logging.getLogger('krv_logger.internal')
+INTERNAL_LOG.propagate = False
+if not INTERNAL_LOG.handlers:
+    _internal_handler = logging.StreamHandler(sys.stderr)
+    _internal_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+    INTERNAL_LOG.addHandler(_internal_handler)
+
+
+class Drop_Oldest_Queue_Handler(logging.handlers.QueueHandler):
+    """QueueHandler on a bounded queue that drops the oldest record when the queue is full"""
+
+    def __init__(self, queue_):
+        super().__init__(queue_)
+        self.dropped_records = 0
+        self._drop_lock = threading.Lock()
+
+    def enqueue(self, record):
+        # Never blocks the logging thread, a stalled disk or console costs old records instead
+        while True:
+            try:
+                self.queue.put_nowait(record)
+                return
+            except queue.Full:
+                with self._drop_lock:
+                    try:
+                        self.queue.get_nowait()
+                        self.dropped_records += 1
+                    except queue.Empty:
+                        pass
+
+
+class Draining_Queue_Listener(logging.handlers.QueueListener):
+    """QueueListener whose stop waits for room in a full queue instead of raising queue.Full"""
+
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)
+
+
+class Rotating_Compressed_File_Handler(logging.handlers.BaseRotatingHandler):
+    """
+    File handler that starts a new file by size and by age and compresses the old ones in the background
+
+    A full file is renamed to <file name>.<rotation time> and reopened, a
+    background thread compresses the segment and then deletes the oldest
+    segments beyond the retention limits, so the writer never waits for the
+    compression.
+    """
+
+    def __init__(self, file_name, max_bytes=0, rotate_interval=0, backup_count=10, max_total_bytes=0,
+                 compression='gzip'):
+        """
+        Args:
+            file_name: Log file, the segments are written next to it
+            max_bytes: Start a new file once the file would exceed this size, 0 for no size limit
+            rotate_interval: Start a new file after this many seconds, 0 for no time limit
+            backup_count: Segments kept, 0 keeps all
+            max_total_bytes: Total size of the segments kept, 0 for no limit
+            compression: 'gzip', 'zstd' (needs the zstandard package) or None
+        """
+        if compression not in COMPRESSION_SUFFIXES:
+            raise ValueError(f"Invalid compression: {compression}")
+        if compression == 'zstd':
+            import zstandard  # noqa: F401, fail now instead of on the first rotation
+        super().__init__(file_name, 'a', encoding=None, delay=False)
+        self.max_bytes = max_bytes
+        self.rotate_interval = rotate_interval
+        self.backup_count = backup_count
+        self.max_total_bytes = max_total_bytes
+        self.compression = compression
+        self.rollover_at = time.time() + rotate_interval if rotate_interval else None
+
+        self._segments = queue.SimpleQueue()  # Renamed files waiting for the compressor, None stops it
+        self._compressor = threading.Thread(target=self._compress_segments, name="log-compressor", daemon=True)
+        self._compressor.start()
+
+    def shouldRollover(self, record):
+        if self.rollover_at is not None and time.time() >= self.rollover_at:
+            return True
+        if self.max_bytes and self.stream is not None:
+            message = f"{self.format(record)}\n"
+            return self.stream.tell() + len(message) > self.max_bytes
+        return False
+
+    def doRollover(self):
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+        if self.rollover_at is not None:
+            self.rollover_at = time.time() + self.rotate_interval
+        # Microseconds keep size rotations within one second apart and the names in time order
+        segment = f"{self.baseFilename}.{datetime.datetime.now().strftime('%Y%m%d-%H%M%S-%f')}"
+        if os.path.exists(self.baseFilename) and os.path.getsize(self.baseFilename):
+            os.rename(self.baseFilename, segment)
+            self._segments.put(segment)
+        self.stream = self._open()
+
+    def segments(self):
+        " Rotated segment files, oldest first"
+        return sorted(glob.glob(f"{glob.escape(self.baseFilename)}.*"))
+
+    def _compress_segments(self):
+        while True:
+            segment = self._segments.get()
+            if segment is None:
+                return
+            try:
+                self._compress(segment)
+            except Exception:
+                INTERNAL_LOG.exception(f"Log segment {segment} could not be compressed, it is kept uncompressed")
+            try:
+                self._enforce_retention()
+            except OSError:
+                INTERNAL_LOG.exception(f"Old segments of {self.baseFilename} could not be removed")
+
+    def _compress(self, segment):
+        " Replace the segment by its compressed copy, on a failure the segment stays and the copy is removed"
+        if self.compression is None:
+            return
+        target = segment + COMPRESSION_SUFFIXES[self.compression]
+        try:
+            with open(segment, 'rb') as source:
+                if self.compression == 'gzip':
+                    with gzip.open(target, 'wb') as destination:
+                        shutil.copyfileobj(source, destination)
+                else:
+                    import zstandard
+                    with open(target, 'wb') as destination:
+                        zstandard.ZstdCompressor().copy_stream(source, destination)
+        except BaseException:
+            if os.path.exists(target):
+                os.remove(target)
+            raise
+        os.remove(segment)
+
+    def _enforce_retention(self):
+        segments = self.segments()
+        if self.backup_count and len(segments) > self.backup_count:
+            for segment in segments[:-self.backup_count]:
+                os.remove(segment)
+            segments = segments[-self.backup_count:]
+        if self.max_total_bytes:
+            sizes = [os.path.getsize(segment) for segment in segments]
+            total = sum(sizes)
+            for segment, size in zip(segments, sizes):
+                if total <= self.max_total_bytes:
+                    break
+                os.remove(segment)
+                total -= size
+
+    def close(self):
+        " Close the file, waits for the segments still being compressed"
+        if self._compressor.is_alive():
+            self._segments.put(None)
+            self._compressor.join(timeout=30)
+        super().close()
+
+
+class State_Log_Formatter(logging.Formatter):
+    """
+    Formats state records as one compact JSON object per line
+
+    {"t": <timestamp>, "stream": <stream>, <field>: <value>, ...}, the JSON is
+    only built here, on the thread that writes the file.
+    """
+
+    def format(self, record):
+        line = {'t': record.state_time, 'stream': record.msg}
+        line.update(record.state)
+        return json.dumps(line, separators=(',', ':'), default=json_value)
+
+
+def json_value(value):
+    " NumPy scalars and arrays as JSON values"
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def is_state_record(record):
+    return hasattr(record, 'state')
+
+
+def is_text_record(record):
+    return not hasattr(record, 'state')
+
+
+def load_state_log(file_names, stream):
+    """
+    Load the records of one stream of a state log into arrays
+
+    Args:
+        file_names: State log file or list of files in time order, gzipped segments included
+        stream: Stream name given to log_state
+
+    Returns:
+        field name -> NumPy array with one element per record, 't' holds the timestamps
+    """
+    import numpy as np
+
+    if isinstance(file_names, (str, os.PathLike)):
+        file_names = [file_names]
+    columns = {}
+    count = 0
+    for file_name in file_names:
+        opener = gzip.open if str(file_name).endswith('.gz') else open
+        with opener(file_name, 'rt') as state_file:
+            for line in state_file:
+                record = json.loads(line)
+                if record.get('stream') != stream:
+                    continue
+                del record['stream']
+                for field, value in record.items():
+                    # A field that first appears in a later record is None before
+                    columns.setdefault(field, [None] * count).append(value)
+                count += 1
+                for values in columns.values():
+                    if len(values) < count:
+                        values.append(None)
+    return {field: np.array(values) for field, values in columns.items()}
+
+
+class Flight_Recorder:
+    """
+    Preallocated ring of the last CAN frames in binary, written to a file only on demand
+
+    record() packs one fixed size record into a bytearray, nothing is
+    formatted or allocated per frame. dump() copies the ring in time order on
+    the calling thread and writes the copy from a background thread (or with
+    wait=True on the calling thread), so an ERROR on the decoding thread
+    captures the frames that led to it. A dump
+    concurrent with record() on another thread can hold one torn record.
+    If state is set, its result is saved next to the dump as <dump>.json.
+    """
+
+    def __init__(self, capacity=65536, directory='.', prefix='flight_recorder', min_dump_interval=10.0,
+                 max_dumps=20):
+        """
+        Args:
+            capacity: Records kept, rounded up to a power of two
+            directory: Directory of the dump files
+            prefix: Dump files are named <prefix>_<time>.bin
+            min_dump_interval: Dumps within this many seconds of the previous one are skipped
+            max_dumps: Dump files kept in the directory, 0 keeps all
+        """
+        self.capacity = 1 << max(capacity - 1, 1).bit_length()
+        self.directory = directory
+        self.prefix = prefix
+        self.min_dump_interval = min_dump_interval
+        self.max_dumps = max_dumps
+        self.buffer = bytearray(self.capacity * FLIGHT_RECORD.size)
+        self.count = 0  # Records written since start
+        self.dumps = 0
+        self.failed_dumps = 0  # Dumps that could not be written
+        self.last_dump = None  # File name of the newest dump
+        self.state = None  # Optional callable returning the decoded state as a JSON serializable dict
+        self._last_dump_time = None
+        self._mask = self.capacity - 1
+        self._pack_into = FLIGHT_RECORD.pack_into
+        self._dump_lock = threading.Lock()
+
+    def record(self, timestamp, arbitration_id, data, status=0):
+        " Store one frame, data holds up to 8 bytes"
+        count = self.count
+        self._pack_into(self.buffer, (count & self._mask) * FLIGHT_RECORD.size,
+                        timestamp, arbitration_id, len(data), status, data)
+        self.count = count + 1
+
+    def snapshot(self):
+        " Records in time order as bytes, oldest first"
+        count = self.count
+        if count < self.capacity:
+            return bytes(self.buffer[:count * FLIGHT_RECORD.size])
+        split = (count & self._mask) * FLIGHT_RECORD.size
+        return bytes(self.buffer[split:]) + bytes(self.buffer[:split])
+
+    def dump(self, reason='trigger', wait=False):
+        """
+        Write the ring to a new file, returns its name or None if the dump was skipped
+
+        The file is written from a background thread, a failure is counted and logged to stderr. With
+        wait=True it is written on the calling thread, which gets the exception of a failure.
+        """
+        with self._dump_lock:
+            now = time.monotonic()
+            if not self.count:
+                return None
+            if self._last_dump_time is not None and now - self._last_dump_time < self.min_dump_interval:
+                return None
+            self._last_dump_time = now
+            count = self.count
+            records = self.snapshot()
+            # Taken on the calling thread together with the frames
+            state = self.state() if self.state is not None else None
+            self.dumps += 1
+            stamp = datetime.datetime.now().strftime('%Y%m%d-%H%M%S-%f')
+            self.last_dump = os.path.join(self.directory, f"{self.prefix}_{stamp}.bin")
+
+        file_name = self.last_dump
+        header = FLIGHT_HEADER.pack(FLIGHT_MAGIC, FLIGHT_RECORD.size, len(records) // FLIGHT_RECORD.size, count,
+                                    reason.encode('utf-8', 'replace')[:FLIGHT_HEADER.size - 24])
+        if wait:
+            self._write_dump(file_name, header, records, state)
+            return file_name
+        # Not a daemon, the dump of an error right before exit is still written
+        writer = threading.Thread(target=self._write_dump_logged, args=(file_name, header, records, state),
+                                  name="flight-recorder-dump")
+        writer.start()
+        return file_name
+
+    def _write_dump_logged(self, file_name, header, records, state):
+        try:
+            self._write_dump(file_name, header, records, state)
+        except Exception:
+            INTERNAL_LOG.exception(f"Flight recorder dump {file_name} could not be written, the recording is lost")
+
+    def _write_dump(self, file_name, header, records, state=None):
+        " Write one dump and its state, counts and raises a failure, no partial file is left"
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(file_name + '.tmp', 'wb') as dump_file:
+                dump_file.write(header)
+                dump_file.write(records)
+            if state is not None:
+                with open(file_name + '.json', 'w') as state_file:
+                    json.dump(state, state_file, separators=(',', ':'))
+            os.replace(file_name + '.tmp', file_name)
+        except Exception:
+            self.failed_dumps += 1
+            for partial in (file_name + '.tmp', file_name + '.json'):
+                if os.path.isfile(partial):
+                    os.remove(partial)
+            raise
+        if self.max_dumps:
+            dumps = sorted(glob.glob(os.path.join(glob.escape(self.directory), f"{glob.escape(self.prefix)}_*.bin")))
+            for old_dump in dumps[:-self.max_dumps]:
+                os.remove(old_dump)
+                if os.path.exists(old_dump + '.json'):
+                    os.remove(old_dump + '.json')
+
+
+class Flight_Recorder_Trigger(logging.Handler):
+    """Dumps a Flight_Recorder on every record of its level, ERROR by default"""
+
+    def __init__(self, flight_recorder, level=logging.ERROR):
+        super().__init__(level)
+        self.flight_recorder = flight_recorder
+
+    def emit(self, record):
+        " Copy the ring on the logging thread, the file is written and a failure reported in the background"
+        try:
+            self.flight_recorder.dump(f"{record.levelname}: {record.getMessage()}")
+        except Exception:
+            # Taking the state or starting the writer failed, nothing was written
+            INTERNAL_LOG.exception(f"Flight recorder dump of '{record.getMessage()}' failed, the recording is lost")
+
+
+def load_flight_recording(file_name):
+    """
+    Read a flight recorder dump
+
+    Returns:
+        (NumPy structured array with the fields timestamp, arbitration_id, dlc,
+        status and data (uint8, 8) oldest first, reason of the dump)
+    """
+    import numpy as np
+
+    dtype = np.dtype([('timestamp', '<f8'), ('arbitration_id', '<u4'), ('dlc', 'u1'), ('status', 'u1'),
+                      ('data', 'u1', (8,))])
+    with open(file_name, 'rb') as dump_file:
+        magic, record_size, records, _, reason = FLIGHT_HEADER.unpack(dump_file.read(FLIGHT_HEADER.size))
+        if magic != FLIGHT_MAGIC or record_size != dtype.itemsize:
+            raise ValueError(f"{file_name} is not a flight recorder dump of this version")
+        return np.fromfile(dump_file, dtype=dtype, count=records), reason.rstrip(b'\0').decode('utf-8')
+
+
+def load_flight_state(file_name):
+    " State saved with a flight recorder dump, None if the recorder had no state"
+    try:
+        with open(file_name + '.json') as state_file:
+            return json.load(state_file)
+    except FileNotFoundError:
+        return None
+
 
 class KRV_Logger:
-    def __init__(self, name: str, file_name: str = None, level: str = "DEBUG"):
-        
-        
+    def __init__(self, name: str, file_name: str = None, level: str = "DEBUG",
+                 use_queue: bool = False, queue_size: int = QUEUE_SIZE, max_bytes: int = 0,
+                 rotate_interval: float = 0, backup_count: int = 10, max_total_bytes: int = 0,
+                 compression: str = 'gzip', state_file: str = None, flight_recorder: int = 0,
+                 flight_recorder_dir: str = '.'):
+        """
+        Args:
+            name: Logger name
+            file_name: Also log to this file if given
+            level: Log level name
+            use_queue: Hand the records to a background thread that owns the console
+                and file handlers, the logging call only formats the message and queues it
+            queue_size: Records waiting for the background thread, the oldest are dropped beyond
+            max_bytes: Rotate the file at this size, 0 for no size rotation
+            rotate_interval: Rotate the file after this many seconds, 0 for no time rotation
+            backup_count: Rotated segments kept, 0 keeps all
+            max_total_bytes: Total size of the rotated segments kept, 0 for no limit
+            compression: Compression of the rotated segments, 'gzip', 'zstd' or None
+            state_file: JSON lines file of the log_state records, rotated like file_name
+            flight_recorder: Frames kept by a Flight_Recorder that is dumped on every ERROR, 0 for none
+            flight_recorder_dir: Directory of the flight recorder dumps
+        """
         self.log_level = logging.INFO
         self.log_numeric_value = getattr(logging, level.upper(), None)
         if not isinstance(self.log_numeric_value, int):
@@ -23,18 +453,122 @@ class KRV_Logger:
         self.ch.setLevel(self.log_level)
         self.ch_formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
         self.ch.setFormatter(self.ch_formatter)
-        self.logger.addHandler(self.ch)
+        handlers = [self.ch]
 
         #FileHandler
+        def make_file_handler(path):
+            if max_bytes or rotate_interval:
+                return Rotating_Compressed_File_Handler(path, max_bytes, rotate_interval, backup_count,
+                                                        max_total_bytes, compression)
+            return logging.FileHandler(path)
+
         if file_name:
-            self.fh = logging.FileHandler(file_name)
+            self.fh = make_file_handler(file_name)
             self.fh.setLevel(self.log_level)
             self.fh.setFormatter(self.ch_formatter)
-            self.logger.addHandler(self.fh)
+            handlers.append(self.fh)
+
+        #State handler, the state records only go to the state file
+        self.sh = None
+        if state_file:
+            self.sh = make_file_handler(state_file)
+            self.sh.setFormatter(State_Log_Formatter())
+            self.sh.addFilter(is_state_record)
+            for handler in handlers:
+                handler.addFilter(is_text_record)
+            handlers.append(self.sh)
+        # (stream, key) -> [last fields, last timestamp, calls] of the log_state policies
+        self._state_streams = {}
+        # Loggers sharing the handlers of this logger, see attach_loggers
+        self._attached_loggers = []
+
+        self.queue_handler = None
+        self.listener = None
+        if use_queue:
+            self.queue_handler = Drop_Oldest_Queue_Handler(queue.Queue(maxsize=queue_size))
+            self.listener = Draining_Queue_Listener(self.queue_handler.queue, *handlers, respect_handler_level=True)
+            self.listener.start()
+            # Write out the queued records at exit
+            atexit.register(self.stop)
+            self.logger.addHandler(self.queue_handler)
+        else:
+            for handler in handlers:
+                self.logger.addHandler(handler)
+
+        # The trigger is not queued, the ring is copied on the thread that logs the error
+        self.flight_recorder = None
+        if flight_recorder:
+            self.flight_recorder = Flight_Recorder(flight_recorder, flight_recorder_dir, prefix=f"{name}.flight")
+            self.logger.addHandler(Flight_Recorder_Trigger(self.flight_recorder))
 
     def get_logger(self):
         return self.logger
-            
-            
 
-        
\ No newline at end of file
+    def attach_loggers(self, *names):
+        " Send the records of other loggers, e.g. the module loggers of a library, to the handlers of this logger"
+        for name in names:
+            logger = logging.getLogger(name)
+            logger.setLevel(self.log_level)
+            for handler in self.logger.handlers:
+                if handler not in logger.handlers:
+                    logger.addHandler(handler)
+            # Not also to the root logger
+            logger.propagate = False
+            if logger not in self._attached_loggers:
+                self._attached_loggers.append(logger)
+
+    def log_state(self, stream, fields, timestamp=None, key=None, changed_only=True, min_interval=0.0,
+                  sample_every=1):
+        """
+        Log a typed state record to the state file
+
+        The fields are kept as values, the JSON line is built by the handler,
+        so a skipped or queued record costs no formatting on the calling thread.
+
+        Args:
+            stream: Name of the record type, e.g. 'left_lane'
+            fields: field name -> number, string or bool, copied values and not live objects
+            timestamp: Time of the state, time.time() by default
+            key: Policies apply per (stream, key), e.g. the slot of an obstacle
+            changed_only: Skip the record if the fields equal the last logged ones
+            min_interval: Skip the record if the last one was logged less than this many seconds before
+            sample_every: Only consider every n-th call
+
+        Returns:
+            True if the record was logged
+        """
+        if self.sh is None:
+            return False
+        timestamp = time.time() if timestamp is None else timestamp
+        policy = self._state_streams.setdefault((stream, key), [None, None, 0])
+        last_fields, last_timestamp, calls = policy
+        policy[2] = calls + 1
+        if calls % sample_every:
+            return False
+        if changed_only and fields == last_fields:
+            return False
+        if min_interval and last_timestamp is not None and timestamp - last_timestamp < min_interval:
+            return False
+        policy[0] = fields
+        policy[1] = timestamp
+        record = self.logger.makeRecord(self.logger.name, logging.INFO, '', 0, stream, None, None,
+                                        extra={'state': fields, 'state_time': timestamp})
+        # Not through the logger, the state file does not depend on the level of the text log
+        (self.queue_handler if self.listener is not None else self.sh).handle(record)
+        return True
+
+    @property
+    def dropped_records(self):
+        " Records dropped because the queue was full, always 0 without use_queue"
+        return self.queue_handler.dropped_records if self.queue_handler is not None else 0
+
+    def stop(self):
+        " Write out the queued records and stop the background thread, nothing to do without use_queue"
+        if self.listener is not None:
+            # Records logged from now on could push the stop marker out of the queue, they are written directly
+            for logger in (self.logger, *self._attached_loggers):
+                logger.removeHandler(self.queue_handler)
+                for handler in self.listener.handlers:
+                    logger.addHandler(handler)
+            self.listener.stop()
+            self.listener = None
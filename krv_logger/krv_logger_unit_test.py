@@ -1,6 +1,18 @@
-from krv_logger import KRV_Logger
+import gzip
+import logging
+import os
+import queue
+import tempfile
+import threading
+import time
 
-log_ = KRV_Logger(name="krv_logger_unit_test", file_name="krv_logger_unit_test.log", level="INFO")
+import krv_logger
+from krv_logger import (Drop_Oldest_Queue_Handler, Flight_Recorder, KRV_Logger, load_flight_recording,
+                        load_flight_state, load_state_log)
+
+# Written to the temp directory, not next to the tests
+log_ = KRV_Logger(name="krv_logger_unit_test", level="INFO",
+                  file_name=os.path.join(tempfile.gettempdir(), "krv_logger_unit_test.log"))
 LOG = log_.get_logger()
 
 LOG.info("This is a test message")
@@ -8,3 +20,236 @@ LOG.debug("This is a debug message")
 LOG.warning("This is a warning message")
 LOG.error("This is an error message")
 LOG.critical("This is a critical message")
+
+
+def test_queue_drops_oldest():
+    # No listener drains the queue, every record beyond its size pushes out the oldest
+    handler = Drop_Oldest_Queue_Handler(queue.Queue(maxsize=4))
+    for index in range(10):
+        handler.emit(logging.LogRecord("test", logging.INFO, __file__, 0, "record %d", (index,), None))
+    assert handler.dropped_records == 6
+    assert [handler.queue.get_nowait().getMessage() for _ in range(4)] == [f"record {index}" for index in range(6, 10)]
+
+
+def test_queue_writer(tmp_path):
+    directory = str(tmp_path)
+    file_name = os.path.join(directory, "queue.log")
+    queue_log = KRV_Logger(name="krv_logger_queue_test", file_name=file_name, level="INFO", use_queue=True)
+    logger = queue_log.get_logger()
+    for index in range(100):
+        logger.info("queued %d", index)
+    logger.debug("below the level")
+    # A module logger attached to the queue logger writes to the same file
+    queue_log.attach_loggers("krv_logger_queue_test_module")
+    logging.getLogger("krv_logger_queue_test_module").warning("from a module")
+    # stop() writes out everything still queued
+    queue_log.stop()
+    with open(file_name) as log_file:
+        lines = log_file.read().splitlines()
+    assert len(lines) == 101 and lines[-2].endswith("queued 99")
+    assert lines[-1].endswith("krv_logger_queue_test_module - WARNING - from a module")
+    assert queue_log.dropped_records == 0
+    # Logging keeps working after the background writer stopped, on the attached loggers too
+    logger.info("after stop")
+    logging.getLogger("krv_logger_queue_test_module").warning("module after stop")
+    queue_log.fh.flush()
+    with open(file_name) as log_file:
+        lines = log_file.read().splitlines()
+    assert lines[-2].endswith("after stop") and lines[-1].endswith("WARNING - module after stop")
+    assert queue_log.queue_handler not in logging.getLogger("krv_logger_queue_test_module").handlers
+
+
+def test_rotation(tmp_path):
+    directory = str(tmp_path)
+    file_name = os.path.join(directory, "rotating.log")
+    rotating_log = KRV_Logger(name="krv_logger_rotation_test", file_name=file_name, level="INFO",
+                              max_bytes=1000, backup_count=3)
+    logger = rotating_log.get_logger()
+    logger.removeHandler(rotating_log.ch)
+    for index in range(200):
+        logger.info("rotated %03d", index)
+    assert os.path.getsize(file_name) <= 1000
+    # close() waits for the compressor
+    rotating_log.fh.close()
+    segments = rotating_log.fh.segments()
+    assert len(segments) == 3 and all(segment.endswith(".gz") for segment in segments)
+
+    # The newest segments are kept and hold the records in order
+    lines = []
+    for segment in segments:
+        with gzip.open(segment, 'rt') as compressed:
+            lines += compressed.read().splitlines()
+    with open(file_name) as log_file:
+        lines += log_file.read().splitlines()
+    assert lines[-1].endswith("rotated 199")
+    assert [int(line[-3:]) for line in lines] == list(range(200 - len(lines), 200))
+
+    # Rotation by age
+    timed_name = os.path.join(directory, "timed.log")
+    timed_log = KRV_Logger(name="krv_logger_timed_test", file_name=timed_name, level="INFO",
+                           rotate_interval=0.05, compression=None)
+    timed_log.get_logger().info("first")
+    time.sleep(0.1)
+    timed_log.get_logger().info("second")
+    timed_log.fh.close()
+    assert len(timed_log.fh.segments()) == 1
+    with open(timed_name) as log_file:
+        assert log_file.read().strip().endswith("second")
+
+
+def test_failed_compression_keeps_segment(tmp_path, monkeypatch):
+    directory = str(tmp_path)
+    file_name = os.path.join(directory, "failing.log")
+    failures = []
+    capture = logging.Handler()
+    capture.emit = failures.append
+    krv_logger.INTERNAL_LOG.addHandler(capture)
+
+    def failing_copy(source, destination):
+        raise OSError("disk full")
+
+    failing_log = KRV_Logger(name="krv_logger_failing_test", file_name=file_name, level="INFO", max_bytes=200)
+    failing_log.get_logger().removeHandler(failing_log.ch)
+    monkeypatch.setattr(krv_logger.shutil, 'copyfileobj', failing_copy)
+    try:
+        for index in range(10):
+            failing_log.get_logger().info("segment %d", index)
+        failing_log.fh.close()
+    finally:
+        krv_logger.INTERNAL_LOG.removeHandler(capture)
+
+    # The segments stay uncompressed, no partial .gz is left and every failure is reported with its traceback
+    segments = failing_log.fh.segments()
+    assert segments and not any(segment.endswith(".gz") for segment in segments)
+    assert len(failures) == len(segments) and all(record.exc_info for record in failures)
+    assert "kept uncompressed" in failures[0].getMessage()
+
+
+def test_state_log(tmp_path):
+    directory = str(tmp_path)
+    file_name = os.path.join(directory, "text.log")
+    state_name = os.path.join(directory, "state.jsonl")
+    state_log = KRV_Logger(name="krv_logger_state_test", file_name=file_name, level="INFO",
+                           use_queue=True, state_file=state_name)
+    state_log.get_logger().info("text only")
+
+    # Unchanged fields are skipped
+    assert state_log.log_state('lane', {'c0': 1.5, 'quality': 3}, timestamp=10.0)
+    assert not state_log.log_state('lane', {'c0': 1.5, 'quality': 3}, timestamp=10.5)
+    assert state_log.log_state('lane', {'c0': 1.75, 'quality': 2}, timestamp=11.0)
+    # Per key rate limit
+    assert state_log.log_state('obstacle', {'slot': 0, 'distance': 20.0}, timestamp=10.0, key=0, min_interval=1.0)
+    assert not state_log.log_state('obstacle', {'slot': 0, 'distance': 19.0}, timestamp=10.5, key=0, min_interval=1.0)
+    assert state_log.log_state('obstacle', {'slot': 1, 'distance': 40.0}, timestamp=10.5, key=1, min_interval=1.0)
+    # Every other call
+    logged = [state_log.log_state('speed', {'v': index}, timestamp=index, sample_every=2) for index in range(4)]
+    assert logged == [True, False, True, False]
+    state_log.stop()
+
+    lanes = load_state_log(state_name, 'lane')
+    assert lanes['t'].tolist() == [10.0, 11.0] and lanes['c0'].tolist() == [1.5, 1.75]
+    assert lanes['quality'].dtype.kind == 'i'
+    obstacles = load_state_log(state_name, 'obstacle')
+    assert obstacles['slot'].tolist() == [0, 1] and obstacles['distance'].tolist() == [20.0, 40.0]
+    # Text and state records do not mix
+    with open(file_name) as log_file:
+        assert log_file.read().strip().endswith("text only")
+    with open(state_name) as state_file:
+        assert len(state_file.read().splitlines()) == 6
+
+    # The state is written whatever the level of the text log
+    for use_queue in (False, True):
+        quiet_name = os.path.join(directory, f"quiet_{use_queue}.jsonl")
+        quiet_log = KRV_Logger(name=f"krv_logger_quiet_state_test_{use_queue}", level="WARNING",
+                               use_queue=use_queue, state_file=quiet_name)
+        assert quiet_log.log_state('lane', {'c0': 1.5}, timestamp=10.0)
+        quiet_log.stop()
+        quiet_log.sh.flush()
+        assert load_state_log(quiet_name, 'lane')['c0'].tolist() == [1.5]
+
+
+def test_flight_recorder(tmp_path):
+    directory = str(tmp_path)
+    recorder = Flight_Recorder(capacity=8, directory=directory, min_dump_interval=60.0)
+    for index in range(6):
+        recorder.record(100.0 + index, 0x700 + index, bytes([index] * (index % 9)), status=index % 3)
+    # Fewer records than the capacity
+    assert recorder.snapshot() == recorder.buffer[:6 * 22]
+
+    for index in range(6, 20):
+        recorder.record(100.0 + index, 0x700 + index, bytearray([index] * 8), status=index % 3)
+    file_name = recorder.dump("explicit")
+    # Within the minimum interval the next dump is skipped
+    assert recorder.dump("again") is None
+    for thread in threading.enumerate():
+        if thread.name == "flight-recorder-dump":
+            thread.join()
+
+    records, reason = load_flight_recording(file_name)
+    assert reason == "explicit"
+    assert records['timestamp'].tolist() == [100.0 + index for index in range(12, 20)]
+    assert records['arbitration_id'][-1] == 0x713 and records['dlc'][-1] == 8 and records['status'][-1] == 19 % 3
+    assert records['data'][0].tolist() == [12] * 8
+    assert os.listdir(directory) == [os.path.basename(file_name)] and load_flight_state(file_name) is None
+
+    # An ERROR dumps the recorder of the logger
+    recording_log = KRV_Logger(name="krv_logger_flight_test", level="INFO", flight_recorder=4,
+                               flight_recorder_dir=directory)
+    recording_log.get_logger().removeHandler(recording_log.ch)
+    recording_log.flight_recorder.record(1.0, 0x123, b'\x01\x02')
+    recording_log.flight_recorder.state = lambda: {'left_lane': {'c0': 1.5}}
+    recording_log.get_logger().info("no dump")
+    assert recording_log.flight_recorder.dumps == 0
+    recording_log.get_logger().error("decode failed")
+    assert recording_log.flight_recorder.dumps == 1
+    for thread in threading.enumerate():
+        if thread.name == "flight-recorder-dump":
+            thread.join()
+    records, reason = load_flight_recording(recording_log.flight_recorder.last_dump)
+    assert reason == "ERROR: decode failed" and records['data'][0][:2].tolist() == [1, 2]
+    # The state at the error is saved next to the frames
+    assert load_flight_state(recording_log.flight_recorder.last_dump) == {'left_lane': {'c0': 1.5}}
+
+    # A dump that cannot be written raises with wait=True, from the trigger it is reported and counted
+    # by the background writer, the thread that logged the error never touches the disk
+    blocked = os.path.join(directory, "not_a_directory")
+    open(blocked, 'w').close()
+    failing_recorder = Flight_Recorder(capacity=4, directory=blocked)
+    failing_recorder.record(1.0, 0x123, b'\x01')
+    try:
+        failing_recorder.dump("explicit", wait=True)
+        raise AssertionError("the failed dump was not raised")
+    except OSError:
+        pass
+    assert failing_recorder.failed_dumps == 1
+
+    failures = []
+    capture = logging.Handler()
+    capture.emit = failures.append
+    krv_logger.INTERNAL_LOG.addHandler(capture)
+    try:
+        failing_log = KRV_Logger(name="krv_logger_failing_flight_test", level="INFO", flight_recorder=4,
+                                 flight_recorder_dir=blocked)
+        failing_log.get_logger().removeHandler(failing_log.ch)
+        failing_log.flight_recorder.record(1.0, 0x123, b'\x01')
+        failing_log.get_logger().error("decode failed")
+        for thread in threading.enumerate():
+            if thread.name == "flight-recorder-dump":
+                thread.join()
+    finally:
+        krv_logger.INTERNAL_LOG.removeHandler(capture)
+    assert failing_log.flight_recorder.failed_dumps == 1
+    assert len(failures) == 1 and failures[0].exc_info and "recording is lost" in failures[0].getMessage()
+    assert failures[0].threadName == "flight-recorder-dump"
+
+
+if __name__ == '__main__':
+    test_queue_drops_oldest()
+    # pytest passes tmp_path, here every test gets a directory that is removed afterwards
+    for test in (test_queue_writer, test_rotation, test_state_log, test_flight_recorder):
+        with tempfile.TemporaryDirectory() as directory:
+            test(directory)
+    import pytest
+    with tempfile.TemporaryDirectory() as directory, pytest.MonkeyPatch.context() as monkeypatch:
+        test_failed_compression_keeps_segment(directory, monkeypatch)
+    print("All tests passed")